@@ -0,0 +1,455 @@
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from datetime import date, datetime, time, timezone
+from decimal import Context, Decimal, ROUND_HALF_EVEN
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Export formats and the file extension each one is written with
+FORMATS = {"arrow": "arrow", "parquet": "parquet"}
+
+# One typed column of an export
+#   kind: int64, float64, bool, utf8, binary, date32, timestamp, time64 or decimal128
+#   precision, scale: only used by decimal128
+ColumnSpec = namedtuple("ColumnSpec", ["name", "kind", "precision", "scale"])
+
+# decimal128 holds up to 38 digits, the default context rounds to 28
+_DECIMAL_CONTEXT = Context(prec=38)
+
+_EPOCH_DATE = date(1970, 1, 1)
+_EPOCH = datetime(1970, 1, 1)
+
+
+def resolve_format(fmt):
+    """Format that will actually be written for ``fmt``
+
+    Parquet needs pyarrow, without it the export falls back to the pure
+    Python Arrow IPC writer, which pandas reads with ``read_feather``.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {list(FORMATS)}")
+    if fmt == "parquet" and pyarrow is None:
+        return "arrow"
+    return fmt
+
+
+def _kind(type_code, precision):
+    if not isinstance(type_code, type):
+        return "utf8"
+    # bool before int and datetime before date, they are subclasses
+    if issubclass(type_code, bool):
+        return "bool"
+    if issubclass(type_code, int):
+        return "int64"
+    if issubclass(type_code, float):
+        return "float64"
+    if issubclass(type_code, Decimal):
+        return "decimal128" if precision and 0 < precision <= 38 else "float64"
+    if issubclass(type_code, datetime):
+        return "timestamp"
+    if issubclass(type_code, date):
+        return "date32"
+    if issubclass(type_code, time):
+        return "time64"
+    if issubclass(type_code, (bytes, bytearray, memoryview)):
+        return "binary"
+    return "utf8"
+
+
+def column_specs(description):
+    """Column types of a result from its DB-API ``cursor.description``"""
+    specs = []
+    for name, type_code, _, _, precision, scale, *_ in description:
+        kind = _kind(type_code, precision)
+        if kind == "decimal128":
+            specs.append(ColumnSpec(name, kind, precision, scale or 0))
+        else:
+            specs.append(ColumnSpec(name, kind, None, None))
+    return specs
+
+
+def _to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _to_decimal(spec):
+    quantum = Decimal(1).scaleb(-spec.scale)
+    return lambda value: Decimal(value).quantize(quantum, rounding=ROUND_HALF_EVEN, context=_DECIMAL_CONTEXT)
+
+
+def _coercer(spec):
+    """Function turning a fetched value into the Python type of the column"""
+    if spec.kind == "int64":
+        return int
+    if spec.kind == "float64":
+        return float
+    if spec.kind == "bool":
+        return bool
+    if spec.kind == "binary":
+        return bytes
+    if spec.kind == "date32":
+        return _to_date
+    if spec.kind == "decimal128":
+        return _to_decimal(spec)
+    if spec.kind in ("timestamp", "time64"):
+        return lambda value: value
+    return lambda value: value if isinstance(value, str) else str(value)
+
+
+def _columns(rows, specs):
+    """Transpose a batch of rows into coerced columns, None stays None"""
+    columns = []
+    for idx, spec in enumerate(specs):
+        coerce = _coercer(spec)
+        columns.append([None if row[idx] is None else coerce(row[idx]) for row in rows])
+    return columns
+
+
+# ---------------------------------------------------------------------------
+# Pure Python Arrow IPC file writer
+#
+# Only what an export needs: flat columns of the kinds above, no dictionary
+# or compression. The Arrow metadata is a flatbuffer, built by the small
+# front to back serializer below: a table is written with its vtable right
+# before it and its children right after, uoffsets always point forward.
+# ---------------------------------------------------------------------------
+
+_SCALARS = {"bool": ("<?", 1), "B": ("<B", 1), "h": ("<h", 2), "i": ("<i", 4), "q": ("<q", 8)}
+
+
+class _FbTable:
+    def __init__(self, *fields):
+        # (slot, kind, value): kind is a _SCALARS key or "offset" for a child
+        self.fields = fields
+
+
+class _FbString:
+    def __init__(self, value):
+        self.value = value.encode("utf-8")
+
+
+class _FbVector:
+    def __init__(self, items, struct_size=None):
+        # Vector of child offsets, or of packed structs when struct_size is set
+        self.items = items
+        self.struct_size = struct_size
+
+
+class _FbBuilder:
+    def __init__(self):
+        self.buf = bytearray()
+
+    def _pad(self, align, extra=0):
+        self.buf += b"\0" * (-(len(self.buf) + extra) % align)
+
+    def finish(self, root):
+        self.buf += b"\0" * 4
+        struct.pack_into("<I", self.buf, 0, self._write(root))
+        self._pad(8)
+        return bytes(self.buf)
+
+    def _write(self, obj):
+        if isinstance(obj, _FbTable):
+            return self._write_table(obj)
+        if isinstance(obj, _FbString):
+            self._pad(4)
+            pos = len(self.buf)
+            self.buf += struct.pack("<I", len(obj.value)) + obj.value + b"\0"
+            return pos
+        if obj.struct_size is not None:
+            self._pad(8, extra=4)  # elements hold int64s, keep them 8 aligned
+            pos = len(self.buf)
+            self.buf += struct.pack("<I", len(obj.items)) + b"".join(obj.items)
+            return pos
+        self._pad(4)
+        pos = len(self.buf)
+        self.buf += struct.pack("<I", len(obj.items)) + b"\0" * (4 * len(obj.items))
+        for idx, item in enumerate(obj.items):
+            self._patch(pos + 4 + 4 * idx, self._write(item))
+        return pos
+
+    def _patch(self, at, target):
+        struct.pack_into("<I", self.buf, at, target - at)
+
+    def _write_table(self, table):
+        slots = max((slot for slot, _, _ in table.fields), default=-1) + 1
+        self._pad(2)
+        vtable_pos = len(self.buf)
+        self.buf += b"\0" * (4 + 2 * slots)
+        self._pad(4)
+        table_pos = len(self.buf)
+        self.buf += b"\0" * 4
+        field_offsets = [0] * slots
+        children = []
+        for slot, kind, value in table.fields:
+            fmt, size = _SCALARS.get(kind, ("<I", 4))
+            self._pad(size)
+            field_offsets[slot] = len(self.buf) - table_pos
+            if kind == "offset":
+                children.append((len(self.buf), value))
+                self.buf += b"\0" * 4
+            else:
+                self.buf += struct.pack(fmt, value)
+        struct.pack_into(
+            f"<HH{slots}H", self.buf, vtable_pos,
+            4 + 2 * slots, len(self.buf) - table_pos, *field_offsets
+        )
+        struct.pack_into("<i", self.buf, table_pos, table_pos - vtable_pos)
+        for at, child in children:
+            self._patch(at, self._write(child))
+        return table_pos
+
+
+_METADATA_V5 = 4
+_HEADER_SCHEMA = 1
+_HEADER_RECORD_BATCH = 3
+_TIME_UNIT_MICROSECOND = 2
+
+# kind -> (Arrow Type union id, type table)
+_ARROW_TYPES = {
+    "int64": (2, lambda spec: _FbTable((0, "i", 64), (1, "bool", True))),
+    "float64": (3, lambda spec: _FbTable((0, "h", 2))),
+    "binary": (4, lambda spec: _FbTable()),
+    "utf8": (5, lambda spec: _FbTable()),
+    "bool": (6, lambda spec: _FbTable()),
+    "decimal128": (7, lambda spec: _FbTable((0, "i", spec.precision), (1, "i", spec.scale), (2, "i", 128))),
+    "date32": (8, lambda spec: _FbTable((0, "h", 0))),
+    "time64": (9, lambda spec: _FbTable((0, "h", _TIME_UNIT_MICROSECOND), (1, "i", 64))),
+    "timestamp": (10, lambda spec: _FbTable((0, "h", _TIME_UNIT_MICROSECOND))),
+}
+
+
+def _schema_table(specs):
+    fields = []
+    for spec in specs:
+        type_id, type_table = _ARROW_TYPES[spec.kind]
+        fields.append(_FbTable(
+            (0, "offset", _FbString(str(spec.name))),
+            (1, "bool", True),
+            (2, "B", type_id),
+            (3, "offset", type_table(spec)),
+            (5, "offset", _FbVector([])),
+        ))
+    return _FbTable((0, "h", 0), (1, "offset", _FbVector(fields)))
+
+
+def _message(header_type, header, body_length):
+    return _FbBuilder().finish(_FbTable(
+        (0, "h", _METADATA_V5),
+        (1, "B", header_type),
+        (2, "offset", header),
+        (3, "q", body_length),
+    ))
+
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _bitmap(flags):
+    bits = bytearray((len(flags) + 7) // 8)
+    for idx, flag in enumerate(flags):
+        if flag:
+            bits[idx >> 3] |= 1 << (idx & 7)
+    return bytes(bits)
+
+
+def _timestamp_us(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _time_us(value):
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+
+def _column_buffers(spec, values):
+    """Arrow buffers of one column: validity bitmap then data (and offsets)"""
+    null_count = values.count(None)
+    validity = _bitmap([value is not None for value in values]) if null_count else b""
+    present = [value is not None for value in values]
+
+    if spec.kind in ("utf8", "binary"):
+        offsets = array("i", [0])
+        chunks = []
+        end = 0
+        for value in values:
+            if value is not None:
+                chunk = value.encode("utf-8") if spec.kind == "utf8" else value
+                chunks.append(chunk)
+                end += len(chunk)
+            offsets.append(end)
+        return null_count, [validity, _little_endian(offsets), b"".join(chunks)]
+    if spec.kind == "bool":
+        return null_count, [validity, _bitmap([bool(value) for value in values])]
+    if spec.kind == "decimal128":
+        data = b"".join(
+            int(value.scaleb(spec.scale, context=_DECIMAL_CONTEXT)).to_bytes(16, "little", signed=True) if ok else b"\0" * 16
+            for value, ok in zip(values, present)
+        )
+        return null_count, [validity, data]
+
+    if spec.kind == "float64":
+        data = array("d", [value if ok else 0.0 for value, ok in zip(values, present)])
+    elif spec.kind == "date32":
+        data = array("i", [(value - _EPOCH_DATE).days if ok else 0 for value, ok in zip(values, present)])
+    elif spec.kind == "timestamp":
+        data = array("q", [_timestamp_us(value) if ok else 0 for value, ok in zip(values, present)])
+    elif spec.kind == "time64":
+        data = array("q", [_time_us(value) if ok else 0 for value, ok in zip(values, present)])
+    else:
+        data = array("q", [value if ok else 0 for value, ok in zip(values, present)])
+    return null_count, [validity, _little_endian(data)]
+
+
+class ArrowIpcWriter:
+    """Write fetched batches to an Arrow IPC file (Feather v2) without pyarrow
+
+    Every ``write_batch`` call becomes one record batch appended to the
+    file, so only the current batch is held in memory.
+    """
+
+    MAGIC = b"ARROW1"
+
+    def __init__(self, path, description):
+        self.path = path
+        self.specs = column_specs(description)
+        self.rows = 0
+        self._blocks = []
+        self._schema = _schema_table(self.specs)
+        self._file = open(path, "wb")
+        self._file.write(self.MAGIC + b"\0\0")
+        self._write_message(_HEADER_SCHEMA, self._schema, [])
+
+    @property
+    def bytes_written(self):
+        if self._file.closed:
+            return os.path.getsize(self.path)
+        return self._file.tell()
+
+    def _write_message(self, header_type, header, buffers):
+        body_length = sum(len(buf) + (-len(buf) % 8) for buf in buffers)
+        metadata = _message(header_type, header, body_length)
+        offset = self._file.tell()
+        self._file.write(struct.pack("<Ii", 0xFFFFFFFF, len(metadata)) + metadata)
+        for buf in buffers:
+            self._file.write(buf + b"\0" * (-len(buf) % 8))
+        return offset, 8 + len(metadata), body_length
+
+    def write_batch(self, rows):
+        nodes = []
+        buffer_specs = []
+        buffers = []
+        position = 0
+        for spec, values in zip(self.specs, _columns(rows, self.specs)):
+            null_count, column_buffers = _column_buffers(spec, values)
+            nodes.append(struct.pack("<qq", len(values), null_count))
+            for buf in column_buffers:
+                buffer_specs.append(struct.pack("<qq", position, len(buf)))
+                buffers.append(buf)
+                position += len(buf) + (-len(buf) % 8)
+        record_batch = _FbTable(
+            (0, "q", len(rows)),
+            (1, "offset", _FbVector(nodes, struct_size=16)),
+            (2, "offset", _FbVector(buffer_specs, struct_size=16)),
+        )
+        self._blocks.append(self._write_message(_HEADER_RECORD_BATCH, record_batch, buffers))
+        self.rows += len(rows)
+
+    def close(self):
+        if self._file.closed:
+            return
+        # End of stream marker, then the footer that indexes every batch
+        self._file.write(struct.pack("<Ii", 0xFFFFFFFF, 0))
+        footer = _FbBuilder().finish(_FbTable(
+            (0, "h", _METADATA_V5),
+            (1, "offset", self._schema),
+            (2, "offset", _FbVector([], struct_size=24)),
+            (3, "offset", _FbVector([
+                struct.pack("<qi4xq", offset, metadata_length, body_length)
+                for offset, metadata_length, body_length in self._blocks
+            ], struct_size=24)),
+        ))
+        self._file.write(footer + struct.pack("<i", len(footer)) + self.MAGIC)
+        self._file.close()
+
+
+class PyArrowWriter:
+    """Write fetched batches to an Arrow IPC or Parquet file through pyarrow"""
+
+    def __init__(self, path, description, fmt="arrow"):
+        self.path = path
+        self.specs = column_specs(description)
+        self.rows = 0
+        self._schema = pyarrow.schema([
+            pyarrow.field(str(spec.name), self._arrow_type(spec)) for spec in self.specs
+        ])
+        self._sink = pyarrow.OSFile(path, "wb")
+        if fmt == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(self._sink, self._schema)
+        self._parquet = fmt == "parquet"
+
+    @staticmethod
+    def _arrow_type(spec):
+        if spec.kind == "decimal128":
+            return pyarrow.decimal128(spec.precision, spec.scale)
+        if spec.kind in ("timestamp", "time64"):
+            return getattr(pyarrow, spec.kind)("us")
+        return {
+            "int64": pyarrow.int64(),
+            "float64": pyarrow.float64(),
+            "bool": pyarrow.bool_(),
+            "utf8": pyarrow.string(),
+            "binary": pyarrow.binary(),
+            "date32": pyarrow.date32(),
+        }[spec.kind]
+
+    @property
+    def bytes_written(self):
+        if self._sink.closed:
+            return os.path.getsize(self.path)
+        return self._sink.tell()
+
+    def write_batch(self, rows):
+        arrays = [
+            pyarrow.array(values, type=field.type)
+            for values, field in zip(_columns(rows, self.specs), self._schema)
+        ]
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self._schema)
+        if self._parquet:
+            self._writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += len(rows)
+
+    def close(self):
+        if self._sink.closed:
+            return
+        self._writer.close()
+        self._sink.close()
+
+
+def open_columnar_writer(path, description, fmt="arrow"):
+    """Writer for ``fmt``, through pyarrow when it is installed
+
+    See resolve_format for the format actually written.
+    """
+    fmt = resolve_format(fmt)
+    if pyarrow is not None:
+        return PyArrowWriter(path, description, fmt)
+    return ArrowIpcWriter(path, description)
@@ -0,0 +1,263 @@
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+
+
+# Sorts after any character a name can hold, so [prefix, prefix + _HIGH) is
+# exactly the range of keys starting with prefix
+_HIGH = "\U0010ffff"
+
+# Shorter column queries only match by prefix, anything fits one or two letters
+MIN_FUZZY_LENGTH = 3
+
+# Fuzzy tiers rank at most this many times ``limit`` names, in name order
+SCAN_FACTOR = 4
+
+
+class PrefixIndex:
+    """Lower-cased keys with one value each, matched by prefix
+
+    Values keep the order they were given in (columns in table order), a
+    sorted copy of the keys with their positions serves the lookups.
+    ``match`` is two bisects and a sort of the matched positions, so its
+    cost follows the number of matches, not the number of keys. Matching is
+    case insensitive like Sublime's own completion filter.
+    """
+
+    def __init__(self, items):
+        items = list(items)
+        self.values = [value for _, value in items]
+        self.positions = sorted(range(len(items)), key=lambda idx: items[idx][0].lower())
+        self.keys = [items[idx][0].lower() for idx in self.positions]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, prefix=""):
+        if not prefix:
+            return self.values
+        prefix = prefix.lower()
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _HIGH, lo)
+        return [self.values[idx] for idx in sorted(self.positions[lo:hi])]
+
+
+class ColumnSearch:
+    """Fuzzy search over the bare column names of a whole connection group
+
+    The distinct lower-cased names are joined into one newline separated
+    blob, so matching runs in C (str.find, re) instead of a Python loop per
+    name. Matches are ranked in tiers, a later tier is only searched when the
+    earlier ones found fewer than ``limit`` names:
+        prefix       bisect over the sorted names
+        substring    word starts first, then by position
+        subsequence  fewest skipped characters first
+    A fuzzy tier ranks the first ``SCAN_FACTOR * limit`` names it hits, which
+    keeps a keystroke within a few milliseconds whatever the catalog size.
+    ``owners`` maps a column name to the (db, schema, table) tuples of its
+    tables, as returned by Metastore.column_owners.
+    """
+
+    def __init__(self, owners):
+        self.names = sorted(owners, key=str.lower)
+        self.lower = [name.lower() for name in self.names]
+        self.owners = [owners[name] for name in self.names]
+        self._starts = []
+        pos = 0
+        for name in self.lower:
+            self._starts.append(pos)
+            pos += len(name) + 1
+        self._blob = "\n".join(self.lower) + "\n"
+
+    def __len__(self):
+        return len(self.names)
+
+    def _owner(self, pos):
+        """Index of the name the blob offset ``pos`` falls in"""
+        return bisect_right(self._starts, pos) - 1
+
+    def _prefix(self, query, limit):
+        lo = bisect_left(self.lower, query)
+        hi = bisect_left(self.lower, query + _HIGH, lo)
+        return list(range(lo, min(hi, lo + limit)))
+
+    def _scan(self, pattern, found, limit):
+        """(idx, match) for the first names ``pattern`` hits that are not in ``found`` yet"""
+        for match in re.finditer(pattern, self._blob):
+            idx = self._owner(match.start())
+            if idx in found:
+                continue
+            found.add(idx)
+            yield idx, match
+            if len(found) >= SCAN_FACTOR * limit:
+                return
+
+    def _substring(self, query, found, limit):
+        scored = []
+        for idx, match in self._scan(re.escape(query), found, limit):
+            offset = match.start() - self._starts[idx]
+            boundary = self.lower[idx][offset - 1] in "_$#"
+            scored.append((0 if boundary else 1, offset, len(self.lower[idx]), idx))
+        return scored
+
+    def _subsequence(self, query, found, limit):
+        # c[^u\n]*u[^s\n]*s... takes the first occurrence of every next
+        # character, so the regex never backtracks
+        pattern = re.escape(query[0]) + "".join(
+            f"[^{re.escape(ch)}\\n]*{re.escape(ch)}" for ch in query[1:]
+        )
+        return [
+            (match.end() - match.start(), len(self.lower[idx]), idx)
+            for idx, match in self._scan(pattern, found, limit)
+        ]
+
+    def search(self, query, limit=50):
+        """Best ``limit`` (name, owners) matches for ``query``, best first"""
+        query = query.lower()
+        if not query or "\n" in query:
+            return []
+        ids = self._prefix(query, limit)
+        if len(query) >= MIN_FUZZY_LENGTH and len(ids) < limit:
+            found = set(ids)
+            for tier in (self._substring, self._subsequence):
+                scored = tier(query, found, limit)
+                ids += [item[-1] for item in heapq.nsmallest(limit - len(ids), scored)]
+                if len(ids) >= limit:
+                    break
+        return [(self.names[idx], self.owners[idx]) for idx in ids]
+
+
+class CompletionIndex:
+    """Completion tuples of one connection group, indexed by prefix at every depth
+
+    Each node (the database list, the schemas of a database, the tables of a
+    schema, the columns of a table) is turned into a PrefixIndex of ready
+    ``(show, fill)`` tuples the first time it is completed, later keystrokes
+    only bisect it. ``store`` is the group's Metastore.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._nodes = {}
+        self._column_search = None
+
+    def _node(self, key, build):
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = PrefixIndex(build())
+        return node
+
+    def databases(self, prefix=""):
+        return self._node(
+            ("db",),
+            lambda: [(db, (db + "\tdatabase", db)) for db in self.store.databases()],
+        ).match(prefix)
+
+    def schemas(self, db, prefix=""):
+        return self._node(
+            ("schema", db),
+            lambda: [(s, (s + "\tschema", s)) for s in self.store.schemas(db)],
+        ).match(prefix)
+
+    def tables(self, db, schema, prefix=""):
+        return self._node(
+            ("table", db, schema),
+            lambda: [(t, (t + "\ttable", t)) for t in self.store.tables(db, schema)],
+        ).match(prefix)
+
+    def columns(self, db, schema, table, prefix=""):
+        """Select-one-column snippets for the columns of a table"""
+        path = f"{db}.{schema}.{table}"
+
+        def build():
+            return [
+                (col, (f"{path}.{col}\t{dtype}", f"SELECT a.{col}$0 FROM {path} as a;"))
+                for col, dtype in self.store.columns(db, schema, table)
+            ]
+        return self._node(("column", db, schema, table), build).match(prefix)
+
+    def table_snippets(self, db, schema, table):
+        """SELECT *, expanded column list and COUNT(*) snippets, empty if the table is unknown"""
+        key = ("snippet", db, schema, table)
+        snippets = self._nodes.get(key)
+        if snippets is None:
+            cols = self.store.columns(db, schema, table)
+            snippets = []
+            if cols:
+                path = f"{db}.{schema}.{table}"
+                expand_cols = ",".join([f"a.{c}" for c, _ in cols])
+                snippets = [
+                    (f"{path}.*\tall", f"SELECT a.*$0 FROM {path} as a;"),
+                    (f"{path}.-\texpand", f"SELECT $0{expand_cols} FROM {path} as a;"),
+                    (f"{path}.Count(*)\tcnt", f"SELECT $0COUNT(*) FROM {path} as a;"),
+                ]
+            self._nodes[key] = snippets
+        return snippets
+
+    def alias_columns(self, alias, db, schema, table, prefix=""):
+        """``alias.column`` completions for a table referenced under ``alias``"""
+        return self._node(
+            ("alias", alias, db, schema, table),
+            lambda: [
+                (col, (f"{alias}.{col}\t{dtype}", f"{alias}.{col}"))
+                for col, dtype in self.store.columns(db, schema, table)
+            ],
+        ).match(prefix)
+
+    def search_columns(self, query, limit=50):
+        """Bare column completions across every table of the group, best match first
+
+        The annotation names the owning table, a column held by several
+        tables gets one completion per table up to ``limit`` in total.
+        """
+        if self._column_search is None:
+            self._column_search = ColumnSearch(self.store.column_owners())
+        completions = []
+        for name, owners in self._column_search.search(query, limit):
+            for db, schema, table in owners:
+                completions.append((f"{name}\t{db}.{schema}.{table}", name))
+                if len(completions) >= limit:
+                    return completions
+        return completions
+
+
+class StatementIndex:
+    """Semicolon positions of one buffer, kept in sync from its text changes
+
+    Statements are the segments between semicolons, the same split
+    ``view.find_all(";")`` gives. ``apply`` moves the index along with one
+    edit: semicolons inside the replaced range are dropped, the ones after it
+    shifted, the ones in the new text added. Each segment caches what was
+    parsed from it, an edit only clears the segments it touched.
+    """
+
+    def __init__(self, semicolons, size, change_count):
+        self.semicolons = list(semicolons)
+        self.size = size
+        self.change_count = change_count
+        self._parsed = [None] * (len(self.semicolons) + 1)
+
+    def apply(self, a, b, text):
+        """Replace [a, b) of the indexed text with ``text``"""
+        semicolons = self.semicolons
+        lo = bisect_left(semicolons, a)
+        hi = bisect_left(semicolons, b, lo)
+        delta = len(text) - (b - a)
+        inserted = [a + i for i, ch in enumerate(text) if ch == ";"]
+        semicolons[lo:] = inserted + [pos + delta for pos in semicolons[hi:]]
+        self._parsed[lo:hi + 1] = [None] * (len(inserted) + 1)
+        self.size += delta
+
+    def segment(self, pos):
+        """(index, start, end) of the statement holding ``pos``, start is its leading semicolon"""
+        idx = bisect_left(self.semicolons, pos)
+        start = self.semicolons[idx - 1] if idx > 0 else 0
+        end = self.semicolons[idx] if idx < len(self.semicolons) else self.size
+        return idx, start, end
+
+    def parsed(self, idx, build):
+        """What ``build()`` parsed from statement ``idx``, built again only once it was edited"""
+        parsed = self._parsed[idx]
+        if parsed is None:
+            parsed = self._parsed[idx] = build()
+        return parsed
@@ -1,50 +1,347 @@
 import pyodbc
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from util import get_uid_pw, load_settings
 import sublime
 
-class ConnectorODBC:
-    def __init__(self):
-        # First load settings to get current DBMS
-        current_dbms = load_settings(get_cur_dbms_only=True)
-        if not current_dbms:
-            raise ValueError("current_dbms not found in settings")
-        
-        # Get database configuration for current DBMS
-        db_config = load_settings(get_dbms_setting_only=True)
-        if not db_config:
-            raise ValueError(f"Database configuration for '{current_dbms}' not found in settings")
-        
-        self.config = db_config['database_queries']
+
+# Pools shared by every command, keyed by (dbms, connection string)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def build_connection_string():
+    """Resolve the current DBMS, its settings and the filled connection string"""
+    # First load settings to get current DBMS
+    current_dbms = load_settings(get_cur_dbms_only=True)
+    if not current_dbms:
+        raise ValueError("current_dbms not found in settings")
+    
+    # Get database configuration for current DBMS
+    db_config = load_settings(get_dbms_setting_only=True)
+    if not db_config:
+        raise ValueError(f"Database configuration for '{current_dbms}' not found in settings")
+    
+    # Get connection string from config
+    connection_string = db_config.get("connection_string")
+    if not connection_string:
+        raise ValueError(f"Connection string not found in settings for '{current_dbms}'")
+    
+    # Check if connection string has specific format placeholders we need to fill
+    if '{SQL_USERNAME_ENCODED}' in connection_string or '{SQL_PW_ENCODED}' in connection_string:
+        env_var_user = f'{current_dbms.upper()}USERNAMEENCODED'
+        env_var_pw = f'{current_dbms.upper()}PWENCODED'
         
-        # Get connection string from config
-        connection_string = db_config.get("connection_string")
-        if not connection_string:
-            raise ValueError(f"Connection string not found in settings for '{current_dbms}'")
+        if not os.getenv(env_var_user) or not os.getenv(env_var_pw):
+            sublime.error_message(f"Environment variable {env_var_user} or {env_var_pw} not found")
+            raise ValueError(f"Environment variable {env_var_user} or {env_var_pw} not found")
         
-        # Check if connection string has specific format placeholders we need to fill
-        if '{SQL_USERNAME_ENCODED}' in connection_string or '{SQL_PW_ENCODED}' in connection_string:
-            env_var_user = f'{current_dbms.upper()}USERNAMEENCODED'
-            env_var_pw = f'{current_dbms.upper()}PWENCODED'
-            
-            if not os.getenv(env_var_user) or not os.getenv(env_var_pw):
-                sublime.error_message(f"Environment variable {env_var_user} or {env_var_pw} not found")
-                raise ValueError(f"Environment variable {env_var_user} or {env_var_pw} not found")
-            
-            # Get credentials from environment variables
-            user, pw = get_uid_pw(env_var_user, env_var_pw)
-            
-            # Replace only the user and pwd placeholders, preserving driver name curly braces
-            connection_string = connection_string.replace('{SQL_USERNAME_ENCODED}', user).replace('{SQL_PW_ENCODED}', pw)
+        # Get credentials from environment variables
+        user, pw = get_uid_pw(env_var_user, env_var_pw)
         
-        self.conn = pyodbc.connect(connection_string)
+        # Replace only the user and pwd placeholders, preserving driver name curly braces
+        connection_string = connection_string.replace('{SQL_USERNAME_ENCODED}', user).replace('{SQL_PW_ENCODED}', pw)
+
+    return current_dbms, db_config, connection_string
+
+
+class ConnectionPool:
+    """Pool of warm ODBC connections for one DBMS and connection string
+
+    Pool options are read from the optional ``pool`` block of the DBMS setting:
+        min_size: connections kept open even when idle
+        max_size: upper bound of open connections, borrowers wait beyond it
+        idle_timeout: seconds before an idle connection above min_size is closed
+        acquire_timeout: seconds a borrower waits for a free connection
+        health_check_query: query run on borrow to validate a connection
+        health_check_interval: skip the health check if the connection was used
+            more recently than this many seconds
+    """
+
+    def __init__(self, dbms, db_config, connection_string):
+        options = db_config.get("pool", {})
+        self.dbms = dbms
+        self.db_config = db_config
+        self.connection_string = connection_string
+        self.min_size = options.get("min_size", 1)
+        self.max_size = max(options.get("max_size", 4), 1)
+        self.idle_timeout = options.get("idle_timeout", 300)
+        self.acquire_timeout = options.get("acquire_timeout", 30)
+        self.health_check_query = options.get("health_check_query", "SELECT 1")
+        self.health_check_interval = options.get("health_check_interval", 30)
+
+        self._idle = []  # list of (connection, last_used)
+        self._size = 0
+        self._closed = False
+        self._lock = threading.Condition()
+
+    def _connect(self):
+        return pyodbc.connect(self.connection_string)
+
+    def _is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self.health_check_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            print(f"Pooled connection failed health check: {e}")
+            return False
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self):
+        """Close idle connections above min_size that passed idle_timeout, lock held"""
+        now = time.time()
+        keep = []
+        for connection, last_used in self._idle:
+            if self._size > self.min_size and now - last_used > self.idle_timeout:
+                self._close_quietly(connection)
+                self._size -= 1
+            else:
+                keep.append((connection, last_used))
+        self._idle = keep
+
+    def warm(self):
+        """Open connections until min_size connections are available"""
+        with self._lock:
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+        opened = []
+        try:
+            for _ in range(missing):
+                opened.append(self._connect())
+        finally:
+            with self._lock:
+                self._size -= max(missing, 0) - len(opened)
+                self._idle.extend((connection, time.time()) for connection in opened)
+                self._lock.notify_all()
+
+    def acquire(self):
+        """Borrow a healthy connection, opening a new one while under max_size"""
+        deadline = time.time() + self.acquire_timeout
+        while True:
+            with self._lock:
+                self._evict_idle()
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"No free {self.dbms} connection after {self.acquire_timeout} seconds, "
+                            f"all {self.max_size} pooled connections are busy"
+                        )
+                    self._lock.wait(remaining)
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                else:
+                    connection, last_used = None, None
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+
+            if time.time() - last_used < self.health_check_interval or self._is_healthy(connection):
+                return connection
+
+            # Broken connection, drop it and try again
+            self._close_quietly(connection)
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+
+    def release(self, connection, discard=False):
+        """Return a borrowed connection, closing it instead when discard is set"""
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+        with self._lock:
+            if discard or self._closed or getattr(connection, "closed", False):
+                self._close_quietly(connection)
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.time()))
+            self._evict_idle()
+            self._lock.notify()
+
+    def available(self):
+        """Connections that can be borrowed right now without waiting"""
+        with self._lock:
+            return len(self._idle) + self.max_size - self._size
+
+    def close_all(self):
+        """Close idle connections, borrowed ones are closed when they come back"""
+        with self._lock:
+            self._closed = True
+            for connection, _ in self._idle:
+                self._close_quietly(connection)
+                self._size -= 1
+            self._idle = []
+            self._lock.notify_all()
+
+
+def get_pool():
+    """Pool for the current DBMS and connection string, created on first use"""
+    dbms, db_config, connection_string = build_connection_string()
+    key = (dbms, connection_string)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(dbms, db_config, connection_string)
+            _pools[key] = pool
+    return pool
+
+
+def all_pools():
+    """Snapshot of every pool created so far"""
+    with _pools_lock:
+        return list(_pools.values())
+
+
+def close_pools():
+    """Close and forget every pool, e.g. before switching DBMS or restarting"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+class QueryCancelled(Exception):
+    """Raised when a statement is stopped through its CancelToken"""
+
+
+class CancelToken:
+    """Cancellation handle of one running job
+
+    ``cancel`` can be called from any thread. It marks the token and sends
+    SQLCancel through ``cursor.cancel()`` on the cursor currently attached,
+    which makes a blocked execute or fetch in the driver return right away.
+    Fetch loops check ``cancelled`` between batches.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._cursor = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """Sleep up to ``timeout`` seconds, return True as soon as the token is cancelled"""
+        return self._event.wait(timeout)
+
+    def attach(self, cursor):
+        with self._lock:
+            self._cursor = cursor
+
+    def detach(self):
+        with self._lock:
+            self._cursor = None
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            cursor = self._cursor
+        if cursor is None:
+            return
+        try:
+            cursor.cancel()
+        except Exception as e:
+            print(f"Could not cancel database operation: {e}")
+
+
+class ConnectorODBC:
+    def __init__(self, pool=None, connection=None):
+        # Borrow a warm connection from the pool of the current DBMS, unless
+        # one was already borrowed from it, e.g. by the scheduler for a job
+        self.pool = pool if pool is not None else get_pool()
+        self.config = self.pool.db_config['database_queries']
+        self.conn = connection if connection is not None else self.pool.acquire()
         self.cursor = self.conn.cursor()
+        # database -> error of the databases the last metadata crawl skipped
+        self.skipped = {}
         
 
 
-    def execute(self, query):
+    def execute(self, query, token=None):
+        """Execute ``query`` on the connector cursor
+
+        With a ``token`` the statement gets a fresh cursor of its own, attached
+        to the token so it can be cancelled from another thread, and a
+        cancelled statement raises QueryCancelled instead of the driver error.
+        """
         print(query)
-        self.cursor.execute(query)
+        if token is None:
+            self.cursor.execute(query)
+            return
+        if token.cancelled:
+            raise QueryCancelled("Query execution cancelled by user")
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+        self.cursor = self.conn.cursor()
+        token.attach(self.cursor)
+        try:
+            self.cursor.execute(query)
+        except Exception as e:
+            if token.cancelled:
+                raise QueryCancelled("Query execution cancelled by user") from e
+            raise
+
+    def fetch_batches(self, batch_size, token=None):
+        """Yield ``fetchmany(batch_size)`` batches until the result or the token runs out
+
+        Raises QueryCancelled when the token was cancelled, whether between two
+        batches or while the driver was fetching one.
+        """
+        while True:
+            if token is not None and token.cancelled:
+                raise QueryCancelled("Fetch cancelled by user")
+            try:
+                batch = self.cursor.fetchmany(batch_size)
+            except Exception as e:
+                if token is not None and token.cancelled:
+                    raise QueryCancelled("Fetch cancelled by user") from e
+                raise
+            if not batch:
+                return
+            yield batch
+
+    def reset(self):
+        """Drop pending results and roll back, leaving the connection ready for the next statement
+
+        Returns False when the connection did not survive, the caller should
+        then give it back to the pool with discard set.
+        """
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+        try:
+            self.conn.rollback()
+            self.cursor = self.conn.cursor()
+            return True
+        except Exception as e:
+            print(f"Could not reset connection: {e}")
+            return False
 
     def execute_many(self, queries):
         """Execute multiple SQL queries separated by semicolons.
@@ -67,18 +364,32 @@ class ConnectorODBC:
                 print(f"Error executing query: {str(e)}")
         
 
-    def close(self):
-        if not self.conn.closed:
-            self.conn.close()
+    def close(self, discard=False):
+        """Give the connection back to the pool, or close it when discard is set"""
+        if self.conn is None:
+            return
+        try:
+            self.cursor.close()
+        except Exception:
+            discard = True
+        self.pool.release(self.conn, discard=discard)
+        self.conn = None
+
 
 
+    def _parse_meta_results(self, meta, include_dtype=True, into=None):
+        """Helper function to parse metadata results into nested dictionary structure
 
-    def _parse_meta_results(self, meta, include_dtype=True):
-        """Helper function to parse metadata results into nested dictionary structure"""
-        db_schema_tbl_col = {}
-        db_list = []
-        db_schema = {}
-        db_schema_tbl = {}
+        Pass the tuple returned by a previous call as ``into`` to merge more
+        rows into the same structures, e.g. while results stream in per database.
+        """
+        if into is not None:
+            db_list, db_schema, db_schema_tbl, db_schema_tbl_col = into
+        else:
+            db_schema_tbl_col = {}
+            db_list = []
+            db_schema = {}
+            db_schema_tbl = {}
         
         for row in meta:
             db, schema, table, col, dtype = row
@@ -90,8 +401,8 @@ class ConnectorODBC:
             col = col.replace(" ", "").lower() if col else "unknown"
             dtype = dtype.replace(" ", "").lower() if dtype else "unknown"
             
-            # Build db list
-            if db not in db_list:
+            # Build db list, db_schema keeps the same keys and is cheaper to check
+            if db not in db_schema:
                 db_list.append(db)
             
             # Build db_schema mapping - now using nested dictionaries
@@ -124,8 +435,14 @@ class ConnectorODBC:
         
         return  db_list, db_schema, db_schema_tbl, db_schema_tbl_col
     
-    def get_all_accessible_meta(self, include_dtype = True):
-        """Get all accessible metadata using database-specific query from config"""
+    def get_all_accessible_meta(self, include_dtype = True, progress=None):
+        """Get all accessible metadata using database-specific query from config
+
+        For nested configurations (e.g. Snowflake) every database is crawled on
+        its own pooled connection, see ``_crawl_databases``. ``progress`` is
+        called as ``progress(db, done, total, error)`` after each database,
+        the databases that failed are left in ``skipped``.
+        """
         query_config = self.config["get_all_columns"]
         
         # Handle nested query configuration (e.g. for Snowflake)
@@ -140,18 +457,14 @@ class ConnectorODBC:
                 db_list_raw = self.cursor.fetchall()
 
             databases = [row[0] for row in db_list_raw]
-            
-            # Initialize empty results
-            all_meta = []
-            
-            # Query each database
-            for db in databases:
-                db_query = query_config["get_all_columns_under_db"].format(db)
-                self.execute(db_query)
-                db_meta = self.cursor.fetchall()
-                all_meta.extend(db_meta)
-            
-            meta = all_meta
+            result = self._crawl_databases(
+                databases, query_config["get_all_columns_under_db"], include_dtype, progress
+            )
+
+            # Keep databases in the order the DBMS listed them
+            order = {db.replace(" ", "").lower(): idx for idx, db in enumerate(databases)}
+            result[0].sort(key=lambda db: order.get(db, len(order)))
+            return result
         else:
             # Handle simple query configuration (e.g. for SQL Server)
             self.execute(query_config)
@@ -160,6 +473,94 @@ class ConnectorODBC:
         db_list, db_schema, db_schema_tbl, db_schema_tbl_col = self._parse_meta_results(meta, include_dtype)
         return db_list, db_schema, db_schema_tbl, db_schema_tbl_col
 
+    def _crawl_databases(self, databases, query_template, include_dtype=True, progress=None):
+        """Run the per-database column query for every database with bounded concurrency
+
+        Workers borrow their own connection from the pool, so concurrency is
+        capped by ``metadata_crawl.max_workers`` and by the connections the
+        pool has free when the crawl starts. Results are merged into the
+        metadata structures as soon as each database finishes. Transient
+        failures, waiting too long for a pooled connection included, are
+        retried ``metadata_crawl.retries`` times per database. A database
+        that still gets no connection is crawled on this connector once the
+        workers are done. A database that keeps failing is reported and
+        left in ``skipped``.
+        """
+        options = self.pool.db_config.get("metadata_crawl", {})
+        max_workers = min(options.get("max_workers", 4), self.pool.available())
+        retries = options.get("retries", 2)
+        retry_delay = options.get("retry_delay", 2)
+        self.skipped = {}
+
+        def fetch(db, connector=None):
+            attempt = 0
+            while True:
+                worker = connector
+                failed = False
+                try:
+                    if worker is None:
+                        worker = ConnectorODBC(pool=self.pool)
+                    worker.execute(query_template.format(db))
+                    return worker.cursor.fetchall()
+                except (pyodbc.OperationalError, pyodbc.InterfaceError, TimeoutError) as e:
+                    failed = True
+                    attempt += 1
+                    if attempt > retries:
+                        raise
+                    print(f"Retrying metadata for {db} ({attempt}/{retries}): {e}")
+                finally:
+                    if connector is None and worker is not None:
+                        worker.close(discard=failed)
+                time.sleep(retry_delay * attempt)
+
+        result = ([], {}, {}, {})
+        total = len(databases)
+        done = 0
+
+        def merge(db, rows, error=None):
+            nonlocal done
+            done += 1
+            if error is None:
+                self._parse_meta_results(rows, include_dtype, into=result)
+            else:
+                self.skipped[db] = error
+                print(f"Failed to retrieve metadata for {db}: {error}")
+            if progress:
+                progress(db, done, total, error)
+
+        if max_workers < 1:
+            # Pool too small to fan out, crawl on this connection
+            for db in databases:
+                try:
+                    rows = fetch(db, connector=self)
+                except Exception as e:
+                    merge(db, None, e)
+                else:
+                    merge(db, rows)
+            return result
+
+        queued = []  # databases no pooled connection was free for
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="meta_crawl") as executor:
+            futures = {executor.submit(fetch, db): db for db in databases}
+            for future in as_completed(futures):
+                db = futures[future]
+                try:
+                    rows = future.result()
+                except TimeoutError:
+                    queued.append(db)
+                except Exception as e:
+                    merge(db, None, e)
+                else:
+                    merge(db, rows)
+        for db in queued:
+            try:
+                rows = fetch(db, connector=self)
+            except Exception as e:
+                merge(db, None, e)
+            else:
+                merge(db, rows)
+        return result
+
     def get_meta_under_db(self, db, include_dtype=True):
         """Get all accessible metadata under a specific database using database-specific query from config"""
         query = self.config["get_all_columns_under_db"]
@@ -184,6 +585,10 @@ class ConnectorODBC:
     def get_meta_under_table(self, db_schema_table, include_dtype=True):
         """Get all accessible metadata under a specific database, schema, and table using database-specific query from config"""
         db, schema, table = db_schema_table.split('.')
+        return self.get_table_columns(db, schema, table, include_dtype)
+
+    def get_table_columns(self, db, schema, table, include_dtype=True):
+        """Same as get_meta_under_table, with the names passed as the DBMS spells them"""
         query = self.config["get_all_columns_under_table"]
         query = query.format(db, schema, table)
         self.execute(query)
@@ -192,6 +597,30 @@ class ConnectorODBC:
         db_list, db_schema, db_schema_tbl, db_schema_tbl_col = self._parse_meta_results(meta, include_dtype)
         return db_list, db_schema, db_schema_tbl, db_schema_tbl_col
 
+    def get_table_markers(self, db, names=None):
+        """Change marker of every table under ``db`` keyed by ``db.schema.table``
+
+        Runs the ``get_table_change_markers`` query (last altered / modify date),
+        names are cleaned up the same way as the column metadata. A marker is
+        only compared for equality, so any type the driver returns works.
+        ``names`` is filled with the (db, schema, table) of each key as the
+        DBMS returned them, case sensitive queries need those.
+        """
+        query = self.config.get("get_table_change_markers")
+        if not query:
+            raise ValueError(f"get_table_change_markers query not found in settings for '{self.pool.dbms}'")
+        self.execute(query.format(db))
+        markers = {}
+        for raw_db, raw_schema, raw_table, marker in self.cursor.fetchall():
+            db_name = raw_db.replace(" ", "").lower() if raw_db else "default"
+            schema = raw_schema.replace(" ", "").lower() if raw_schema else "default"
+            table = raw_table.replace(" ", "").lower() if raw_table else "unknown"
+            key = f"{db_name}.{schema}.{table}"
+            markers[key] = str(marker)
+            if names is not None:
+                names[key] = (raw_db, raw_schema, raw_table)
+        return markers
+
     def query_to_cur_transpose_compare(self, query):
         self.execute(query)
         lst = self.cursor.fetchall()
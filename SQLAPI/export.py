@@ -0,0 +1,86 @@
+import csv
+import gzip
+import io
+import os
+import queue
+import threading
+
+
+class CsvWriter:
+    """Write fetched batches to a CSV file, gzip compressed when ``compress`` is set
+
+    ``rows`` and ``bytes_written`` track progress, ``bytes_written`` counts
+    what reached the file on disk so it is the compressed size with gzip.
+    """
+
+    def __init__(self, path, columns, compress=False):
+        self.path = path
+        self.rows = 0
+        self._raw = open(path, "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb") if compress else None
+        self._text = io.TextIOWrapper(
+            self._gzip if compress else self._raw, encoding="utf-8", newline=""
+        )
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(columns)
+
+    @property
+    def bytes_written(self):
+        if self._raw.closed:
+            return os.path.getsize(self.path)
+        return self._raw.tell()
+
+    def write_batch(self, rows):
+        self._csv.writerows(rows)
+        self._text.flush()
+        self.rows += len(rows)
+
+    def close(self):
+        if self._raw.closed:
+            return
+        self._text.close()  # closes the gzip stream and the file below it
+        if not self._raw.closed:
+            self._raw.close()
+
+
+def export_batches(batches, writer, queue_size=4, progress=None):
+    """Write ``batches`` through ``writer`` while the next ones are fetched
+
+    The calling thread pulls from ``batches`` (usually
+    ConnectorODBC.fetch_batches) and hands each batch to a writer thread over
+    a queue of ``queue_size`` batches, so memory stays bounded by a few
+    batches whatever the result size. ``progress(rows, bytes_written)`` is
+    called after each batch is queued. The writer is closed in every case,
+    errors from either side are raised here. Returns (rows, bytes_written).
+    """
+    pending = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def write():
+        while True:
+            rows = pending.get()
+            if rows is None:
+                return
+            if errors:
+                continue  # keep draining so the fetch side never blocks
+            try:
+                writer.write_batch(rows)
+            except Exception as e:
+                errors.append(e)
+
+    writer_thread = threading.Thread(target=write, name="export_writer")
+    writer_thread.start()
+    try:
+        for rows in batches:
+            if errors:
+                break
+            pending.put(rows)
+            if progress is not None:
+                progress(writer.rows, writer.bytes_written)
+    finally:
+        pending.put(None)
+        writer_thread.join()
+        writer.close()
+    if errors:
+        raise errors[0]
+    return writer.rows, writer.bytes_written
@@ -0,0 +1,425 @@
+import os
+import sys
+import json
+import struct
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
+
+from completion import CompletionIndex
+
+
+# Compact metastore of one connection group, written next to the JSON files
+#
+# Layout (little endian, every section padded to 4 bytes):
+#   header         magic, version, n_names, n_dtypes, n_db, n_schema, n_table, n_col
+#   name offsets   u32[n_names + 1]  into the utf-8 name blob
+#   name blob      interned db / schema / table / column names
+#   dtype offsets  u32[n_dtypes + 1] into the utf-8 dtype blob
+#   dtype blob     interned data types
+#   db             u32[n_db] name index,         u32[n_db + 1] first schema
+#   schema         u32[n_schema] name index,     u32[n_schema + 1] first table
+#   table          u32[n_table] name index,      u32[n_table + 1] first column
+#   column         u32[n_col] name index,        u16[n_col] dtype code
+#
+# Databases, schemas and tables are sorted by name so lookups are a bisect
+# over the node's child range instead of a JSON parse. Columns keep the order
+# of the source dict, the ORDINAL_POSITION order of the metadata query.
+METASTORE_FILE = "metastore.bin"
+SOURCE_FILE = "db-schema-tbl-col.json"
+MAGIC = b"SQLMETA\x00"
+VERSION = 2
+HEADER = struct.Struct("<8s7I")
+
+
+def _pad(length):
+    return (4 - length % 4) % 4
+
+
+def _u32(values):
+    arr = array("I", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _u16(values):
+    arr = array("H", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+class _Interner:
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def add(self, value):
+        idx = self.index.get(value)
+        if idx is None:
+            idx = self.index[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+    def tables(self):
+        offsets = [0]
+        blob = bytearray()
+        for value in self.values:
+            blob += value.encode("utf-8")
+            offsets.append(len(blob))
+        return _u32(offsets), bytes(blob)
+
+
+def write_metastore(path, db_schema_tbl_col):
+    """Write the nested db -> schema -> table -> {column: dtype} dict to ``path``
+
+    The file is written to a temporary name first and swapped in with
+    os.replace, so readers never see a half written metastore.
+    """
+    names = _Interner()
+    dtypes = _Interner()
+    db_name, db_child = [], [0]
+    schema_name, schema_child = [], [0]
+    table_name, table_child = [], [0]
+    col_name, col_dtype = [], []
+
+    for db in sorted(db_schema_tbl_col):
+        db_name.append(names.add(db))
+        schemas = db_schema_tbl_col[db]
+        for schema in sorted(schemas):
+            schema_name.append(names.add(schema))
+            tables = schemas[schema]
+            for table in sorted(tables):
+                table_name.append(names.add(table))
+                columns = tables[table]
+                for col in columns:
+                    col_name.append(names.add(col))
+                    col_dtype.append(dtypes.add(columns[col] or ""))
+                table_child.append(len(col_name))
+            schema_child.append(len(table_name))
+        db_child.append(len(schema_name))
+
+    if len(dtypes.values) > 0xFFFF:
+        raise ValueError(f"Too many distinct data types ({len(dtypes.values)}) for metastore")
+
+    name_offsets, name_blob = names.tables()
+    dtype_offsets, dtype_blob = dtypes.tables()
+    sections = [
+        name_offsets, name_blob, dtype_offsets, dtype_blob,
+        _u32(db_name), _u32(db_child),
+        _u32(schema_name), _u32(schema_child),
+        _u32(table_name), _u32(table_child),
+        _u32(col_name), _u16(col_dtype),
+    ]
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, len(names.values), len(dtypes.values),
+            len(db_name), len(schema_name), len(table_name), len(col_name),
+        ))
+        for section in sections:
+            f.write(section)
+            f.write(b"\x00" * _pad(len(section)))
+    os.replace(tmp_path, path)
+    metadata_cache.invalidate_folder(os.path.dirname(path))
+
+
+class Metastore:
+    """Read-only view over a metastore file
+
+    By default the file is read into memory in one call, which keeps the file
+    free to be swapped by a refresh (Windows refuses to replace a mapped
+    file). Pass ``use_mmap=True`` to map it instead.
+    """
+
+    def __init__(self, path, use_mmap=False):
+        self.path = path
+        with open(path, "rb") as f:
+            if use_mmap:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._buffer = f.read()
+        view = memoryview(self._buffer)
+        self._views = [view]
+
+        magic, version, n_names, n_dtypes, n_db, n_schema, n_table, n_col = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} metastore file")
+        self.counts = (n_db, n_schema, n_table, n_col)
+
+        pos = HEADER.size
+
+        def take(length, fmt=None):
+            nonlocal pos
+            section = view[pos:pos + length]
+            self._views.append(section)
+            pos += length + _pad(length)
+            if fmt is None:
+                return section
+            section = section.cast(fmt)
+            self._views.append(section)
+            if sys.byteorder == "big":
+                section = array(fmt, section.tobytes())
+                section.byteswap()
+            return section
+
+        self._name_offsets = take(4 * (n_names + 1), "I")
+        self._name_blob = take(self._name_offsets[-1] if n_names else 0)
+        self._dtype_offsets = take(4 * (n_dtypes + 1), "I")
+        self._dtype_blob = take(self._dtype_offsets[-1] if n_dtypes else 0)
+        self._db_name = take(4 * n_db, "I")
+        self._db_child = take(4 * (n_db + 1), "I")
+        self._schema_name = take(4 * n_schema, "I")
+        self._schema_child = take(4 * (n_schema + 1), "I")
+        self._table_name = take(4 * n_table, "I")
+        self._table_child = take(4 * (n_table + 1), "I")
+        self._col_name = take(4 * n_col, "I")
+        self._col_dtype = take(2 * n_col, "H")
+
+    @property
+    def nbytes(self):
+        return len(self._buffer)
+
+    def close(self):
+        """Release the buffer, required before a mapped file can be closed"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def _name(self, idx):
+        return str(self._name_blob[self._name_offsets[idx]:self._name_offsets[idx + 1]], "utf-8")
+
+    def _dtype(self, code):
+        return str(self._dtype_blob[self._dtype_offsets[code]:self._dtype_offsets[code + 1]], "utf-8")
+
+    def _find(self, name_arr, lo, hi, name):
+        """Bisect the sorted child range [lo, hi) for ``name``, -1 if missing"""
+        end = hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(name_arr[mid]) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < end and self._name(name_arr[lo]) == name:
+            return lo
+        return -1
+
+    def _db(self, db):
+        return self._find(self._db_name, 0, len(self._db_name), db)
+
+    def _schema(self, db, schema):
+        d = self._db(db)
+        if d < 0:
+            return -1
+        return self._find(self._schema_name, self._db_child[d], self._db_child[d + 1], schema)
+
+    def _table(self, db, schema, table):
+        s = self._schema(db, schema)
+        if s < 0:
+            return -1
+        return self._find(self._table_name, self._schema_child[s], self._schema_child[s + 1], table)
+
+    def databases(self):
+        return [self._name(idx) for idx in self._db_name]
+
+    def schemas(self, db):
+        d = self._db(db)
+        if d < 0:
+            return []
+        return [self._name(self._schema_name[s]) for s in range(self._db_child[d], self._db_child[d + 1])]
+
+    def tables(self, db, schema):
+        s = self._schema(db, schema)
+        if s < 0:
+            return []
+        return [self._name(self._table_name[t]) for t in range(self._schema_child[s], self._schema_child[s + 1])]
+
+    def columns(self, db, schema, table):
+        """List of (column, dtype) for one table, empty if the table is unknown"""
+        t = self._table(db, schema, table)
+        if t < 0:
+            return []
+        return [
+            (self._name(self._col_name[c]), self._dtype(self._col_dtype[c]))
+            for c in range(self._table_child[t], self._table_child[t + 1])
+        ]
+
+    def has_table(self, db, schema, table):
+        return self._table(db, schema, table) >= 0
+
+    def iter_tables(self):
+        """Yield (db, schema, table, first column, end column) for every table"""
+        for d in range(len(self._db_name)):
+            db = self._name(self._db_name[d])
+            for s in range(self._db_child[d], self._db_child[d + 1]):
+                schema = self._name(self._schema_name[s])
+                for t in range(self._schema_child[s], self._schema_child[s + 1]):
+                    yield db, schema, self._name(self._table_name[t]), self._table_child[t], self._table_child[t + 1]
+
+    def iter_columns(self):
+        """Yield (db, schema, table, column, dtype) for every column"""
+        for db, schema, table, start, end in self.iter_tables():
+            for c in range(start, end):
+                yield db, schema, table, self._name(self._col_name[c]), self._dtype(self._col_dtype[c])
+
+    def column_owners(self):
+        """Map every distinct column name to the (db, schema, table) of the tables holding it"""
+        owners = {}
+        for db, schema, table, start, end in self.iter_tables():
+            owner = (db, schema, table)
+            for c in range(start, end):
+                owners.setdefault(self._col_name[c], []).append(owner)
+        return {self._name(idx): tables for idx, tables in owners.items()}
+
+    def drop_down_list(self):
+        """Flattened db.schema.table.column list, tables sorted and columns in table order"""
+        return [f"{db}.{schema}.{table}.{col}" for db, schema, table, col, _ in self.iter_columns()]
+
+    def to_dict(self):
+        """Rebuild the nested db-schema-tbl-col dict"""
+        db_schema_tbl_col = {}
+        for db, schema, table, col, dtype in self.iter_columns():
+            db_schema_tbl_col.setdefault(db, {}).setdefault(schema, {}).setdefault(table, {})[col] = dtype
+        return db_schema_tbl_col
+
+
+def convert_json_group(folder_path):
+    """Build metastore.bin from the db-schema-tbl-col.json of an existing group"""
+    with open(os.path.join(folder_path, SOURCE_FILE), "r") as f:
+        db_schema_tbl_col = json.loads(f.read())
+    path = os.path.join(folder_path, METASTORE_FILE)
+    write_metastore(path, db_schema_tbl_col)
+    return path
+
+
+def open_group_metastore(folder_path, use_mmap=False):
+    """Open the metastore of a connection group, converting the JSON layout when needed
+
+    Groups created before the binary format, or whose JSON was edited or
+    patched since (e.g. by the add/remove table commands), are converted on
+    the fly so they keep working.
+    """
+    path = os.path.join(folder_path, METASTORE_FILE)
+    source_path = os.path.join(folder_path, SOURCE_FILE)
+    try:
+        stale = os.path.getmtime(source_path) > os.path.getmtime(path)
+    except FileNotFoundError:
+        stale = not os.path.exists(path)
+    if stale:
+        convert_json_group(folder_path)
+    try:
+        return Metastore(path, use_mmap=use_mmap)
+    except ValueError:
+        # written by an older version of the format
+        convert_json_group(folder_path)
+        return Metastore(path, use_mmap=use_mmap)
+
+
+def _signature(paths):
+    """(mtime, size) of every path, None for missing files"""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class MetadataCache:
+    """Process-wide LRU cache of loaded connection group metadata
+
+    Entries are keyed by (dbms, connection group, file) and remember the
+    mtime and size of the files they were loaded from; a changed file reloads
+    the entry on next access. The least recently used entries are dropped
+    once more than ``max_entries`` entries or ``max_bytes`` bytes are held.
+    """
+
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (signature, value, nbytes)
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, paths, loader, size_of=None):
+        """Cached value for ``key``, (re)loaded with ``loader`` when ``paths`` changed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == _signature(paths):
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = loader()
+        signature = _signature(paths)
+        nbytes = size_of(value) if size_of else getattr(value, "nbytes", 0)
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (signature, value, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._entries)))
+        return value
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def invalidate(self, dbms=None, group=None):
+        """Drop entries of one group, one DBMS, or everything"""
+        with self._lock:
+            for key in list(self._entries):
+                if (dbms is None or key[0] == dbms) and (group is None or key[1] == group):
+                    self._pop(key)
+
+    def invalidate_folder(self, folder_path):
+        """Drop entries of the group stored in ``metastore/<dbms>/<group>``"""
+        folder_path = os.path.normpath(folder_path)
+        self.invalidate(
+            dbms=os.path.basename(os.path.dirname(folder_path)),
+            group=os.path.basename(folder_path),
+        )
+
+
+metadata_cache = MetadataCache()
+
+
+def load_group_metastore(metastore_path, dbms, group):
+    """Cached metastore of ``metastore/<dbms>/<group>``"""
+    folder_path = os.path.join(metastore_path, dbms, group)
+    return metadata_cache.get(
+        (dbms, group, METASTORE_FILE),
+        [os.path.join(folder_path, SOURCE_FILE), os.path.join(folder_path, METASTORE_FILE)],
+        lambda: open_group_metastore(folder_path),
+    )
+
+
+def load_group_drop_down(metastore_path, dbms, group):
+    """Cached db.schema.table.column list of ``metastore/<dbms>/<group>``"""
+    folder_path = os.path.join(metastore_path, dbms, group)
+    return metadata_cache.get(
+        (dbms, group, "drop-down"),
+        [os.path.join(folder_path, SOURCE_FILE), os.path.join(folder_path, METASTORE_FILE)],
+        lambda: load_group_metastore(metastore_path, dbms, group).drop_down_list(),
+        size_of=lambda lst: sum(len(line) for line in lst),
+    )
+
+
+def load_group_completions(metastore_path, dbms, group):
+    """Cached CompletionIndex over the metastore of ``metastore/<dbms>/<group>``"""
+    folder_path = os.path.join(metastore_path, dbms, group)
+    return metadata_cache.get(
+        (dbms, group, "completions"),
+        [os.path.join(folder_path, SOURCE_FILE), os.path.join(folder_path, METASTORE_FILE)],
+        lambda: CompletionIndex(load_group_metastore(metastore_path, dbms, group)),
+    )
@@ -0,0 +1,214 @@
+import os
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """On-disk LRU cache of rendered query results
+
+    Every result lives in its own ``<key>.txt`` file under ``folder`` and a
+    small ``index.json`` keeps the keys in least to most recently used order
+    together with their size, creation time and the tables they read. A
+    lookup reads one file and only moves the key in memory, a store writes
+    one file plus the index, both atomically (temp file plus os.replace).
+    The recency order of hits reaches disk with the next store or eviction,
+    or with flush. Entries are evicted by
+    count and by total bytes, on TTL expiry, and when a statement writes to a
+    table they depend on.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, folder, max_entries=20, max_bytes=64 * 1024 * 1024):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._index = None  # key -> entry dict, least recently used first
+        self._dependents = {}  # table name -> keys of entries reading it
+        self._bytes = 0
+        self._dirty = False  # hits reordered the index since it was saved
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(fingerprint, namespace=""):
+        """Hash of a normalized statement fingerprint, scoped by ``namespace``
+
+        See SQLAPI.statement.analyze_statement for the fingerprint; any text
+        works, its whitespace is collapsed first.
+        """
+        normalized = " ".join(fingerprint.split())
+        return hashlib.sha1(f"{namespace}\0{normalized}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _table_key(table):
+        # Match on the bare table name so db.schema.tbl and tbl meet
+        return table.rsplit(".", 1)[-1]
+
+    def _entry_path(self, key):
+        return os.path.join(self.folder, f"{key}.txt")
+
+    def _write_atomic(self, path, content):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+        os.makedirs(self.folder, exist_ok=True)
+        self._index = OrderedDict()
+        try:
+            with open(os.path.join(self.folder, self.INDEX_FILE), "r", encoding="utf-8") as f:
+                entries = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            entries = []
+        for key, entry in entries:
+            if isinstance(entry, int):
+                entry = {"size": entry}
+            if os.path.exists(self._entry_path(key)):
+                self._add(key, entry)
+        return self._index
+
+    def _add(self, key, entry):
+        entry.setdefault("created", 0)
+        entry.setdefault("namespace", "")
+        entry.setdefault("tables", [])
+        self._index[key] = entry
+        self._bytes += entry["size"]
+        for table in entry["tables"]:
+            self._dependents.setdefault(self._table_key(table), set()).add(key)
+
+    def _save_index(self):
+        self._write_atomic(
+            os.path.join(self.folder, self.INDEX_FILE),
+            json.dumps(list(self._index.items())),
+        )
+        self._dirty = False
+
+    def flush(self):
+        """Write the index if hits changed the recency order since it was saved"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _remove(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+            for table in entry["tables"]:
+                keys = self._dependents.get(self._table_key(table))
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._dependents[self._table_key(table)]
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load_index())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._load_index()
+
+    def get(self, key, ttl=None):
+        """Cached result for ``key`` or None, marking it as most recently used
+
+        Entries older than ``ttl`` seconds are dropped instead of returned. A
+        hit does not write the index.
+        """
+        with self._lock:
+            index = self._load_index()
+            if key not in index:
+                return None
+            if ttl and time.time() - index[key]["created"] > ttl:
+                self._remove(key)
+                self._save_index()
+                return None
+            try:
+                with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                    value = f.read()
+            except FileNotFoundError:
+                self._remove(key)
+                self._save_index()
+                return None
+            index.move_to_end(key)
+            self._dirty = True
+            return value
+
+    def put(self, key, value, max_entries=None, tables=(), namespace=""):
+        """Store ``value`` under ``key`` and evict least recently used entries
+
+        ``tables`` are the tables the result was read from, a later write to
+        any of them in the same ``namespace`` evicts the entry.
+        """
+        max_entries = max_entries if max_entries is not None else self.max_entries
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            index = self._load_index()
+            if size > self.max_bytes or max_entries < 1:
+                return False
+            if key in index:
+                self._remove(key)
+            self._write_atomic(self._entry_path(key), value)
+            self._add(key, {
+                "size": size,
+                "created": time.time(),
+                "namespace": namespace,
+                "tables": sorted(set(tables)),
+            })
+            while len(index) > max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(index)))
+            self._save_index()
+            return True
+
+    def invalidate_tables(self, tables, namespace=None):
+        """Evict entries that read any of ``tables``, return how many were evicted"""
+        with self._lock:
+            self._load_index()
+            keys = set()
+            for table in tables:
+                keys.update(self._dependents.get(self._table_key(table), ()))
+            keys = [
+                key for key in keys
+                if namespace is None or self._index[key]["namespace"] == namespace
+            ]
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self._save_index()
+            return len(keys)
+
+    def invalidate_namespace(self, namespace):
+        """Evict every entry of ``namespace``, return how many were evicted"""
+        with self._lock:
+            index = self._load_index()
+            keys = [key for key, entry in index.items() if entry["namespace"] == namespace]
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self._save_index()
+            return len(keys)
+
+    def discard(self, key):
+        with self._lock:
+            self._load_index()
+            self._remove(key)
+            self._save_index()
+
+    def clear(self):
+        """Remove every cached result, return the number of entries removed"""
+        with self._lock:
+            index = self._load_index()
+            removed = len(index)
+            for key in list(index):
+                self._remove(key)
+            self._save_index()
+            return removed
@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def column_alignments(rows, count):
+    """"right" for the columns whose non-NULL values are all numbers, "left" for the others
+
+    Only the value types count, strings are never parsed as numbers, so the
+    result can be passed as ``colalign`` to tabulate with disable_numparse.
+    """
+    numeric = [None] * count  # None until a non-NULL value is seen
+    for row in rows:
+        for idx, value in enumerate(row):
+            if value is not None and numeric[idx] is not False:
+                numeric[idx] = _is_number(value)
+    return ["right" if flag else "left" for flag in numeric]
+
+
+class StreamingTable:
+    """Render query rows as a psql style table, a batch at a time.
+
+    Column widths and alignments are settled once from a sample window of
+    rows, so the header and every later batch can be appended to the
+    result view as soon as they are fetched. Numeric columns are right
+    aligned like tabulate does. Values wider than the settled width are
+    written in full and only push that one row out of alignment.
+    """
+
+    def __init__(self, headers, missingval=""):
+        self.headers = [str(h) for h in headers]
+        self.missingval = missingval
+        self.widths = [len(h) + 2 for h in self.headers]
+        self.aligns = ["left"] * len(self.headers)
+
+    def _cell(self, value):
+        if value is None:
+            return self.missingval
+        if isinstance(value, str):
+            return value.replace("\n", " ")
+        return str(value)
+
+    def settle(self, sample_rows):
+        """Fix column widths and alignments from the first window of rows"""
+        self.aligns = column_alignments(sample_rows, len(self.headers))
+        for row in sample_rows:
+            for idx, value in enumerate(row):
+                width = len(self._cell(value))
+                if width > self.widths[idx]:
+                    self.widths[idx] = width
+
+    def _line(self, cells):
+        return "| " + " | ".join(
+            cell.rjust(width) if align == "right" else cell.ljust(width)
+            for cell, width, align in zip(cells, self.widths, self.aligns)
+        ) + " |"
+
+    def _rule(self, left, mid, right):
+        return left + mid.join("-" * (width + 2) for width in self.widths) + right
+
+    def header(self):
+        """Top border, header row and header separator"""
+        return "\n".join([
+            self._rule("+", "+", "+"),
+            self._line(self.headers),
+            self._rule("|", "+", "|"),
+        ]) + "\n"
+
+    def rows(self, rows):
+        """Render a batch of rows, one line per row"""
+        if not rows:
+            return ""
+        return "\n".join(
+            self._line([self._cell(value) for value in row]) for row in rows
+        ) + "\n"
+
+    def footer(self):
+        """Bottom border"""
+        return self._rule("+", "+", "+")
@@ -0,0 +1,301 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+
+FINISHED = frozenset([DONE, FAILED, CANCELLED, TIMEOUT])
+
+POLICIES = ("fifo", "priority")
+
+
+class Job:
+    """One unit of work submitted to the Scheduler
+
+    ``target`` is called as ``target(job, *args)`` on a worker thread, it
+    should check ``job.token.cancelled`` between steps and hand the token to
+    the connector so a cancel reaches the driver. A job with a ``pool`` gets
+    its connection borrowed by the scheduler, see take_connection.
+    """
+
+    def __init__(self, job_id, target, args, key, description, token,
+                 timeout=None, priority=0, on_timeout=None, pool=None):
+        self.id = job_id
+        self.target = target
+        self.args = args
+        self.key = key
+        self.description = description
+        self.token = token
+        self.timeout = timeout
+        self.priority = priority
+        self.on_timeout = on_timeout
+        self.pool = pool
+        self.connection = None
+        self.borrow_error = None
+        self.status = QUEUED
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def take_connection(self):
+        """Connection borrowed for this job from its pool, the caller gives it back
+
+        Raises the error the pool raised when no connection could be borrowed.
+        """
+        if self.borrow_error is not None:
+            raise self.borrow_error
+        connection, self.connection = self.connection, None
+        return connection
+
+    @property
+    def runtime(self):
+        if self.started_at is None:
+            return 0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def snapshot(self):
+        return {
+            "id": self.id,
+            "key": self.key,
+            "description": self.description,
+            "status": self.status,
+            "priority": self.priority,
+            "timeout": self.timeout,
+            "submitted_at": self.submitted_at,
+            "runtime": self.runtime,
+            "error": self.error,
+        }
+
+
+class Scheduler:
+    """Job queue feeding a fixed set of worker threads
+
+    Jobs sharing a ``key`` (a view id, so the runs of one tab) run one at
+    a time in submission order, jobs with different keys run concurrently up
+    to ``max_workers``. A job submitted with a ``pool`` also waits in the
+    queue until the pool has a free connection, and the scheduler borrows it
+    before the job counts as running, so no worker sits blocked in acquire.
+    Waiting jobs are picked first in first out, or by highest priority then
+    submission order with the "priority" policy. One monitor thread enforces
+    every job timeout by cancelling its token.
+    """
+
+    def __init__(self, max_workers=4, policy="fifo", monitor_interval=0.5,
+                 history=50, on_tick=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy '{policy}', expected one of {POLICIES}")
+        self.max_workers = max_workers
+        self.policy = policy
+        self.monitor_interval = monitor_interval
+        self.history = history
+        self.on_tick = on_tick
+        self._ids = itertools.count(1)
+        self._queue = []  # heap of (order, job)
+        self._jobs = {}  # id -> job, queued, running and the last finished ones
+        self._busy_keys = set()
+        self._borrowing = {}  # pool -> jobs picked that have not borrowed yet
+        self._workers = []
+        self._lock = threading.Condition()
+        self._shutdown = False
+        self._monitor = None
+
+    def _order(self, job):
+        if self.policy == "priority":
+            return (-job.priority, job.id)
+        return (job.id,)
+
+    def _start_threads(self):
+        # Called with the lock held, threads are started lazily on first submit
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, name="sql_job_monitor", daemon=True)
+            self._monitor.start()
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"sql_worker_{len(self._workers)}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def submit(self, target, args=(), key=None, description="", token=None,
+               timeout=None, priority=0, on_timeout=None, pool=None):
+        """Queue ``target`` and return its Job
+
+        ``token`` is the job's CancelToken (SQLAPI.connect), ``on_timeout`` is
+        called with the job once the monitor cancelled it for running longer
+        than ``timeout`` seconds. ``pool`` is the ConnectionPool the job
+        borrows its connection from.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            job = Job(next(self._ids), target, list(args), key, description, token,
+                      timeout=timeout, priority=priority, on_timeout=on_timeout, pool=pool)
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (self._order(job), job))
+            self._start_threads()
+            self._lock.notify_all()
+            return job
+
+    def _next_job(self):
+        # Called with the lock held: first queued job whose connection slot is free
+        skipped = []
+        job = None
+        while self._queue:
+            order, candidate = heapq.heappop(self._queue)
+            if candidate.status != QUEUED:
+                continue
+            if candidate.key is not None and candidate.key in self._busy_keys:
+                skipped.append((order, candidate))
+                continue
+            if candidate.pool is not None and candidate.pool.available() <= self._borrowing.get(candidate.pool, 0):
+                skipped.append((order, candidate))
+                continue
+            job = candidate
+            break
+        for item in skipped:
+            heapq.heappush(self._queue, item)
+        return job
+
+    def _borrow(self, job):
+        # Outside the lock, opening a connection can take a while
+        try:
+            job.connection = job.pool.acquire()
+        except Exception as e:
+            job.borrow_error = e
+        with self._lock:
+            self._borrowing[job.pool] -= 1
+            if not self._borrowing[job.pool]:
+                del self._borrowing[job.pool]
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                job = self._next_job()
+                while job is None:
+                    if self._shutdown:
+                        return
+                    self._lock.wait()
+                    job = self._next_job()
+                if job.key is not None:
+                    self._busy_keys.add(job.key)
+                if job.pool is not None:
+                    self._borrowing[job.pool] = self._borrowing.get(job.pool, 0) + 1
+
+            if job.pool is not None:
+                self._borrow(job)
+            with self._lock:
+                # cancelled while the connection was borrowed
+                started = job.status == QUEUED
+                if started:
+                    job.status = RUNNING
+                    job.started_at = time.time()
+
+            status, error = DONE, None
+            if started:
+                try:
+                    job.target(job, *job.args)
+                except Exception as e:
+                    status, error = FAILED, str(e)
+                    print(f"Job {job.id} ({job.description}) failed: {e}")
+            # the target did not take its connection
+            if job.connection is not None:
+                job.pool.release(job.take_connection())
+
+            with self._lock:
+                if job.status == RUNNING:
+                    job.status = CANCELLED if job.token is not None and job.token.cancelled else status
+                job.error = error
+                job.finished_at = time.time()
+                self._busy_keys.discard(job.key)
+                self._prune()
+                self._lock.notify_all()
+
+    def _prune(self):
+        # Keep only the most recent finished jobs for status queries
+        finished = [job for job in self._jobs.values() if job.status in FINISHED]
+        for job in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job.id]
+
+    def _monitor_loop(self):
+        while True:
+            with self._lock:
+                if self._shutdown:
+                    return
+                self._lock.wait(self.monitor_interval)
+                running = [job for job in self._jobs.values() if job.status == RUNNING]
+                if self._queue:
+                    # a connection given back outside the scheduler frees a waiting job
+                    self._lock.notify_all()
+            expired = [
+                job for job in running
+                if job.timeout and job.runtime >= job.timeout
+            ]
+            for job in expired:
+                with self._lock:
+                    if job.status != RUNNING:
+                        continue
+                    job.status = TIMEOUT
+                if job.token is not None:
+                    job.token.cancel()
+                if job.on_timeout is not None:
+                    try:
+                        job.on_timeout(job)
+                    except Exception as e:
+                        print(f"Timeout handler of job {job.id} failed: {e}")
+            if self.on_tick is not None and running:
+                try:
+                    self.on_tick([job for job in running if job.status == RUNNING])
+                except Exception as e:
+                    print(f"Scheduler tick failed: {e}")
+
+    def jobs(self, include_finished=False):
+        """Snapshots of queued and running jobs, oldest first"""
+        with self._lock:
+            return [
+                job.snapshot() for job in self._jobs.values()
+                if include_finished or job.status not in FINISHED
+            ]
+
+    def status(self, job_id):
+        """Snapshot of one job, None once it has left the history"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job is not None else None
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job, return False if it already finished"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            job.status = CANCELLED
+            if job.started_at is None:
+                job.finished_at = time.time()
+            self._lock.notify_all()
+        if job.token is not None:
+            job.token.cancel()
+        return True
+
+    def cancel_all(self):
+        """Cancel every queued and running job, return the ids that were cancelled"""
+        return [
+            snapshot["id"] for snapshot in self.jobs()
+            if self.cancel(snapshot["id"])
+        ]
+
+    def shutdown(self):
+        """Cancel everything and let the worker and monitor threads exit"""
+        self.cancel_all()
+        with self._lock:
+            self._shutdown = True
+            self._lock.notify_all()
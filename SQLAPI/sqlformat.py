@@ -0,0 +1,387 @@
+import hashlib
+import itertools
+import multiprocessing
+import os
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlparse
+from sqlparse import lexer
+from sqlparse.engine import StatementSplitter
+
+
+# Formatted statements a FormatCache keeps at least, by hash of their text.
+# It grows to hold every statement of the text it formats
+FORMAT_CACHE_SIZE = 4096
+
+# Characters of statements sent to a FormatPool worker at once
+CHUNK_CHARS = 64 * 1024
+
+# Tokens left by a quote, backtick, bracket or $tag$ dollar quote the lexer
+# found no closing character for. Finding none, it searched to the end of
+# the text
+_UNCLOSED = {"'", '"', "`", "\u00b4", "[", "$"}
+
+# Characters that can close what an earlier statement left open, inserted
+# or removed. An unclosed bracket search also stops at the next [
+_CLOSERS = re.compile("['\"`\u00b4\\[\\]*/$]")
+
+
+def _is_word(char):
+    return char.isalnum() or char == "_"
+
+
+def _near_closer(text, begin, end):
+    """Whether [begin, end) of ``text`` may make or break a closer
+
+    One character either side catches a * and / the change joins, the
+    word around it a $tag$ whose tag it edits.
+    """
+    while begin > 0 and _is_word(text[begin - 1]):
+        begin -= 1
+    while end < len(text) and _is_word(text[end]):
+        end += 1
+    return _CLOSERS.search(text, max(begin - 1, 0), end + 1) is not None
+
+
+def _is_open(statement):
+    """Whether lexing ``statement`` looked for a closing character up to the end of the text"""
+    previous = ""
+    for token in statement.tokens:
+        value = token.value
+        if value in _UNCLOSED or (previous == "/" and value.startswith("*")):
+            return True
+        previous = value
+    return False
+
+
+def split_statements(text, start=0):
+    """(start, end, open) of the statements of ``text`` from offset ``start``, in order
+
+    Spans follow sqlparse's own split: a statement keeps what follows its
+    semicolon up to the end of that line, the whitespace before the next
+    statement belongs to the next one, and trailing whitespace after the
+    last statement is no statement. ``open`` tells the statement holds a
+    quote, comment, bracket or dollar quote that is never closed, how it
+    was split then depends on all the text after it. ``start`` must be a
+    statement boundary, the lexer still sees the text before it where a
+    rule looks behind, as a $$ only opens a dollar quote after whitespace.
+    The text is lexed lazily, only as far as the spans are consumed.
+    """
+    pos = start
+    for statement in StatementSplitter().process(lexer.tokenize(text, start=start)):
+        end = pos + len(statement.value)
+        yield pos, end, _is_open(statement)
+        pos = end
+
+
+def _common_affixes(old, new):
+    """Lengths of the common prefix and suffix of two texts, they never overlap
+
+    Binary search over slice comparisons, each one a memcmp, instead of a
+    Python loop over the characters.
+    """
+    lo, hi = 0, min(len(old), len(new))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[:mid] == new[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = lo
+    lo, hi = 0, min(len(old), len(new)) - prefix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[len(old) - mid:] == new[len(new) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return prefix, lo
+
+
+class StatementSpans:
+    """Statement spans of one buffer, split again only around what changed
+
+    Where a statement ends is decided by the first token of the next one,
+    so a change re-splits from the statement before the first one it
+    touches, or from the first open statement before it when the change
+    may close what that one left open. Splitting goes on until a statement
+    ends on an old boundary past the change, not on its end, which is what
+    the next statement is lexed after; the spans after it are only shifted. The splitter starts afresh at every statement, so the result
+    is what a full split_statements would give.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.spans = []
+
+    def update(self, text):
+        """Spans of ``text``, compared with the text of the previous call"""
+        if text == self.text:
+            return self.spans
+        if not self.spans:
+            self.text, self.spans = text, list(split_statements(text))
+            return self.spans
+        prefix, suffix = _common_affixes(self.text, text)
+        end = len(self.text) - suffix
+        return self.apply(text, [(prefix, end, len(text) - suffix - prefix)])
+
+    def apply(self, text, changes):
+        """Spans of ``text``, the previous text with ``changes`` applied
+
+        ``changes`` are (begin, end, size) replacements of [begin, end) of
+        the previous text by ``size`` characters, in order and not
+        overlapping.
+        """
+        spans = self.spans
+        ends = [span[1] for span in spans]
+        # (old begin, new begin, new end, delta after) of every change
+        moved = []
+        delta = 0
+        for begin, end, size in changes:
+            moved.append((begin, begin + delta, begin + delta + size, delta + size - (end - begin)))
+            delta = moved[-1][3]
+        # closing[ci]: change ci or a later one may close an open statement
+        closing = [False] * (len(moved) + 1)
+        for ci in range(len(moved) - 1, -1, -1):
+            begin, end, _ = changes[ci]
+            _, new_begin, new_end, _ = moved[ci]
+            closing[ci] = (
+                closing[ci + 1]
+                or _near_closer(text, new_begin, new_end)
+                or _near_closer(self.text, begin, end)
+            )
+
+        result = []
+        idx = 0  # next old span to keep
+        delta = 0
+        ci = 0
+        while ci < len(moved):
+            trigger = ci
+            first = max(bisect_left(ends, moved[ci][0], idx) - 1, idx)
+            if closing[ci]:
+                first = next((i for i in range(idx, first) if spans[i][2]), first)
+            result.extend((s + delta, e + delta, o) for s, e, o in spans[idx:first])
+            restart = result[-1][1] if result else 0
+            idx = len(spans)
+            for span in split_statements(text, restart):
+                result.append(span)
+                pos = span[1]
+                # a change ending on the boundary is still the left context of
+                # the next statement, where a lexer rule may look behind
+                while ci < len(moved) and moved[ci][2] < pos:
+                    delta = moved[ci][3]
+                    ci += 1
+                if ci == trigger or (ci < len(moved) and pos >= moved[ci][1]):
+                    continue  # still inside a change
+                old = bisect_left(ends, pos - delta)
+                if old == len(ends) or ends[old] != pos - delta:
+                    continue
+                if ci < len(moved) and bisect_left(ends, moved[ci][0], old) <= old + 1:
+                    continue  # the next change starts within the next statement
+                idx = old + 1
+                break
+            else:
+                ci = len(moved)
+        result.extend((s + delta, e + delta, o) for s, e, o in spans[idx:])
+        self.text, self.spans = text, result
+        return result
+
+
+class FormatCache:
+    """Formatting state of one buffer between two runs of SaFormat
+
+    ``spans`` splits the buffer into statements, re-splitting only what was
+    edited since. Formatted statements are kept by hash of their text, and
+    a formatted statement is stored under its own hash too, so a statement
+    that is already formatted or unchanged never reaches sqlparse again.
+    """
+
+    def __init__(self, style, max_entries=FORMAT_CACHE_SIZE):
+        self.style = style
+        self.max_entries = max_entries
+        self.spans = StatementSpans()
+        self._formatted = OrderedDict()
+        self._limit = max_entries
+
+    @staticmethod
+    def _key(text):
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def _store(self, key, formatted):
+        self._formatted[key] = formatted
+        while len(self._formatted) > self._limit:
+            self._formatted.popitem(last=False)
+
+    def format_all(self, statements, pool=None):
+        """``statements`` formatted and stripped, in order, None where sqlparse failed
+
+        Only statements missing from the cache are formatted, by ``pool``
+        when one is given and they are enough work for it.
+        """
+        keys = [self._key(statement) for statement in statements]
+        missing = OrderedDict()
+        for key, statement in zip(keys, statements):
+            if key not in self._formatted:
+                missing.setdefault(key, statement)
+        if missing:
+            todo = list(missing.values())
+            if pool is not None and pool.wants(todo):
+                results = pool.format(todo, self.style)
+            else:
+                results = format_chunk(self.style, todo)
+            failed = 0
+            for key, formatted in zip(missing, results):
+                if formatted is None:
+                    failed += 1
+                    continue
+                self._store(key, formatted)
+                self._store(self._key(formatted), formatted)
+            if failed:
+                print(f"Format failed on {failed} statement(s), left as they are")
+
+        formatted = []
+        for key in keys:
+            result = self._formatted.get(key)
+            if result is not None:
+                self._formatted.move_to_end(key)
+            formatted.append(result)
+        return formatted
+
+    def edits(self, text, spans, offset=0, pool=None):
+        """(begin, end, replacement) of every statement of ``text`` that formatting changes
+
+        Only the statement itself is replaced, the whitespace around it is
+        left as written, except that a statement sharing a line with the
+        previous one is moved two lines down like sqlparse separates them.
+        Offsets are shifted by ``offset``. A statement sqlparse fails on is
+        left as it is. ``pool`` is passed on to format_all.
+        """
+        # each statement is stored as written and as formatted
+        self._limit = max(self.max_entries, 2 * len(spans))
+        statements = []
+        for start, end, _ in spans:
+            segment = text[start:end]
+            body = segment.strip()
+            if body:
+                begin = start + len(segment) - len(segment.lstrip())
+                statements.append((begin, begin + len(body), body))
+        formatted = self.format_all([body for _, _, body in statements], pool)
+
+        edits = []
+        previous = None
+        for (begin, stop, body), result in zip(statements, formatted):
+            if result is None:
+                pass
+            elif previous is not None and "\n" not in text[previous:begin]:
+                edits.append((offset + previous, offset + stop, "\n\n" + result))
+            elif result != body:
+                edits.append((offset + begin, offset + stop, result))
+            previous = stop
+        return edits
+
+
+def format_chunk(style, statements):
+    """``statements`` formatted and stripped, None for the ones sqlparse failed on
+
+    Runs in FormatPool workers, so it only needs sqlparse.
+    """
+    formatted = []
+    for statement in statements:
+        try:
+            formatted.append(sqlparse.format(statement, **style).strip())
+        except Exception:
+            formatted.append(None)
+    return formatted
+
+
+def _chunks(statements, size=CHUNK_CHARS):
+    """Consecutive runs of ``statements`` of about ``size`` characters each"""
+    chunk = []
+    chars = 0
+    for statement in statements:
+        chunk.append(statement)
+        chars += len(statement)
+        if chars >= size:
+            yield chunk
+            chunk = []
+            chars = 0
+    if chunk:
+        yield chunk
+
+
+class FormatPool:
+    """Format statements in worker processes, outside the plugin host
+
+    Statements go to the workers in consecutive chunks of about CHUNK_CHARS
+    characters and are stitched back in order. Below ``min_chars`` of
+    statements starting the workers costs more than it saves, and they are
+    formatted in-process. Workers are started on first use with the spawn
+    method and kept for later runs. Sublime's plugin host can't be started
+    as a Python interpreter, so ``python`` names the one to start them
+    with. When the workers can't be started, die or take more than
+    ``timeout`` seconds, the pool logs why and formats in-process from then
+    on.
+    """
+
+    def __init__(self, processes=0, min_chars=50000, python="", timeout=300):
+        self.processes = processes or max(1, (os.cpu_count() or 2) - 1)
+        self.min_chars = min_chars
+        self.python = python
+        self.timeout = timeout
+        self.broken = False
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def wants(self, statements):
+        """Whether formatting ``statements`` is worth the worker processes"""
+        return not self.broken and sum(map(len, statements)) >= self.min_chars
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context("spawn")
+                if self.python:
+                    context.set_executable(self.python)
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=context)
+            return self._executor
+
+    def format(self, statements, style):
+        """format_chunk of ``statements``, computed by the workers"""
+        try:
+            chunks = self._get_executor().map(
+                format_chunk, itertools.repeat(style), _chunks(statements), timeout=self.timeout
+            )
+            return [formatted for chunk in chunks for formatted in chunk]
+        except Exception as e:
+            print(f"Format workers failed, formatting in-process from now on: {e!r}")
+            self.broken = True
+            self.close(terminate=True)
+            return format_chunk(style, statements)
+
+    def close(self, terminate=False):
+        """Shut the workers down, ``terminate`` kills them first when they may be stuck"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if terminate:
+            # ProcessPoolExecutor has no public way to stop a stuck worker
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown()
+
+
+def apply_edits(text, edits):
+    """``text`` with (begin, end, replacement) edits applied, edits in order"""
+    pieces = []
+    pos = 0
+    for begin, end, replacement in edits:
+        pieces.append(text[pos:begin])
+        pieces.append(replacement)
+        pos = end
+    pieces.append(text[pos:])
+    return "".join(pieces)
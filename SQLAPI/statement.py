@@ -0,0 +1,414 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import sqlparse
+from sqlparse import lexer
+from sqlparse import sql
+from sqlparse import tokens as T
+
+
+# Result of analyze_statement
+#   fingerprint: canonical text, insensitive to whitespace, comments and keyword/identifier case
+#   type: first DML/DDL keyword in upper case (SELECT, INSERT, DROP, ...) or UNKNOWN
+#   tables: lower-cased, unquoted names of the tables the statement references
+StatementInfo = namedtuple("StatementInfo", ["fingerprint", "type", "tables"])
+
+# What an alias (or an unaliased table name) stands for in a scope
+#   table: dotted table name as written, None for subqueries and CTEs
+#   columns: output column names of a subquery or CTE, empty for tables
+AliasTarget = namedtuple("AliasTarget", ["table", "columns"])
+
+# Statement types that change data or schema and so invalidate cached reads
+WRITE_TYPES = frozenset([
+    "INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "REPLACE",
+    "CREATE", "CREATE OR REPLACE", "DROP", "ALTER", "TRUNCATE", "RENAME",
+])
+
+# Keywords followed by a table name
+_TABLE_KEYWORDS = frozenset(["FROM", "INTO", "UPDATE", "TABLE", "USING", "TRUNCATE"])
+_SKIP_BEFORE_TABLE = frozenset(["IF", "NOT", "EXISTS", "ONLY"])
+_QUOTES = '"`[]'
+
+
+def _is_name(ttype):
+    return ttype in T.Name or ttype is T.String.Symbol
+
+
+def _unquote(value):
+    return value.strip(_QUOTES).lower()
+
+
+def analyze_statement(query):
+    """Fingerprint, type and referenced tables of one statement from its token stream
+
+    Only the lexer runs, no grouping passes, so this is cheap enough to run
+    for every executed statement.
+    """
+    significant = []
+    for ttype, value in lexer.tokenize(query):
+        if ttype in T.Whitespace or ttype in T.Comment or ttype is T.Text:
+            continue
+        if ttype is T.Punctuation and value == ";":
+            continue
+        significant.append((ttype, value))
+
+    parts = []
+    statement_type = "UNKNOWN"
+    for ttype, value in significant:
+        if ttype in T.Keyword:
+            value = " ".join(value.upper().split())
+            if statement_type == "UNKNOWN" and (ttype in T.Keyword.DML or ttype in T.Keyword.DDL or value == "TRUNCATE"):
+                statement_type = value
+        elif ttype in T.Name:
+            value = value.lower()
+        parts.append(value)
+
+    return StatementInfo(" ".join(parts), statement_type, _referenced_tables(significant))
+
+
+def write_tables(query):
+    """Lower-cased, unquoted name of the table a DML/DDL statement writes, in a list
+
+    The name is the first one after INTO / UPDATE / TABLE / FROM ... outside
+    parentheses, so the CTEs of a WITH are passed over. Tokens are lexed
+    lazily and reading stops after that name, a multi-MB INSERT costs a few
+    tokens. Empty when no name is found.
+    """
+    parts = []
+    dot = False
+    table_next = False
+    depth = 0
+    for ttype, value in lexer.tokenize(query):
+        if ttype in T.Whitespace or ttype in T.Comment or ttype is T.Text:
+            continue
+        if parts:
+            # db.schema.table
+            if value == "." and not dot:
+                dot = True
+            elif dot and _is_name(ttype):
+                parts.append(_unquote(value))
+                dot = False
+            else:
+                break
+        elif ttype is T.Punctuation and value in "()":
+            depth += 1 if value == "(" else -1
+            table_next = False
+        elif depth:
+            continue
+        elif ttype in T.Keyword:
+            keyword = " ".join(value.upper().split())
+            if keyword in _TABLE_KEYWORDS:
+                table_next = True
+            elif keyword not in _SKIP_BEFORE_TABLE:
+                table_next = False
+        elif table_next and _is_name(ttype):
+            parts.append(_unquote(value))
+        else:
+            table_next = False
+    return [".".join(parts)] if parts else []
+
+
+def _referenced_tables(significant):
+    """Qualified names following FROM / JOIN / INTO / UPDATE / TABLE ..."""
+    tables = []
+    i = 0
+    n = len(significant)
+    while i < n:
+        ttype, value = significant[i]
+        keyword = " ".join(value.upper().split()) if ttype in T.Keyword else None
+        i += 1
+        if keyword is None or not (keyword in _TABLE_KEYWORDS or keyword.endswith("JOIN")):
+            continue
+
+        while True:
+            while i < n and significant[i][0] in T.Keyword and significant[i][1].upper() in _SKIP_BEFORE_TABLE:
+                i += 1
+            if i >= n or not _is_name(significant[i][0]):
+                break
+            name = [_unquote(significant[i][1])]
+            i += 1
+            while i + 1 < n and significant[i][1] == "." and _is_name(significant[i + 1][0]):
+                name.append(_unquote(significant[i + 1][1]))
+                i += 2
+            tables.append(".".join(name))
+
+            # FROM a x, b y: skip the alias and keep reading after a comma
+            if keyword != "FROM":
+                break
+            if i < n and significant[i][0] in T.Keyword and significant[i][1].upper() == "AS":
+                i += 1
+            if i < n and _is_name(significant[i][0]):
+                i += 1
+            if i < n and significant[i][1] == ",":
+                i += 1
+                continue
+            break
+    return tables
+
+
+class ClassifiedStatement:
+    """Statement whose type is read from its first tokens, parsed only on demand
+
+    ``get_type`` gives the same answer as ``sqlparse.parse(text)[0].get_type()``
+    from the lexer alone: it stops at the first DML/DDL keyword (after the
+    CTEs of a WITH), so a multi-MB INSERT costs a few tokens. ``tree`` runs
+    the full parse the first time it is read.
+    """
+
+    __slots__ = ("text", "_type", "_tree")
+
+    def __init__(self, text, statement_type):
+        self.text = text
+        self._type = statement_type
+        self._tree = None
+
+    def get_type(self):
+        return self._type
+
+    @property
+    def is_write(self):
+        """Whether the statement changes data or schema, see WRITE_TYPES
+
+        TRUNCATE and RENAME have no DML/DDL type, for an UNKNOWN statement
+        the first keyword is read too.
+        """
+        statement_type = self._type
+        if statement_type == "UNKNOWN":
+            statement_type = _first_keyword(lexer.tokenize(self.text))
+        return " ".join(statement_type.split()) in WRITE_TYPES
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = sqlparse.parse(self.text)[0]
+        return self._tree
+
+
+# digest of a statement -> its type, see classify_statement
+_types = OrderedDict()
+_types_lock = threading.Lock()
+TYPE_CACHE_SIZE = 1024
+
+
+def classify_statement(query):
+    """ClassifiedStatement of ``query``, types are memoized by statement hash"""
+    key = hashlib.blake2b(query.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _types_lock:
+        statement_type = _types.get(key)
+        if statement_type is not None:
+            _types.move_to_end(key)
+    if statement_type is None:
+        statement_type = _first_statement_type(lexer.tokenize(query))
+        with _types_lock:
+            _types[key] = statement_type
+            while len(_types) > TYPE_CACHE_SIZE:
+                _types.popitem(last=False)
+    return ClassifiedStatement(query, statement_type)
+
+
+def _first_statement_type(stream):
+    for ttype, value in stream:
+        if ttype in T.Whitespace or ttype in T.Comment:
+            continue
+        if ttype in (T.Keyword.DML, T.Keyword.DDL):
+            return value.upper()
+        if ttype == T.Keyword.CTE:
+            return _type_after_ctes(stream)
+        return "UNKNOWN"
+    return "UNKNOWN"
+
+
+def _first_keyword(stream):
+    for ttype, value in stream:
+        if ttype in T.Whitespace or ttype in T.Comment:
+            continue
+        return value.upper() if ttype in T.Keyword else ""
+    return ""
+
+
+def _type_after_ctes(stream):
+    # WITH name [(cols)] AS (...) [, ...] followed by the DML keyword
+    depth = 0
+    seen_name = False
+    for ttype, value in stream:
+        if ttype in T.Whitespace or ttype in T.Comment:
+            continue
+        if ttype is T.Punctuation and value in "()":
+            depth += 1 if value == "(" else -1
+            continue
+        if depth:
+            continue
+        if ttype in T.Name or ttype is T.String.Symbol:
+            seen_name = True
+            continue
+        if (ttype is T.Punctuation and value == ",") or (ttype is T.Keyword and value.upper() == "AS"):
+            continue
+        if ttype == T.Keyword.DML and seen_name:
+            return value.upper()
+        return "UNKNOWN"
+    return "UNKNOWN"
+
+
+class StatementScopes:
+    """Alias maps of every SELECT scope of a statement
+
+    ``scopes`` holds (start, end, {alias: AliasTarget}) per scope, outer
+    scopes before the ones nested in them, offsets relative to the text
+    given to parse_scopes.
+    """
+
+    def __init__(self, scopes):
+        self.scopes = scopes
+
+    def aliases_at(self, pos):
+        """Aliases visible at ``pos``, an inner scope hides the same alias of an outer one"""
+        aliases = {}
+        for start, end, scope_aliases in self.scopes:
+            if start <= pos <= end:
+                aliases.update(scope_aliases)
+        return aliases
+
+
+@functools.lru_cache(maxsize=128)
+def parse_scopes(text):
+    """StatementScopes of ``text``, memoized so an unchanged statement is parsed once
+
+    Built on the sqlparse grouping: FROM / JOIN identifiers give tables and
+    their aliases (with or without AS), a parenthesis holding a SELECT opens
+    a nested scope, and subqueries and CTEs map to their output columns.
+    """
+    scopes = []
+    ctes = {}
+    offset = 0
+    for statement in sqlparse.parse(text):
+        _walk_scope(statement, offset, scopes, ctes)
+        offset += len(statement.value)
+    return StatementScopes(scopes)
+
+
+def _children(tokenlist, start):
+    for token in tokenlist.tokens:
+        yield token, start
+        start += len(token.value)
+
+
+def _is_subquery(token):
+    return isinstance(token, sql.Parenthesis) and any(
+        child.ttype is T.DML and child.normalized == "SELECT" for child in token.tokens
+    )
+
+
+def _walk_scope(tokenlist, start, scopes, ctes):
+    aliases = {}
+    scopes.append((start, start + len(tokenlist.value), aliases))
+    expect = None  # "table" after FROM / JOIN, "cte" after WITH
+    for token, token_start in _children(tokenlist, start):
+        if token.is_whitespace or token.ttype in T.Comment or isinstance(token, sql.Comment):
+            continue
+        if token.ttype is T.Keyword.CTE:
+            expect = "cte"
+            continue
+        if token.is_keyword:
+            expect = "table" if token.normalized == "FROM" or token.normalized.endswith("JOIN") else None
+            continue
+        if expect is not None and isinstance(token, (sql.Identifier, sql.IdentifierList)):
+            for ident, ident_start in _identifiers(token, token_start):
+                if expect == "cte":
+                    _add_cte(ident, ident_start, scopes, ctes)
+                else:
+                    _add_table(ident, ident_start, aliases, scopes, ctes)
+            if expect == "table":
+                expect = None
+            continue
+        if token.is_group:
+            _walk_group(token, token_start, scopes, ctes)
+
+
+def _walk_group(group, start, scopes, ctes):
+    # Look for subqueries anywhere else: select list, WHERE, ON ...
+    if _is_subquery(group):
+        _walk_scope(group, start, scopes, ctes)
+        return
+    for token, token_start in _children(group, start):
+        if token.is_group:
+            _walk_group(token, token_start, scopes, ctes)
+
+
+def _identifiers(token, start):
+    if isinstance(token, sql.Identifier):
+        yield token, start
+        return
+    for child, child_start in _children(token, start):
+        if isinstance(child, sql.Identifier):
+            yield child, child_start
+
+
+def _qualified_name(ident):
+    """db.schema.table part of a FROM identifier, without its alias"""
+    parts = []
+    for token in ident.tokens:
+        if token.ttype in T.Name or token.ttype is T.String.Symbol:
+            parts.append(token.value.strip(_QUOTES))
+        elif not token.match(T.Punctuation, "."):
+            break
+    return ".".join(parts)
+
+
+def _output_columns(paren):
+    """Column names a parenthesized SELECT returns, * and unnamed expressions are skipped"""
+    tokens = [token for token in paren.tokens if not token.is_whitespace]
+    for i, token in enumerate(tokens):
+        if token.ttype is T.DML and token.normalized == "SELECT":
+            break
+    else:
+        return ()
+    columns = []
+    for token in tokens[i + 1:]:
+        if token.is_keyword and token.normalized in ("DISTINCT", "ALL", "TOP"):
+            continue
+        if isinstance(token, sql.IdentifierList):
+            items = token.get_identifiers()
+        elif isinstance(token, (sql.Identifier, sql.Function)) or token.ttype in T.Name:
+            items = [token]
+        else:
+            break
+        for item in items:
+            if isinstance(item, sql.Identifier) and item.is_wildcard():
+                continue
+            name = item.get_name() if isinstance(item, (sql.Identifier, sql.Function)) else item.value
+            if name and (item.ttype in T.Name or isinstance(item, (sql.Identifier, sql.Function))):
+                columns.append(name)
+        break
+    return tuple(columns)
+
+
+def _add_table(ident, start, aliases, scopes, ctes):
+    first = ident.token_first()
+    if isinstance(first, sql.Parenthesis):
+        for token, token_start in _children(ident, start):
+            if token is first:
+                _walk_scope(first, token_start, scopes, ctes)
+        alias = ident.get_alias()
+        if alias:
+            aliases[alias] = AliasTarget(None, _output_columns(first))
+        return
+    name = _qualified_name(ident)
+    if not name:
+        return
+    # an unaliased table is qualified by its own name
+    alias = ident.get_alias() or name.rsplit(".", 1)[-1]
+    if "." not in name and name.lower() in ctes:
+        aliases[alias] = ctes[name.lower()]
+    else:
+        aliases[alias] = AliasTarget(name, ())
+
+
+def _add_cte(ident, start, scopes, ctes):
+    name = ident.token_first()
+    for token, token_start in _children(ident, start):
+        if _is_subquery(token):
+            _walk_scope(token, token_start, scopes, ctes)
+            ctes[name.value.lower()] = AliasTarget(None, _output_columns(token))
+            return
@@ -0,0 +1,280 @@
+import csv
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+from datetime import date, datetime
+
+
+# Upload options, read from the optional ``upload`` block of the DBMS setting
+DEFAULT_OPTIONS = {
+    "batch_size": 10000,
+    "parallel_writers": 2,
+    "fast_executemany": True,
+    "sample_rows": 1000,
+    "create_table": True,
+    "encoding": "utf-8-sig",
+    "type_map": {
+        "integer": "BIGINT",
+        "float": "FLOAT",
+        "date": "DATE",
+        "timestamp": "TIMESTAMP",
+        "text": "VARCHAR({length})",
+    },
+    # Statements that load the whole file server side instead of row inserts,
+    # {path} is the CSV path with forward slashes and {table} the target table
+    "fast_path": False,
+    "fast_path_statements": [],
+}
+
+# Column kinds from the most to the least specific, text accepts anything
+_KINDS = ("integer", "float", "date", "timestamp", "text")
+
+
+def _int64(value):
+    number = int(value)
+    if not -2 ** 63 <= number < 2 ** 63:
+        raise ValueError(f"{value} does not fit BIGINT")
+    return number
+
+
+_CONVERTERS = {
+    "integer": _int64,
+    "float": float,
+    "date": date.fromisoformat,
+    "timestamp": datetime.fromisoformat,
+    "text": str,
+}
+
+
+def upload_options(db_config):
+    """DEFAULT_OPTIONS overlaid with the ``upload`` block of a DBMS setting"""
+    options = dict(DEFAULT_OPTIONS)
+    configured = db_config.get("upload", {})
+    options.update(configured)
+    options["type_map"] = dict(DEFAULT_OPTIONS["type_map"], **configured.get("type_map", {}))
+    return options
+
+
+def sanitize_column(name, idx):
+    """Header cell turned into a plain identifier, col_<n> when nothing is left"""
+    name = re.sub(r"\W+", "_", name.strip()).strip("_")
+    if not name:
+        return f"col_{idx + 1}"
+    return f"_{name}" if name[0].isdigit() else name
+
+
+def _fits(kind, value):
+    try:
+        _CONVERTERS[kind](value)
+        return True
+    except ValueError:
+        return False
+
+
+def infer_column_types(header, sample_rows):
+    """(name, kind, max_length) per column, kind is the most specific one every sampled value fits"""
+    columns = []
+    for idx, name in enumerate(header):
+        values = [row[idx] for row in sample_rows if idx < len(row) and row[idx] != ""]
+        kind = "text"
+        if values:
+            kind = next(k for k in _KINDS if k == "text" or all(_fits(k, v) for v in values))
+        max_length = max((len(v) for v in values), default=0)
+        columns.append((sanitize_column(name, idx), kind, max_length))
+    return columns
+
+
+def create_table_sql(table, columns, type_map):
+    """CREATE TABLE statement for inferred columns, text length leaves room for longer values"""
+    definitions = []
+    for name, kind, max_length in columns:
+        length = min(max(max_length * 2, 255), 4000)
+        definitions.append(f"{name} {type_map[kind].format(length=length)}")
+    return f"CREATE TABLE {table} ({', '.join(definitions)})"
+
+
+def _converter(kind):
+    convert = _CONVERTERS[kind]
+
+    def to_param(value):
+        if value == "":
+            return None
+        try:
+            return convert(value)
+        except ValueError:
+            # Outside the sample the column held something else, let the driver judge
+            return value
+    return to_param
+
+
+def _checked_rows(reader, width):
+    """Rows of a csv ``reader``, skipping blank lines
+
+    Raises ValueError with the line number on a row that doesn't have
+    ``width`` fields, like the header.
+    """
+    for row in reader:
+        if not row:
+            continue
+        if len(row) != width:
+            raise ValueError(f"Line {reader.line_num} has {len(row)} fields, the header has {width}")
+        yield row
+
+
+class CsvUploader:
+    """Load a CSV file into a table over pooled connections
+
+    The file is read in ``batch_size`` row chunks. Column types are inferred
+    from the first ``sample_rows`` rows, and the table is created from them
+    when it doesn't exist and ``create_table`` is set. Chunks go through a
+    bounded queue to ``parallel_writers`` writer threads. Each writer holds
+    its own pooled connection and inserts with ``executemany``
+    (``fast_executemany`` when set), committing after every chunk. With
+    ``fast_path`` the configured server side statements (PUT/COPY, BULK
+    INSERT) load the file instead.
+
+    ``progress(rows, elapsed)`` is called as chunks are committed.
+    """
+
+    def __init__(self, path, table, pool, options=None, progress=None, token=None):
+        self.path = path
+        self.table = table
+        self.pool = pool
+        self.options = options if options is not None else upload_options(pool.db_config)
+        self.progress = progress
+        self.token = token
+        self.rows = 0
+        self.columns = []
+        self._lock = threading.Lock()
+        self._errors = []
+
+    def _cancelled(self):
+        return self.token is not None and self.token.cancelled
+
+    def _table_exists(self, connection):
+        try:
+            connection.cursor().execute(f"SELECT * FROM {self.table} WHERE 1 = 0").close()
+            return True
+        except Exception:
+            connection.rollback()
+            return False
+
+    def _prepare_table(self, header, sample):
+        self.columns = infer_column_types(header, sample)
+        connection = self.pool.acquire()
+        discard = True
+        try:
+            if self._table_exists(connection):
+                discard = False
+                return False
+            if not self.options["create_table"]:
+                raise ValueError(f"Table {self.table} does not exist and create_table is off")
+            ddl = create_table_sql(self.table, self.columns, self.options["type_map"])
+            print(ddl)
+            connection.cursor().execute(ddl).close()
+            connection.commit()
+            discard = False
+            return True
+        finally:
+            self.pool.release(connection, discard=discard)
+
+    def run(self):
+        """Load the file, return (rows, created) where created tells if the table was created
+
+        The rows count is -1 when a fast path loaded the file.
+        """
+        self.start = time.time()
+        with open(self.path, "r", newline="", encoding=self.options["encoding"]) as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = _checked_rows(reader, len(header))
+            sample = list(itertools.islice(rows, self.options["sample_rows"]))
+            created = self._prepare_table(header, sample)
+            if self.options["fast_path"] and self.options["fast_path_statements"]:
+                self._run_fast_path()
+                return -1, created
+            self._insert_rows(itertools.chain(sample, rows))
+        return self.rows, created
+
+    def _run_fast_path(self):
+        connection = self.pool.acquire()
+        cursor = connection.cursor()
+        discard = True
+        try:
+            if self.token is not None:
+                self.token.attach(cursor)
+            for statement in self.options["fast_path_statements"]:
+                if self._cancelled():
+                    return
+                statement = statement.format(
+                    path=os.path.abspath(self.path).replace("\\", "/"), table=self.table
+                )
+                print(statement)
+                cursor.execute(statement)
+            connection.commit()
+            discard = False
+        finally:
+            if self.token is not None:
+                self.token.detach()
+            self.pool.release(connection, discard=discard)
+
+    def _insert_rows(self, rows):
+        converters = [_converter(kind) for _, kind, _ in self.columns]
+        placeholders = ", ".join("?" for _ in self.columns)
+        insert_sql = f"INSERT INTO {self.table} VALUES ({placeholders})"
+        writers = max(1, min(self.options["parallel_writers"], self.pool.max_size))
+        pending = queue.Queue(maxsize=writers * 2)
+
+        threads = [
+            threading.Thread(target=self._writer, args=[pending, insert_sql], name=f"csv_upload_writer_{idx}")
+            for idx in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._errors and not self._cancelled():
+                chunk = list(itertools.islice(rows, self.options["batch_size"]))
+                if not chunk:
+                    break
+                pending.put([
+                    [convert(value) for convert, value in zip(converters, row)]
+                    for row in chunk
+                ])
+        finally:
+            for _ in threads:
+                pending.put(None)
+            for thread in threads:
+                thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _writer(self, pending, insert_sql):
+        connection = None
+        try:
+            connection = self.pool.acquire()
+            cursor = connection.cursor()
+            cursor.fast_executemany = self.options["fast_executemany"]
+        except Exception as e:
+            self._errors.append(e)
+        while True:
+            batch = pending.get()
+            if batch is None:
+                break
+            if self._errors or self._cancelled():
+                continue  # keep draining so the reader never blocks
+            try:
+                cursor.executemany(insert_sql, batch)
+                connection.commit()
+            except Exception as e:
+                self._errors.append(e)
+                continue
+            with self._lock:
+                self.rows += len(batch)
+                rows = self.rows
+            if self.progress is not None:
+                self.progress(rows, time.time() - self.start)
+        if connection is not None:
+            self.pool.release(connection, discard=bool(self._errors))
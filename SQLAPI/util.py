@@ -4,12 +4,42 @@ import json
 import sublime
 import sys
 import re
-
-# Regular expression for comments
-comment_re = re.compile(
-    '(^)?[^\S\n]*/(?:\*(.*?)\*/[^\S\n]*|/[^\n]*)($)?',
-    re.DOTALL | re.MULTILINE
-)
+import threading
+
+# Merged settings per (user file, default file), see SettingsManager.get_all
+_settings_cache = {}
+_settings_lock = threading.Lock()
+
+# Paths returned by load_package_path, resolved once per process
+_package_paths = None
+
+
+def strip_json_comments(content):
+    """Remove // and /* */ comments in a single pass, leaving strings untouched"""
+    out = []
+    i = 0
+    start = 0
+    n = len(content)
+    while i < n:
+        char = content[i]
+        if char == '"':
+            # Skip over the string, honouring escaped characters
+            i += 1
+            while i < n and content[i] != '"':
+                i += 2 if content[i] == '\\' else 1
+            i += 1
+        elif char == '/' and i + 1 < n and content[i + 1] == '/':
+            out.append(content[start:i])
+            end = content.find('\n', i)
+            i = start = n if end == -1 else end
+        elif char == '/' and i + 1 < n and content[i + 1] == '*':
+            out.append(content[start:i])
+            end = content.find('*/', i + 2)
+            i = start = n if end == -1 else end + 2
+        else:
+            i += 1
+    out.append(content[start:])
+    return ''.join(out)
 
 
 def parse_json(filename):
@@ -23,14 +53,10 @@ def parse_json(filename):
         */
     """
     with open(filename, mode='r', encoding='utf-8') as f:
-        content = ''.join(f.readlines())
+        content = f.read()
 
-        # Looking for comments
-        match = comment_re.search(content)
-        while match:
-            # single line comment
-            content = content[:match.start()] + content[match.end():]
-            match = comment_re.search(content)
+        # Remove comments
+        content = strip_json_comments(content)
 
         # remove trailing commas
         content = re.sub(r',([ \t\r\n]+)}', r'\1}', content)
@@ -67,14 +93,29 @@ def merge_dict(source, destination):
     return destination
 
 
+def _file_signature(filename):
+    """(mtime, size) of a file, None when it does not exist"""
+    if not filename:
+        return None
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
 class SettingsManager:
-    """Manages user and default settings with automatic merging"""
+    """Manages user and default settings with automatic merging
+
+    The merged settings are parsed once and shared by every manager for the
+    same pair of files. They are re-read when either file changes mtime or
+    size, or after ``update``. Treat the returned dict as read-only.
+    """
     
     def __init__(self, user_filename, default_filename=None):
         self.user_filename = user_filename
         self.default_filename = default_filename
         self.items = {}
-        self._load_all()
 
     def _load_all(self):
         """Load and merge user and default settings"""
@@ -99,9 +140,22 @@ class SettingsManager:
                 return {}
         return {}
 
+    def _signature(self):
+        return _file_signature(self.user_filename), _file_signature(self.default_filename)
+
     def get_all(self):
-        """Get all settings (merged user + default)"""
-        return self._load_all()
+        """Get all settings (merged user + default), cached until a file changes"""
+        key = (self.user_filename, self.default_filename)
+        signature = self._signature()
+        with _settings_lock:
+            cached = _settings_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        settings = self._load_all()
+        with _settings_lock:
+            _settings_cache[key] = (signature, settings)
+        return settings
 
     def get(self, key, default=None):
         """Get a specific setting value"""
@@ -110,8 +164,14 @@ class SettingsManager:
 
     def update(self, key, value):
         """Update a setting and save to user file"""
+        if os.path.exists(self.user_filename):
+            try:
+                self.items = parse_json(self.user_filename)
+            except Exception:
+                self.items = {}
         self.items[key] = value
         self._save()
+        invalidate_settings(self.user_filename)
 
     def _save(self):
         """Save current items to user settings file"""
@@ -120,7 +180,20 @@ class SettingsManager:
         save_json(self.items, self.user_filename)
 
 
+def invalidate_settings(filename=None):
+    """Forget cached settings read from ``filename``, or all cached settings"""
+    with _settings_lock:
+        for key in list(_settings_cache):
+            if filename is None or filename in key:
+                del _settings_cache[key]
+
+
 def load_package_path():
+    """Resolve plugin paths, put lib on sys.path and chdir once per process"""
+    global _package_paths
+    if _package_paths is not None:
+        return _package_paths
+
     package_path = sublime.packages_path()
     package_name = "SQLOdbc"
 
@@ -136,7 +209,8 @@ def load_package_path():
         sys.path.append(lib_path)
         sys.path.append(project_path)
     os.chdir(project_path)
-    return cache_path, lib_path, project_path, metastore_path, user_path
+    _package_paths = cache_path, lib_path, project_path, metastore_path, user_path
+    return _package_paths
 
 
 def crypt(string, encoding="ascii", encode=True):
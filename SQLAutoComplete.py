@@ -1,9 +1,9 @@
 import sublime_plugin
 import sublime
-import os
-import json
 from SQLAPI.util import load_package_path,load_settings  
-import re 
+from SQLAPI.metastore import load_group_completions
+from SQLAPI.completion import StatementIndex
+from SQLAPI.statement import parse_scopes
 
 
 
@@ -11,37 +11,59 @@ cache_path, lib_path, plugin_path, js_path, user_path = load_package_path()
 
 # do we need to lower the completion column?
 
+# buffer id -> StatementIndex, built on the first completion in a buffer
+statement_indexes = {}
 
 
+class StatementIndexListener(sublime_plugin.TextChangeListener):
+    """Keeps the statement index of the buffer in step with every edit
+
+    on_modified doesn't say what changed, the text changes here do, so the
+    index is patched instead of searching the whole buffer again.
+    """
+
+    def on_text_changed(self, changes):
+        index = statement_indexes.get(self.buffer.id())
+        if index is None:
+            return
+        for change in changes:
+            index.apply(change.a.pt, change.b.pt, change.str)
+        view = self.buffer.primary_view()
+        if view is not None:
+            index.change_count = view.change_count()
+
 
 class EventListener(sublime_plugin.EventListener):
+    def on_close(self, view):
+        if not view.clones():
+            statement_indexes.pop(view.buffer_id(), None)
+
     def on_query_completions(self, view, prefix, locations):
         syntax = view.settings().get("syntax")
         # only trigger when the syntax is snowflake
 
         if syntax == "Packages/SQL/SQL.sublime-syntax":
-            content = self.get_single_cursor_content(view)
             prev_words = self.get_multi_cursor_pre_word(view)
-            alias_dict = self.find_alias(content)
+            alias_dict = self.get_statement_aliases(view)
             
             
             self.completions = []
             print("prev_words: ", prev_words)
-            print("content: ", content)
             print("alias_dict: ", alias_dict)
 
             if len(prev_words) == 0:
-                self.fill_db()
+                self.fill_db("")
 
             for w in prev_words:
                 ct = w.count(".")
                 # db level
                 if ct == 0:
-                    self.fill_db()
+                    self.fill_db(w)
+                    self.fill_any_column(w)
                 elif ct == 1:
                     print("fill schema")
                     self.fill_schema(w)
-                    self.fill_alias(alias_dict)
+                    self.fill_alias(w, alias_dict)
                 elif ct == 2:
                     self.fill_table(w)
                 elif ct == 3:
@@ -49,42 +71,21 @@ class EventListener(sublime_plugin.EventListener):
 
             return (self.completions, sublime.INHIBIT_WORD_COMPLETIONS)
 
-    # TODO: 就近分配原则
-    def find_alias(self, content):
-        alias_dict = {}
-        pattern1 = r"from\s+(\S+)\s+as\s+(\w+)"
-        matches1 = re.findall(pattern1, content, re.IGNORECASE)
-
-        for match in matches1:
-            tbl, alias = match
-            alias_dict[alias] = tbl
-
-        pattern2 = r"join\s+(\S+)\s+as\s+(\w+)"
-        matches2 = re.findall(pattern2, content, re.IGNORECASE)
-
-        for match in matches2:
-            tbl, alias = match
-            alias_dict[alias] = tbl
-        return alias_dict
-
-    def fill_alias(self, alias_dict):
+    def fill_alias(self, w, alias_dict):
         if alias_dict:
-            db_schema_tbl_col = self.load_js("db-schema-tbl-col")
+            index = self.load_index()
+            typed_alias, col_prefix = w.split(".")
 
-            for alias, tbl in alias_dict.items():
-                if tbl.count(".") != 2:
+            for alias, target in alias_dict.items():
+                if alias.lower() != typed_alias.lower():
                     continue
-                db, schema, tbl = tbl.split(".")
-                if (
-                    db_schema_tbl_col.get(db)
-                    and schema in db_schema_tbl_col.get(db)
-                    and tbl in db_schema_tbl_col.get(db).get(schema)
-                ):
-                    cols = db_schema_tbl_col[db][schema][tbl]
-                    for col, dtype in cols.items():
-                        txt_show = alias + "." + col + "\t" + dtype
-                        txt_fill = alias + "." + col
-                        self.completions.append((txt_show, txt_fill))
+                if target.table is not None and target.table.count(".") == 2:
+                    db, schema, tbl = target.table.split(".")
+                    self.completions.extend(index.alias_columns(alias, db, schema, tbl, col_prefix))
+                # subquery or CTE, complete the columns it returns
+                for col in target.columns:
+                    if col.lower().startswith(col_prefix.lower()):
+                        self.completions.append((alias + "." + col + "\tderived", alias + "." + col))
 
     def get_multi_cursor_pre_word(self, view):
         input_cursor_word = []
@@ -96,103 +97,55 @@ class EventListener(sublime_plugin.EventListener):
 
         return input_cursor_word
 
-    def fill_db(self):
-        db_schema = self.load_js("db-schema")
-        for db in db_schema:
-            txt_show = db + "\tdatabase"
-            txt_fill = db
-            self.completions.append((txt_show, txt_fill))
+    # every fill_* only returns the entries starting with the last typed part
+    def fill_db(self, w):
+        self.completions.extend(self.load_index().databases(w))
 
     def fill_schema(self, w):
-        db_schema = self.load_js("db-schema")
         db, schema = w.split(".")
-        schemas = db_schema.get(db)
-        if schemas:
-            for s in schemas:
-                txt_show = s + "\tschema"
-                txt_fill = s
-                self.completions.append((txt_show, txt_fill))
-
-    # temporarily try query method
+        self.completions.extend(self.load_index().schemas(db, schema))
+
     def fill_table(self, w):
-        db_schema_tbl = self.load_js("db-schema-tbl")
-        db, schema, _ = w.split(".")
-        if db_schema_tbl.get(db) and schema in db_schema_tbl.get(db):
-            tbls = db_schema_tbl[db][schema]
-            for r in tbls:
-                txt_show = r + "\ttable"
-                txt_fill = r
-                self.completions.append((txt_show, txt_fill))
+        db, schema, tbl = w.split(".")
+        self.completions.extend(self.load_index().tables(db, schema, tbl))
 
     def fill_column(self, w):
-        db_schema_tbl_col = self.load_js("db-schema-tbl-col")
-        db, schema, tbl, _ = w.split(".")
-        if (
-            db_schema_tbl_col.get(db)
-            and schema in db_schema_tbl_col.get(db)
-            and tbl in db_schema_tbl_col.get(db).get(schema)
-        ):
-            cols = db_schema_tbl_col[db][schema][tbl]
-            expand_cols = ",".join([f"a.{c}" for c in cols])
-
-            special_txt_show1 = db + "." + schema + "." + tbl + "." + "*" + "\t" + "all"
-            special_txt_show2 = (
-                db + "." + schema + "." + tbl + "." + "-" + "\t" + "expand"
-            )
-            special_txt_show3 = (
-                db + "." + schema + "." + tbl + "." + "Count(*)" + "\t" + "cnt"
-            )
-
-            special_txt_fill1 = f"SELECT a.*$0 FROM {db}.{schema}.{tbl} as a;"
-            special_txt_fill2 = f"SELECT $0{expand_cols} FROM {db}.{schema}.{tbl} as a;"
-            special_txt_fill3 = f"SELECT $0COUNT(*) FROM {db}.{schema}.{tbl} as a;"
-
-            # TO DO: fuzzy fill all
-
-            self.completions = [
-                (special_txt_show1, special_txt_fill1),
-                (special_txt_show2, special_txt_fill2),
-                (special_txt_show3, special_txt_fill3),
-            ]
-
-            for col, dtype in cols.items():
-                txt_show = db + "." + schema + "." + tbl + "." + col + "\t" + dtype
-                txt_fill = f"SELECT a.{col}$0 FROM {db}.{schema}.{tbl} as a;"
-                self.completions.append((txt_show, txt_fill))
-
-    # mainly for alias mapping
-    def get_single_cursor_content(self, view):
-        cursors = view.sel()
-        semicolon = list(map(lambda x: x.begin(), view.find_all(";")))
-
-        if len(semicolon) == 0:
-            start, end = 0, view.size()
-        elif len(semicolon) == 1 and len(cursors) == 1:
-            cursor = cursors[0]
-            if cursor.a <= semicolon[0]:
-                start, end = 0, semicolon[0]
-            else:
-                start, end = semicolon[0], view.size()
-        elif len(semicolon) > 1 and len(cursors) == 1:
-            cursor = cursors[0]
-            lst = list(sorted(semicolon + [0, cursor.a, view.size()]))
-            idx = lst.index(cursor.a)
-            pre_idx = max(0, idx - 1)
-            post_idx = min(len(lst) - 1, idx + 1)
-            start, end = lst[pre_idx], lst[post_idx]
-        else:
-            return
-        content = view.substr(sublime.Region(start, end))
-        content = content.replace(";", "")
-        return content
-
-    def load_js(self, file):
+        db, schema, tbl, col = w.split(".")
+        index = self.load_index()
+        snippets = index.table_snippets(db, schema, tbl)
+        if snippets:
+            self.completions = snippets + index.columns(db, schema, tbl, col)
 
-        current_selection = load_settings(get_cur_selection_only=True)
-        current_dbms = load_settings(get_cur_dbms_only=True)
+    # bare column names of every table in the group, fuzzy matched
+    def fill_any_column(self, w):
+        self.completions.extend(self.load_index().search_columns(w))
 
-        auto_completion_path = os.path.join(js_path, current_dbms, current_selection, f"{file}.json")
-
-        with open(auto_completion_path, "r") as f:
-            schema = json.loads(f.read())
-        return schema
+    # mainly for alias mapping
+    def get_statement_index(self, view):
+        index = statement_indexes.get(view.buffer_id())
+        if index is None or index.change_count != view.change_count():
+            # first completion in the buffer, or edits the listener didn't see
+            semicolon = [region.begin() for region in view.find_all(";")]
+            index = StatementIndex(semicolon, view.size(), view.change_count())
+            statement_indexes[view.buffer_id()] = index
+        return index
+
+    def get_statement_aliases(self, view):
+        """Aliases in scope at the first cursor, the statement is parsed again only once edited"""
+        index = self.get_statement_index(view)
+        pos = view.sel()[0].a
+        idx, start, end = index.segment(pos)
+
+        def build():
+            # the leading semicolon is blanked, not removed, to keep the offsets
+            content = view.substr(sublime.Region(start, end))
+            return parse_scopes(content.replace(";", " "))
+        return index.parsed(idx, build).aliases_at(pos - start)
+
+    def load_index(self):
+
+        settings = load_settings()
+        current_selection = settings.get("current_selection", "")
+        current_dbms = settings.get("current_dbms", "")
+
+        return load_group_completions(js_path, current_dbms, current_selection)
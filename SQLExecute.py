@@ -1,37 +1,71 @@
 import sublime
 import sublime_plugin
 import os
-import json
 import threading
 import time
 import ctypes
-import csv
 
 
 from SQLAPI.util import load_package_path, credential_set,load_settings
-from SQLAPI.connect import ConnectorODBC
+from SQLAPI.connect import ConnectorODBC, CancelToken, QueryCancelled, close_pools, get_pool
+from SQLAPI.render import StreamingTable, column_alignments
+from SQLAPI.querycache import QueryCache
+from SQLAPI.statement import analyze_statement, classify_statement, write_tables
+from SQLAPI.scheduler import Scheduler
+from SQLAPI.export import CsvWriter, export_batches
+from SQLAPI.columnar import FORMATS, resolve_format, open_columnar_writer
+from SQLAPI.upload import CsvUploader
 from tabulate import tabulate
-import sqlparse
 
 
 # Global paths
 cache_path, lib_path, project_path, metastore_path, user_path = load_package_path()
-# Global connection object
-conn = None
+# Pool of the connected DBMS, every job borrows a connection from it on demand
+pool = None
 
-# Global thread tracking for SQL operations
-active_sql_threads = {}
+# Rendered query results, one file per query under metastore/query_cache
+query_cache = QueryCache(
+    os.path.join(metastore_path, "query_cache"),
+    max_bytes=load_settings().get("query_cache", {}).get("max_bytes", 64 * 1024 * 1024),
+)
+
+
+
+def _report_running_jobs(jobs):
+    """Status bar progress of the running SQL jobs, called by the scheduler monitor"""
+    if len(jobs) == 1:
+        sublime.status_message(f"Executing SQL query for {int(jobs[0].runtime)} seconds...")
+    else:
+        longest = max(int(job.runtime) for job in jobs)
+        sublime.status_message(f"Executing {len(jobs)} SQL queries, longest for {longest} seconds...")
+
+
+# Every so_run_sql_cmd run is a job on this scheduler, one connection slot per tab.
+# Jobs wait in the queue until the pool has a free connection for them
+_scheduler_settings = load_settings().get("scheduler", {})
+scheduler = Scheduler(
+    max_workers=_scheduler_settings.get("max_workers", 4),
+    policy=_scheduler_settings.get("policy", "fifo"),
+    on_tick=_report_running_jobs,
+)
+
+# Connector borrowed by the running SQL job
+_thread_local = threading.local()
+
+
+def current_connector():
+    """Connector borrowed by the running SQL job"""
+    return getattr(_thread_local, "conn", None)
 
 print(os.getcwd())
 
 class SoStartConn(sublime_plugin.WindowCommand):
     def run(self):
         """Initialize ODBC connection when command is triggered"""
-        global conn
         self.current_dbms = load_settings(get_cur_dbms_only=True)
         # Check if environment variables are set
         if credential_set(show_msg=False):
-            if conn is not None:
+            if pool is not None:
                 sublime.status_message("ODBC connection already established")
                 return
             
@@ -57,10 +91,14 @@ class SoStartConn(sublime_plugin.WindowCommand):
     def get_connect(self):
         """Establish connection to database"""
         try:
-            global conn
-            conn = ConnectorODBC() 
+            global pool
+            # Borrow one connection to check the server answers, then keep min_size warm
+            connected = get_pool()
+            connected.release(connected.acquire())
+            connected.warm()
+            pool = connected
             sublime.status_message(f"ODBC connection established for {self.current_dbms}")
-            print(f"Detected username and pw, Conn is set , {conn} ")
+            print(f"Detected username and pw, pool is set , {pool.dbms} ")
         finally:
             pass
 
@@ -85,184 +123,98 @@ class SoStartConn(sublime_plugin.WindowCommand):
     
 
 
-def load_cache_dict(cache_path):
-    try:
-        with open(cache_path, "r") as f:
-            file = f.read()
-    except FileNotFoundError:
-        with open(cache_path, "w") as f:
-            f.write("{}")
-        with open(cache_path, "r") as f:
-            file = f.read()
-    return json.loads(file)
-
-
-def add_result_to_cache(cache_dict, result, number_of_cache_query):
-    if len(cache_dict) < number_of_cache_query:
-        cache_dict.update(result)
-        return cache_dict
-    else:
-        cache_dict.pop(list(cache_dict.keys())[0])
-        cache_dict.update(result)
-        return cache_dict
-
-
-def stop_thread_safely(thread_obj, thread_name="Unknown"):
-    """Safely stop a thread by setting a stop flag and optionally using thread termination as last resort"""
-    if not thread_obj or not thread_obj.is_alive():
-        print(f"Thread {thread_name} is not running")
-        return False
-    
-    thread_id = thread_obj.native_id
-    print(f"Attempting to stop thread {thread_name} (ID: {thread_id})")
-    
-    # Try graceful termination first by removing from active threads
-    # This signals the thread to stop on its next check
-    if thread_id in active_sql_threads:
-        active_sql_threads[thread_id]['stop_requested'] = True
-        print(f"Stop signal sent to thread {thread_name}")
-    
-    # Wait a bit for graceful shutdown
-    thread_obj.join(timeout=2.0)
-    
-    if thread_obj.is_alive():
-        # If still alive, use the more aggressive approach as last resort
-        print(f"Thread {thread_name} still alive, using forceful termination")
-        try:
-            res = ctypes.pythonapi.PyThreadState_SetAsyncExc(
-                thread_id, ctypes.py_object(SystemExit)
-            )
-            if res > 1:
-                ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, 0)
-                print("Exception raise failure")
-                return False
-            print(f"Forcefully stopped thread {thread_name}")
-            return True
-        except Exception as e:
-            print(f"Failed to stop thread {thread_name}: {e}")
-            return False
-    else:
-        print(f"Thread {thread_name} stopped gracefully")
+def remove_legacy_cache_file():
+    """Remove the single-file cache_query.json used before QueryCache, if present"""
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
         return True
+    return False
 
 
 def cancel_database_operations():
     """Cancel any running database operations"""
-    global conn
-    if conn is not None:
-        try:
-            # Try to cancel the current operation
-            if hasattr(conn, 'cursor') and conn.cursor:
-                try:
-                    conn.cursor.cancel()
-                    print("Database operation cancelled")
-                except Exception as e:
-                    print(f"Could not cancel database operation: {e}")
-            
-            # For some ODBC drivers, we might need to close and reconnect
-            # This is handled by the connection restart functionality
-        except Exception as e:
-            print(f"Error during database operation cancellation: {e}")
-
-
-# Legacy function for backward compatibility - now uses safer approach
-def stop_thread(t1):
-    """Legacy function - use stop_thread_safely instead"""
-    if isinstance(t1, int):
-        thread_id = t1
-        # Find thread by ID
-        thread_obj = None
-        for tid, thread in threading._active.items():
-            if thread.native_id == thread_id:
-                thread_obj = thread
-                break
-        if thread_obj:
-            return stop_thread_safely(thread_obj, f"Thread-{thread_id}")
-    else:
-        return stop_thread_safely(t1, getattr(t1, 'name', 'Unknown'))
+    # Queries, exports, uploads and transposes are all jobs, each cancelled
+    # through its own token on the connection it borrowed
+    scheduler.cancel_all()
 
 
 class SoRunSqlCmd(sublime_plugin.WindowCommand):
-    def run(self, limit, number_of_cache_query, timeout, output_in_panel, queries=None):
+    def run(self, limit, number_of_cache_query, timeout, output_in_panel, queries=None,
+            stream_sample_size=1000, stream_batch_size=5000, priority=0):
         # Check if connection is available
-        if conn is not None:
+        if pool is not None:
             print(queries)
-            t1 = threading.Thread(
-                target=self._execute_sql_main,
-                args=[limit, number_of_cache_query, queries, output_in_panel],
-                name="sa_run_sql_cmd",
-            )
-            t2 = threading.Thread(
-                target=self._print_status_msg,
-                args=[t1, timeout],
-                name=f"sa_timeout_query",
+            # Capture the tab and its selection now, the job may wait in the queue
+            view = self.window.active_view()
+            queries = self._get_queries(view, queries)
+            first_line = next((q.strip() for q in queries if q.strip()), "").split("\n")[0]
+            job = scheduler.submit(
+                self._execute_sql_main,
+                args=[view, queries, limit, number_of_cache_query, output_in_panel,
+                      stream_sample_size, stream_batch_size],
+                key=view.id(),
+                description=f"{self._get_panel_name(view)}: {first_line[:60]}",
+                token=CancelToken(),
+                timeout=timeout,
+                priority=priority,
+                on_timeout=self._display_timeout_message,
+                pool=pool,
             )
-            
-            # Register threads in our tracking system
-            self._register_thread(t1, "SQL Execution")
-            self._register_thread(t2, "SQL Timeout Monitor")
-            
-            t1.start()
-            t2.start()
+            sublime.status_message(f"Queued SQL job {job.id}")
         else:
             sublime.message_dialog(
                 "Database connection not established. Please run 'Start Connection' command first."
             )
 
-    def _register_thread(self, thread_obj, description):
-        """Register a thread in the global tracking system"""
-        global active_sql_threads
-        active_sql_threads[thread_obj.native_id] = {
-            'thread': thread_obj,
-            'description': description,
-            'stop_requested': False,
-            'started_at': time.time()
-        }
-
-    def _execute_sql_main(self, limit, number_of_cache_query, queries, output_in_panel):
-        """Main SQL execution logic"""
-        current_thread_id = threading.current_thread().native_id
-        
+    def _execute_sql_main(self, job, view, queries, limit, number_of_cache_query, output_in_panel,
+                          stream_sample_size=1000, stream_batch_size=5000):
+        """Main SQL execution logic, runs as a scheduler job"""
+        connector = None
+        _thread_local.discard = False
         try:
-            view = self.window.active_view()
-            queries = self._get_queries(view, queries)
+            # The scheduler borrowed a pooled connection for the job, it goes back when the job ends
+            try:
+                connector = ConnectorODBC(pool=job.pool, connection=job.take_connection())
+            except Exception as e:
+                panel = self._setup_output_panel(output_in_panel)
+                self._display_error(panel, f"Could not get a database connection: {e}\n")
+                panel.set_read_only(True)
+                return
+            _thread_local.conn = connector
+            _thread_local.token = job.token
             panel_name = self._get_panel_name(view)
 
             for query in queries:
                 # Check if stop was requested
-                if self._should_stop_execution(current_thread_id):
+                if self._should_stop_execution():
                     print("SQL execution stopped by user request")
                     break
                     
-                if set(query) == {"\n"}:
+                if not query.strip():
                     continue
                 
-                parsed = sqlparse.parse(query)[0]
+                # Only the type is needed here, the full parse tree stays lazy
+                parsed = classify_statement(query)
                 has_limit, has_sample = self._check_query_limits(query, limit)
                 
                 panel = self._setup_output_panel(output_in_panel)
                 
                 # Handle cache logic and execution
                 self._process_query(query, panel, has_limit, has_sample, limit, 
-                                  number_of_cache_query, parsed, panel_name, output_in_panel)
+                                  number_of_cache_query, parsed, panel_name, output_in_panel,
+                                  stream_sample_size, stream_batch_size)
                 
                 panel.set_read_only(True)
         finally:
-            # Clean up thread registration
-            self._unregister_thread(current_thread_id)
-
-    def _should_stop_execution(self, thread_id):
-        """Check if the current thread should stop execution"""
-        global active_sql_threads
-        if thread_id in active_sql_threads:
-            return active_sql_threads[thread_id].get('stop_requested', False)
-        return False
-
-    def _unregister_thread(self, thread_id):
-        """Remove thread from tracking system"""
-        global active_sql_threads
-        if thread_id in active_sql_threads:
-            del active_sql_threads[thread_id]
+            _thread_local.conn = None
+            _thread_local.token = None
+            if connector is not None:
+                connector.close(discard=_thread_local.discard)
+
+    def _should_stop_execution(self):
+        """Check if the running job was cancelled or timed out"""
+        token = getattr(_thread_local, "token", None)
+        return token is not None and token.cancelled
 
     def _get_queries(self, view, queries):
         """Extract queries from view selection or parameter"""
@@ -343,17 +295,29 @@ class SoRunSqlCmd(sublime_plugin.WindowCommand):
             return f"Query Result {max_idx}"
 
     def _process_query(self, query, panel, has_limit, has_sample, limit,
-                      number_of_cache_query, parsed, panel_name, output_in_panel):
+                      number_of_cache_query, parsed, panel_name, output_in_panel,
+                      stream_sample_size=1000, stream_batch_size=5000):
         """Process a single query - check cache, execute, and display results"""
-        # Check cache first
-        cache_dict = load_cache_dict(cache_path)
-        cached_result = cache_dict.get(query)
+        # Check cache first, statements that write are never served from it
+        # nor fingerprinted, a multi-MB INSERT is only read up to its table
+        is_write = parsed.is_write
+        statement = None
+        cached_result = None
+        if not is_write:
+            statement = analyze_statement(query)
+            cached_result = query_cache.get(
+                self._cache_key(statement), ttl=pool.db_config.get("cache_ttl")
+            )
         
         if cached_result is not None:
-            self._display_cached_result(panel, cached_result, cache_dict, number_of_cache_query)
+            self._display_cached_result(panel, cached_result, number_of_cache_query)
         else:
             self._execute_and_display_query(query, panel, has_limit, has_sample, limit,
-                                           number_of_cache_query, parsed, cache_dict)
+                                           number_of_cache_query, parsed, statement,
+                                           stream_sample_size, stream_batch_size)
+        
+        if is_write:
+            self._invalidate_cache_for_write(parsed)
         
         # Show results
         if output_in_panel:
@@ -361,30 +325,37 @@ class SoRunSqlCmd(sublime_plugin.WindowCommand):
         else:
             self._append_query_info(panel, query, panel_name)
 
-    def _display_cached_result(self, panel, cached_result, cache_dict, number_of_cache_query):
+    def _display_cached_result(self, panel, cached_result, number_of_cache_query):
         """Display results from cache"""
         panel.run_command("append", {"characters": f"{cached_result}"})
         panel.run_command("append", {"characters": "\n\n\nReturn from Cache"})
         panel.run_command("append", {
-            "characters": f"\n{len(cache_dict)}/{number_of_cache_query}  (num of query in cache vs maxium cache)"
+            "characters": f"\n{len(query_cache)}/{number_of_cache_query}  (num of query in cache vs maxium cache)"
         })
 
     def _execute_and_display_query(self, query, panel, has_limit, has_sample, limit,
-                                  number_of_cache_query, parsed, cache_dict):
+                                  number_of_cache_query, parsed, statement,
+                                  stream_sample_size=1000, stream_batch_size=5000):
         """Execute query and display results"""
-        current_thread_id = threading.current_thread().native_id
         start = time.time()
         
         try:
             # Check if stop was requested before executing
-            if self._should_stop_execution(current_thread_id):
+            if self._should_stop_execution():
                 panel.run_command("append", {"characters": "Query execution cancelled by user"})
                 return
                 
-            conn.execute(query)
+            current_connector().execute(query, token=_thread_local.token)
             dur = time.time() - start
             print("query is ,", query)
             has_exec_error = False
+        except QueryCancelled as e:
+            print(e)
+            self._reset_connection()
+            panel.run_command("append", {
+                "characters": f"Query execution cancelled by user after {round(time.time() - start,2)} seconds"
+            })
+            return
         except Exception as e:
             error = e
             has_exec_error = True
@@ -395,30 +366,77 @@ class SoRunSqlCmd(sublime_plugin.WindowCommand):
             self._display_error(panel, str(error))
         else:
             self._handle_successful_execution(query, panel, has_limit, has_sample, limit,
-                                            number_of_cache_query, parsed, cache_dict, dur)
+                                            number_of_cache_query, parsed, statement, dur,
+                                            stream_sample_size, stream_batch_size)
 
     def _handle_successful_execution(self, query, panel, has_limit, has_sample, limit,
-                                   number_of_cache_query, parsed, cache_dict, dur):
+                                   number_of_cache_query, parsed, statement, dur,
+                                   stream_sample_size=1000, stream_batch_size=5000):
         """Handle successful query execution"""
-        rowcount = conn.cursor.rowcount
+        cursor = current_connector().cursor
+        rowcount = cursor.rowcount
+        streaming = has_sample or not has_limit
         
         try:
-            if has_sample or not has_limit:
-                result = conn.cursor.fetchall()
+            if streaming:
+                result = cursor.fetchmany(stream_sample_size)
             else:
-                result = conn.cursor.fetchmany(limit)
-            
-            self._display_query_results(query, panel, result, has_limit, has_sample, 
-                                      limit, number_of_cache_query, cache_dict, dur, rowcount)
-                                      
+                result = cursor.fetchmany(limit)
         except Exception as fetch_error:
+            if _thread_local.token.cancelled:
+                self._reset_connection()
+                panel.run_command("append", {"characters": "Fetch cancelled by user"})
+                return
             print(f"Fetch error: {fetch_error}")
             self._display_non_select_result(panel, parsed, dur, rowcount)
+            return
+
+        if streaming and len(result) == stream_sample_size:
+            self._stream_query_results(panel, result, stream_batch_size, dur)
+        else:
+            self._display_query_results(query, panel, result, has_limit, has_sample, 
+                                      limit, number_of_cache_query, statement, dur, rowcount)
+
+    def _stream_query_results(self, panel, sample, batch_size, dur):
+        """Append rows to the result view batch by batch as they are fetched
+
+        Column widths are settled from the first sample window, so memory
+        stays bounded by one batch whatever the result size. Streamed
+        results are too large to be cached.
+        """
+        start = time.time()
+        connector = current_connector()
+        cols = [row[0] for row in connector.cursor.description]
+        table = StreamingTable(cols)
+        table.settle(sample)
+
+        panel.run_command("append", {"characters": table.header() + table.rows(sample)})
+        total = len(sample)
+        cancelled = False
+
+        try:
+            for batch in connector.fetch_batches(batch_size, _thread_local.token):
+                panel.run_command("append", {"characters": table.rows(batch)})
+                total += len(batch)
+                sublime.status_message(f"Fetched {total} rows...")
+        except QueryCancelled:
+            cancelled = True
+            self._reset_connection()
+
+        panel.run_command("append", {"characters": f"{table.footer()};"})
+        panel.run_command("append", {
+            "characters": f"\n\n\nActual Query retrieve time {round(dur,2)}, fetched {total} rows in {round(time.time() - start,2)} seconds"
+        })
+        if cancelled:
+            panel.run_command("append", {
+                "characters": f"\nATTENTION! RESULT OMITTED!\nFetch stopped after {total} rows"
+            })
+        panel.run_command("append", {"characters": "\nResult streamed, not cached"})
 
     def _display_query_results(self, query, panel, result, has_limit, has_sample,
-                             limit, number_of_cache_query, cache_dict, dur, rowcount):
+                             limit, number_of_cache_query, statement, dur, rowcount):
         """Display tabulated query results"""
-        cols = [row[0] for row in conn.cursor.description]
+        cols = [row[0] for row in current_connector().cursor.description]
         result2 = []
         for i in result:
             result2.append(tuple(
@@ -426,10 +444,15 @@ class SoRunSqlCmd(sublime_plugin.WindowCommand):
                 for j in i
             ))
 
-        to_return = tabulate(result2, cols, "psql", disable_numparse=True)
+        # tabulate fails on colalign without rows
+        to_return = tabulate(
+            result2, cols, "psql", disable_numparse=True,
+            colalign=column_alignments(result2, len(cols)) if result2 else None,
+        )
         
-        # Cache the result
-        self._cache_result(query, to_return, cache_dict, number_of_cache_query)
+        # Cache the result, rows a write returned are not
+        if statement is not None:
+            self._cache_result(statement, to_return, number_of_cache_query)
         
         # Display results
         panel.run_command("append", {"characters": f"{to_return};"})
@@ -454,18 +477,40 @@ class SoRunSqlCmd(sublime_plugin.WindowCommand):
         
         panel.run_command("append", {"characters": f"{to_return}"})
 
+    def _reset_connection(self):
+        """Clean up the borrowed connection after a cancelled statement, without reconnecting
+
+        A connection that cannot be rolled back is dropped from the pool when
+        the job ends, the next job borrows a fresh one.
+        """
+        if not current_connector().reset():
+            _thread_local.discard = True
+
     def _display_error(self, panel, error_msg):
         """Display error message"""
         panel.run_command("append", {"characters": f"{error_msg}"})
 
-    def _cache_result(self, query, result, cache_dict, number_of_cache_query):
-        """Cache the query result"""
-        new_cache = {query: result}
-        cache_dict = add_result_to_cache(cache_dict, new_cache, number_of_cache_query)
-        cache_dict_to_write = json.dumps(cache_dict)
-        
-        with open(cache_path, "w") as f:
-            f.write(cache_dict_to_write)
+    def _cache_key(self, statement):
+        """Cache key of a statement: its normalized fingerprint scoped by DBMS"""
+        return QueryCache.make_key(statement.fingerprint, namespace=pool.dbms)
+
+    def _cache_result(self, statement, result, number_of_cache_query):
+        """Cache the query result along with the tables it read"""
+        query_cache.put(
+            self._cache_key(statement), result, max_entries=number_of_cache_query,
+            tables=statement.tables, namespace=pool.dbms,
+        )
+
+    def _invalidate_cache_for_write(self, parsed):
+        """Evict cached reads of the table a DML/DDL statement wrote"""
+        tables = write_tables(parsed.text)
+        if tables:
+            evicted = query_cache.invalidate_tables(tables, namespace=pool.dbms)
+        else:
+            # Could not tell which tables changed, drop everything for this DBMS
+            evicted = query_cache.invalidate_namespace(pool.dbms)
+        if evicted:
+            print(f"Evicted {evicted} cached results after a write to {', '.join(tables) or 'an unknown table'}")
 
     def _append_query_info(self, panel, query, panel_name):
         """Append query information to the panel"""
@@ -473,119 +518,76 @@ class SoRunSqlCmd(sublime_plugin.WindowCommand):
         panel.run_command("append", {"characters": f"{query_run}"})
         panel.run_command("append", {"characters": f"\nQuery run from tab: `{panel_name}`"})
 
-    def _print_status_msg(self, t1, timeout):
-        """Print status messages during query execution"""
-        duration = 0
-        while t1.is_alive() and duration < timeout:
-            time.sleep(1)
-            sublime.status_message(f"Executing SQL query for {duration} seconds...")
-            duration += 1
-            
-        if duration >= timeout:
-            # Cancel database operations first
-            cancel_database_operations()
-            # Then stop the thread
-            stop_thread_safely(t1, "SQL Execution (Timeout)")
-            self._display_timeout_message(timeout, t1.native_id)
-            # Clean up thread tracking
-            self._unregister_thread(t1.native_id)
-        
-        # Always clean up timeout monitor thread
-        current_thread_id = threading.current_thread().native_id
-        self._unregister_thread(current_thread_id)
-
-    def _display_timeout_message(self, timeout, thread_id):
-        """Display timeout message in a message box"""
-        sublime.message_dialog(
-            f"Execution timeout after {timeout} seconds, thread_number {thread_id}.\nIncrease timeout in key binding args for so_run_sql_cmd"
-        )
+    def _display_timeout_message(self, job):
+        """Display timeout message in a message box, called by the scheduler monitor"""
+        # Show it from the main thread so the dialog doesn't hold up the monitor
+        sublime.set_timeout(lambda: sublime.message_dialog(
+            f"Execution timeout after {job.timeout} seconds, job {job.id}.\nIncrease timeout in key binding args for so_run_sql_cmd"
+        ), 0)
 
 
 class SaClearCache(sublime_plugin.TextCommand):
     def run(self, edit):
         try:
-            os.remove(cache_path)
-            sublime.message_dialog("Dropped Cache Query Result")
-        except:
-            sublime.message_dialog("Cache is empty!")
+            removed = query_cache.clear()
+            if remove_legacy_cache_file() or removed:
+                sublime.message_dialog("Dropped Cache Query Result")
+            else:
+                sublime.message_dialog("Cache is empty!")
+        except Exception as e:
+            sublime.message_dialog(f"Error dropping cache: {str(e)}")
 
 
 class SaInterruptQuery(sublime_plugin.WindowCommand):
-    def run(self):
-        """Interrupt running SQL queries and threads effectively"""
-        interrupted_threads = self._interrupt_sql_operations()
+    def run(self, job_id=None):
+        """Interrupt running SQL queries and threads effectively
+
+        Pass ``job_id`` to cancel a single scheduler job, without it every
+        queued and running job is cancelled.
+        """
+        if job_id is not None:
+            interrupted_threads = self._interrupt_job(job_id)
+        else:
+            interrupted_threads = self._interrupt_sql_operations()
         self._display_interrupt_results(interrupted_threads)
 
+    def _job_result(self, snapshot, success):
+        return {
+            'name': f"SQL job {snapshot['id']} ({snapshot['status']})",
+            'id': snapshot['id'],
+            'description': snapshot['description'],
+            'success': success,
+            'runtime': snapshot['runtime']
+        }
+
+    def _interrupt_job(self, job_id):
+        """Cancel one scheduler job by id"""
+        snapshot = scheduler.status(job_id)
+        if snapshot is None:
+            sublime.status_message(f"No SQL job {job_id}")
+            return []
+        return [self._job_result(snapshot, scheduler.cancel(job_id))]
+
     def _interrupt_sql_operations(self):
-        """Cancel database operations and stop SQL-related threads"""
-        global active_sql_threads
+        """Cancel every SQL job and the statement running on the global connection"""
         interrupted_threads = []
+        jobs = scheduler.jobs()
         
-        # First, cancel any running database operations
+        # Cancel queued and running jobs through ODBC cancel, and the global cursor
         try:
             cancel_database_operations()
         except Exception as e:
             print(f"Error canceling database operations: {e}")
         
-        # Get all active SQL threads from our tracking system
-        threads_to_stop = list(active_sql_threads.values())
+        for snapshot in jobs:
+            status = scheduler.status(snapshot['id']) or snapshot
+            interrupted_threads.append(self._job_result(status, status['status'] == "cancelled"))
         
-        if not threads_to_stop:
+        if not interrupted_threads:
             sublime.status_message("No active SQL operations to interrupt")
-            return []
-        
-        # Stop each tracked thread
-        for thread_info in threads_to_stop:
-            thread_obj = thread_info['thread']
-            description = thread_info['description']
-            
-            if thread_obj.is_alive():
-                success = stop_thread_safely(thread_obj, description)
-                interrupted_threads.append({
-                    'name': thread_obj.name,
-                    'id': thread_obj.native_id,
-                    'description': description,
-                    'success': success,
-                    'runtime': time.time() - thread_info['started_at']
-                })
-        
-        # Also check for any legacy threads that might not be in our tracking
-        self._stop_legacy_threads(interrupted_threads)
-        
-        # Clear the tracking registry
-        active_sql_threads.clear()
         
         return interrupted_threads
 
-    def _stop_legacy_threads(self, interrupted_threads):
-        """Stop any SQL-related threads not in our tracking system (legacy support)"""
-        legacy_thread_names = [
-            "sa_run_sql_cmd",
-            "sa_timeout_query", 
-            "odbc_connect",
-            "odbc_timeout_query",
-            "to_csv",
-            "Transpose",
-            "meta_init",
-            "meta_timeout",
-            "meta_add"
-        ]
-        
-        # Find threads by name that are still running
-        for tid, thread in threading._active.items():
-            if (thread.name in legacy_thread_names and 
-                thread.is_alive() and 
-                not any(t['id'] == thread.native_id for t in interrupted_threads)):
-                
-                success = stop_thread_safely(thread, f"Legacy {thread.name}")
-                interrupted_threads.append({
-                    'name': thread.name,
-                    'id': thread.native_id,
-                    'description': f"Legacy thread: {thread.name}",
-                    'success': success,
-                    'runtime': 'Unknown'
-                })
-
     def _display_interrupt_results(self, interrupted_threads):
         """Display the results of the interrupt operation"""
         panel = self.window.create_output_panel("interrupt")
@@ -613,10 +615,10 @@ class SaInterruptQuery(sublime_plugin.WindowCommand):
                           f"   Runtime: {runtime}\n\n")
                 summary += details
             
-            # Add current thread status
+            # Add current job and thread status
             active_count = len([t for t in threading._active.values() 
-                              if t.name in ["sa_run_sql_cmd", "sa_timeout_query", "odbc_connect", "odbc_timeout_query"]])
-            summary += f"Remaining SQL threads: {active_count}"
+                              if t.name in ["odbc_connect", "odbc_timeout_query"]])
+            summary += f"Remaining SQL jobs: {len(scheduler.jobs())}, remaining SQL threads: {active_count}"
             
             panel.run_command("insert", {"characters": summary})
         
@@ -635,135 +637,264 @@ class SaInterruptQuery(sublime_plugin.WindowCommand):
 
 class SoRestartConnection(sublime_plugin.TextCommand):
     def run(self, edit):
-        conn1 = str(conn)
-        self.conn1 = conn1
-
-        conn.close()
+        self.conn1 = str(pool)
         self.restart()
 
     def restart(self):
-        global conn
-        conn = ConnectorODBC()
-        conn2 = str(conn)
+        global pool
+        # Drop every pooled connection so the new pool picks up setting changes,
+        # connections still borrowed by jobs are closed when they come back
+        close_pools()
+        pool = get_pool()
+        pool.warm()
+        conn2 = str(pool)
         sublime.message_dialog("Restarted connection!")
         print("Before:", self.conn1, "\n", "After:", conn2)
 
-# TODO: print message has issue 
 class SoTblToCsv(sublime_plugin.WindowCommand):
-    def run(self, per_chunk=10000):
-        def main(self, per_chunk):
-            view = self.window.active_view()
-            region = sublime.Region(0, view.size())
-            content = view.substr(region)
-            query = content.split("Query Executed;")[1].split("Query run from tab:")[0]
-            self.window.focus_group(1)
-            self.window.run_command("new_file")
+    def run(self, per_chunk=10000, compress=False, format="csv"):
+        """Export the query of the active result tab to a file chosen first
+
+        Rows are written while they are fetched, so memory stays constant
+        whatever the result size. ``format`` is "csv", "arrow" (Arrow IPC,
+        pandas.read_feather) or "parquet", ``compress`` gzips a CSV.
+        """
+        if pool is None:
+            sublime.message_dialog(
+                "Database connection not established. Please run 'Start Connection' command first."
+            )
+            return
+        view = self.window.active_view()
+        region = sublime.Region(0, view.size())
+        content = view.substr(region)
+        query = content.split("Query Executed;")[1].split("Query run from tab:")[0]
+
+        if format == "csv":
+            extension = "gz" if compress else "csv"
+            name = "Sublime_Export.csv" if compress else "Sublime_Export"
+        else:
+            resolved = resolve_format(format)
+            if resolved != format:
+                sublime.status_message(f"pyarrow not installed, exporting {resolved} instead of {format}")
+            format, extension, name = resolved, FORMATS[resolved], "Sublime_Export"
+
+        sublime.save_dialog(
+            lambda path: self.start_export(path, query, per_chunk, compress, format),
+            extension=extension,
+            name=name,
+            directory=f"/C/Users/{os.getlogin()}",
+        )
 
-            self.panel = self.window.active_view()
-            self.panel.set_name("Export progress")
-            self.panel.set_scratch(True)
+    def start_export(self, path, query, per_chunk, compress, format="csv"):
+        if path is None:
+            print("No Parse")
+            return
+        self.window.focus_group(1)
+        self.window.run_command("new_file")
 
-            self.panel.run_command(
-                "append", {"characters": f"Executing Query to export...\n {query}\n"}
-            )
+        panel = self.window.active_view()
+        panel.set_name("Export progress")
+        panel.set_scratch(True)
+        panel.run_command(
+            "append", {"characters": f"Executing Query to export...\n {query}\n"}
+        )
+        # Runs as a job so sa_interrupt_query can cancel it like any query
+        job = scheduler.submit(
+            self._export,
+            args=[query, path, per_chunk, compress, format, panel],
+            description=f"Export to {os.path.basename(path)}",
+            token=CancelToken(),
+            pool=pool,
+        )
+        sublime.status_message(f"Queued export job {job.id}")
+
+    def _export(self, job, query, path, per_chunk, compress, format, panel):
+        """Fetch in chunks and write each one straight to ``path``"""
+        # Own connection from the pool, borrowed for the export only
+        try:
+            connector = ConnectorODBC(pool=job.pool, connection=job.take_connection())
+        except Exception as e:
+            panel.run_command("append", {"characters": f"Could not get a database connection: {e}"})
+            return
+        discard = False
+        writer = None
+        try:
             start = time.time()
-            cursor = conn.cursor
-            cursor.execute(query)
-            end = time.time() - start
-            self.panel.run_command(
+            connector.execute(query, token=job.token)
+            panel.run_command(
                 "append",
                 {
-                    "characters": f"Executing finished, time elapsed {round(end,2)} seconds\n\n"
+                    "characters": f"Executing finished, time elapsed {round(time.time() - start,2)} seconds, total row count is {connector.cursor.rowcount}\n\n"
                 },
             )
 
-            total = cursor.rowcount
-            boo = sublime.ok_cancel_dialog(
-                msg=f"Total row count is {total}\n\n\nQuery Executed:\n {query}",
-                ok_title="Lets Parse!",
-                title="CSV Parse Confirm",
-            )
-            if not boo:
-                print("No Parse")
-                return
             start = time.time()
-            final = []
-
-            while True:
-                chunk = cursor.fetchmany(per_chunk)
-                if len(chunk) == 0:
-                    self.panel.run_command("append", {"characters": f"Fetch Done\n"})
-                    break
-                final += chunk
-                total -= 10000
-                self.panel.run_command(
-                    "append",
-                    {"characters": f"Fetched {per_chunk} rows,{total} rows to go\n"},
-                )
-
-            result2 = [list(i) for i in final]
-            cols = [i[0] for i in cursor.description]
-            self.panel.run_command(
+            last_report = [start]
+
+            def report(rows, bytes_written):
+                now = time.time()
+                sublime.status_message(f"Exported {rows} rows...")
+                if now - last_report[0] >= 1:
+                    last_report[0] = now
+                    panel.run_command("append", {
+                        "characters": f"Written {rows} rows, {round(rows / (now - start))} rows/sec, {bytes_written / 1024 / 1024:.1f} MB\n"
+                    })
+
+            if format == "csv":
+                cols = [i[0] for i in connector.cursor.description]
+                writer = CsvWriter(path, cols, compress=compress)
+            else:
+                # Typed columns from cursor.description, one record batch per chunk
+                writer = open_columnar_writer(path, connector.cursor.description, format)
+            rows, bytes_written = export_batches(
+                connector.fetch_batches(per_chunk, job.token), writer, progress=report
+            )
+            elapsed = time.time() - start
+            panel.run_command(
                 "append",
                 {
-                    "characters": f"Time elapsed {round(time.time() - start,2)} seconds\n\n"
+                    "characters": f"Fetch Done\n{rows} rows, {bytes_written / 1024 / 1024:.1f} MB in {round(elapsed,2)} seconds, {round(rows / elapsed) if elapsed else rows} rows/sec\n\n{format.upper()} Exported at {path}"
                 },
             )
+        except QueryCancelled:
+            discard = not connector.reset()
+            written = f" after {writer.rows} rows" if writer is not None else ""
+            panel.run_command("append", {"characters": f"Export cancelled{written}, partial file at {path}"})
+        except Exception as e:
+            discard = True
+            panel.run_command("append", {"characters": f"Export failed: {e}"})
+        finally:
+            connector.close(discard=discard)
 
-            self.cols = cols
-            self.result2 = result2
 
-            path = sublime.save_dialog(
-                self.get_path,
-                extension="csv",
-                name="Sublime_Export",
-                directory=f"/C/Users/{os.getlogin()}",
-            )
+class UploadCsvToTable(sublime_plugin.WindowCommand):
+    def run(self):
+        if not credential_set():
+            return
+        sublime.open_dialog(self.print_path)
+
+    def print_path(self, path):
+        if path is None:
+            return
+        self.path = path
+        input_panel = self.window.show_input_panel(
+            "Enter Table Name: ",
+            "",
+            self.on_done,
+            None,
+            None,
+        )
 
-        t1 = threading.Thread(
-            target=main,
-            args=[self, per_chunk],
-            name="to_csv",
+    def on_done(self, user_input):
+        print(user_input,self.path)
+        table = user_input.strip()
+        if not table:
+            sublime.error_message("Table name is empty")
+            return
+
+        self.window.run_command("new_file")
+        panel = self.window.active_view()
+        panel.set_name(f"Upload to {table}")
+        panel.set_scratch(True)
+        panel.run_command("append", {"characters": f"Uploading {self.path} to {table}...\n"})
+
+        # Runs as a job so sa_interrupt_query can cancel it like any query
+        job = scheduler.submit(
+            self.upload,
+            args=[self.path, table, panel],
+            description=f"Upload {os.path.basename(self.path)} to {table}",
+            token=CancelToken(),
         )
-        t1.start()
-
-    def get_path(self, path):
-        with open(path, "w", newline="") as f:
-            wr = csv.writer(f)
-            wr.writerow(self.cols)
-            wr.writerows(self.result2)
-            self.panel.run_command(
-                "append",
-                {"characters": f"CSV Exported at {path}"},
-            )
+        sublime.status_message(f"Queued upload job {job.id}")
+
+    def upload(self, job, path, table, panel):
+        """Run the bulk load and report rows/sec in the upload tab"""
+        last_report = [0]
+
+        def report(rows, elapsed):
+            sublime.status_message(f"Uploaded {rows} rows...")
+            if elapsed - last_report[0] >= 1:
+                last_report[0] = elapsed
+                panel.run_command("append", {
+                    "characters": f"Inserted {rows} rows, {round(rows / elapsed)} rows/sec\n"
+                })
+
+        uploader = CsvUploader(path, table, get_pool(), progress=report, token=job.token)
+        try:
+            rows, created = uploader.run()
+        except Exception as e:
+            panel.run_command("append", {
+                "characters": f"Upload failed after {uploader.rows} rows: {e}\n"
+            })
+            return
+        if job.token.cancelled:
+            panel.run_command("append", {
+                "characters": f"Upload cancelled after {uploader.rows} rows, committed batches stay in {table}\n"
+            })
+            sublime.status_message(f"Upload to {table} cancelled")
+            return
+
+        elapsed = time.time() - uploader.start
+        columns = ", ".join(f"{name} {kind}" for name, kind, _ in uploader.columns)
+        if created:
+            panel.run_command("append", {"characters": f"Created table {table} ({columns})\n"})
+        if rows == -1:
+            size = os.path.getsize(path) / 1024 / 1024
+            summary = f"Loaded {size:.1f} MB through the {get_pool().dbms} fast path in {round(elapsed,2)} seconds"
+        else:
+            summary = f"Inserted {rows} rows in {round(elapsed,2)} seconds, {round(rows / elapsed) if elapsed else rows} rows/sec"
+        panel.run_command("append", {"characters": f"{summary}\n"})
+        sublime.status_message(f"Upload to {table} finished")
 
 
 class TblTranspose(sublime_plugin.WindowCommand):
     def run(self, limit=1000):
-        def main(self):
-            view = self.window.active_view()
-            region = sublime.Region(0, view.size())
-            content = view.substr(region)
-            query = content.split("Query Executed;")[1].split("Query run from tab:")[0]
-            file_name = self.window.active_view().name()
-            self.window.focus_group(1)
+        if pool is None:
+            sublime.message_dialog(
+                "Database connection not established. Please run 'Start Connection' command first."
+            )
+            return
+        view = self.window.active_view()
+        region = sublime.Region(0, view.size())
+        content = view.substr(region)
+        query = content.split("Query Executed;")[1].split("Query run from tab:")[0]
+        file_name = self.window.active_view().name()
+        self.window.focus_group(1)
 
-            self.window.run_command("new_file")
+        self.window.run_command("new_file")
 
-            self.panel = self.window.active_view()
-            self.panel.set_name(f"Transpose from {file_name}")
-            self.panel.set_scratch(True)
+        panel = self.window.active_view()
+        panel.set_name(f"Transpose from {file_name}")
+        panel.set_scratch(True)
 
-            self.panel.run_command(
-                "append", {"characters": f"Executing Query to transpose......;\n"}
-            )
+        panel.run_command(
+            "append", {"characters": f"Executing Query to transpose......;\n"}
+        )
+        # Runs as a job on a borrowed connection, sa_interrupt_query cancels it
+        job = scheduler.submit(
+            self._transpose,
+            args=[query, limit, panel],
+            description=f"Transpose from {file_name}",
+            token=CancelToken(),
+            pool=pool,
+        )
+        sublime.status_message(f"Queued transpose job {job.id}")
+
+    def _transpose(self, job, query, limit, panel):
+        try:
+            connector = ConnectorODBC(pool=job.pool, connection=job.take_connection())
+        except Exception as e:
+            panel.run_command("append", {"characters": f"Could not get a database connection: {e}"})
+            return
+        discard = False
+        try:
             start = time.time()
-            cursor = conn.cursor
-            cursor.execute(query)
+            connector.execute(query, token=job.token)
+            cursor = connector.cursor
             end = time.time() - start
 
             if cursor.rowcount >= limit:
-                self.panel.run_command(
+                panel.run_command(
                     "append",
                     {
                         "characters": f"Number of rows in cursor is {cursor.rowcount}, limit is {limit}\nTranspose rows out of bound!!! "
@@ -778,36 +909,42 @@ class TblTranspose(sublime_plugin.WindowCommand):
             column = ["Column"] + [f"Row_{i}" for i in range(1, l + 1)]
 
             to_return = tabulate(result2, column, "psql", disable_numparse=True)
-            self.panel.run_command(
+            panel.run_command(
                 "append",
                 {"characters": f"\n{to_return};\n\n"},
             )
-            self.panel.run_command(
+            panel.run_command(
                 "append",
                 {
                     "characters": f"Executing finished, time elapsed {round(end,2)} seconds;\nQuery Executed:\n{query}\n\n"
                 },
             )
-            self.panel.set_read_only(True)
-
-        t1 = threading.Thread(
-            target=main,
-            args=[self],
-            name="Transpose",
-        )
-        t1.start()
+            panel.set_read_only(True)
+        except QueryCancelled:
+            discard = not connector.reset()
+            panel.run_command("append", {"characters": "Transpose cancelled by user"})
+        except Exception as e:
+            discard = True
+            panel.run_command("append", {"characters": f"Transpose failed: {e}"})
+        finally:
+            connector.close(discard=discard)
 
 
 class SoRemoveCacheFile(sublime_plugin.WindowCommand):
     def run(self):
-        """Remove the cache query JSON file from the metastore folder"""
+        """Remove the cached query result files from the metastore folder"""
         try:
-            # Get the cache file path from the global cache_path variable
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
-                sublime.status_message("Cache query file removed successfully")
+            removed = query_cache.clear()
+            if remove_legacy_cache_file() or removed:
+                sublime.status_message("Cache query files removed successfully")
             else:
-                sublime.status_message("Cache query file does not exist")
+                sublime.status_message("Cache query files do not exist")
         except Exception as e:
             sublime.error_message(f"Error removing cache file: {str(e)}")
 
+
+def plugin_unloaded():
+    scheduler.shutdown()
+    close_pools()
+    # Keep the recency order of cache hits since the last store
+    query_cache.flush()
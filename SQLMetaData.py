@@ -7,11 +7,15 @@ import threading
 import ctypes
 import shutil
 
-from SQLAPI.connect import ConnectorODBC
+from SQLAPI.connect import ConnectorODBC, get_pool
 from SQLAPI.util import load_package_path, crypt, load_settings, credential_set, update_settings
+from SQLAPI.metastore import METASTORE_FILE, SOURCE_FILE, write_metastore, load_group_drop_down, metadata_cache
 
 cache_path, lib_path, plugin_path, metastore_path,user_path = load_package_path()
 
+# Per-table change markers of a conn group, used by the incremental refresh
+TABLE_MARKERS_FILE = "table-markers.json"
+
 
 
 
@@ -137,12 +141,30 @@ class MetaInit(sublime_plugin.WindowCommand):
             self.window.run_command("show_panel", {"panel": "output.meta_init"})
 
             # Get metadata without dtype
-            db_list, db_schema, db_schema_tbl, db_schema_tbl_col = conn.get_all_accessible_meta(include_dtype=include_dtype)
+            def report_progress(db, done, total, error):
+                status = "done" if error is None else f"failed: {error}"
+                panel.run_command(
+                    "append",
+                    {"characters": f"[{done}/{total}] {db} {status}\n"},
+                )
+
+            try:
+                db_list, db_schema, db_schema_tbl, db_schema_tbl_col = conn.get_all_accessible_meta(
+                    include_dtype=include_dtype, progress=report_progress
+                )
+            finally:
+                conn.close()
             
             panel.run_command(
                 "append",
                 {"characters": f"Retrieved metadata for {len(db_list)} databases\n"},
             )
+            if conn.skipped:
+                panel.run_command(
+                    "append",
+                    {"characters": f"Skipped {len(conn.skipped)} databases, run the refresh again for: "
+                                   f"{', '.join(sorted(conn.skipped))}\n"},
+                )
 
             # Create all metadata files
             drop_down_list = create_drop_down_list(db_schema_tbl_col)
@@ -254,9 +276,12 @@ class MetaNewConnGroup(sublime_plugin.WindowCommand):
 
             # Process each table input using the helper function
             panel_text_list = []
-            combined_db_schema, combined_db_schema_tbl, combined_db_schema_tbl_col = process_components_and_merge_metadata(
-                conn, tbl_list, panel, include_dtype=self.include_dtype, panel_text_list=panel_text_list
-            )
+            try:
+                combined_db_schema, combined_db_schema_tbl, combined_db_schema_tbl_col = process_components_and_merge_metadata(
+                    conn, tbl_list, panel, include_dtype=self.include_dtype, panel_text_list=panel_text_list
+                )
+            finally:
+                conn.close()
             
             # Update panel_text with results
             panel_text += "".join(panel_text_list)
@@ -327,8 +352,9 @@ class MetaSelectConnection(sublime_plugin.WindowCommand):
 
 
 class MetaUpdateConnectionGroup(MetaSelectConnection):
-    def run(self, include_dtype="true"):
+    def run(self, include_dtype="true", incremental=False):
         self.include_dtype = include_dtype.lower() == "true"
+        self.incremental = incremental
         super().run()
     
     def on_done(self, index):
@@ -337,23 +363,14 @@ class MetaUpdateConnectionGroup(MetaSelectConnection):
         
         select = self.folder_names[index]
         connection_group_folder = os.path.join(get_dbms_path(), select)
-        component_file_path = os.path.join(connection_group_folder, "conn-group-component.txt")
         
         # Read the component file
         try:
-            with open(component_file_path, "r") as f:
-                components = f.read().strip().split('\n')
+            components = read_group_components(connection_group_folder)
         except FileNotFoundError:
             sublime.message_dialog(f"Component file not found for connection group '{select}'")
             return
         
-        # Clean up the component list
-        components = [
-            comp.strip().lower()
-            for comp in components
-            if comp.strip() not in ["", " ", "\n", "\t"]
-        ]
-        
         if not components:
             sublime.message_dialog(f"No components found for connection group '{select}'")
             return
@@ -369,10 +386,13 @@ class MetaUpdateConnectionGroup(MetaSelectConnection):
             )
             self.window.run_command("show_panel", {"panel": "output.meta_update"})
 
-            # Process each component using the helper function
-            combined_db_schema, combined_db_schema_tbl, combined_db_schema_tbl_col = process_components_and_merge_metadata(
-                conn, components, panel, include_dtype=self.include_dtype
-            )
+            try:
+                combined_db_schema, combined_db_schema_tbl, combined_db_schema_tbl_col = refresh_group_metadata(
+                    conn, components, connection_group_folder, panel,
+                    include_dtype=self.include_dtype, incremental=self.incremental
+                )
+            finally:
+                conn.close()
             self.window.run_command("show_panel", {"panel": "output.meta_update"})
 
             # Check if any metadata was collected
@@ -502,6 +522,8 @@ class MetaAddTableInConnGroup(MetaSelectConnection):
                 )
                 sublime.message_dialog(f"Error getting metadata for table '{table_to_add}': {str(e)}")
                 return
+            finally:
+                conn.close()
             
             if not db_schema_tbl:
                 panel.run_command(
@@ -613,6 +635,8 @@ class MetaAddTableInConnGroup(MetaSelectConnection):
             with open(db_schema_tbl_col_path, "w") as f:
                 json.dump(existing_db_schema_tbl_col, f)
             
+            write_metastore(os.path.join(self.connection_group_folder, METASTORE_FILE), existing_db_schema_tbl_col)
+            
             with open(drop_down_path, "w") as f:
                 f.write('\n'.join(all_lines))
             
@@ -651,6 +675,7 @@ class MetaDeleteConnection(MetaSelectConnection):
 
         # Remove the connection group folder
         shutil.rmtree(connection_group_folder)
+        metadata_cache.invalidate_folder(connection_group_folder)
 
         self.window.run_command("meta_select_connection")
 
@@ -663,25 +688,12 @@ class MetaBrowseConnection(sublime_plugin.TextCommand):
         # 1. Read current_selection from settings
         current_selection = load_settings(get_cur_selection_only=True)
         
-        # 2. Open current_selection folder under DBMS folder
-        dbms_path = get_dbms_path()
-        current_folder_path = os.path.join(dbms_path, current_selection)
-        
-        # 3. Read drop-down.txt and split by newline, clean up empty strings
-        drop_down_file_path = os.path.join(current_folder_path, "drop-down.txt")
-        with open(drop_down_file_path, "r") as f:
-            file_content = f.read()
+        current_dbms = load_settings(get_cur_dbms_only=True)
         
-        # Split by newline and filter out empty strings, spaces, and newlines
-        col_lst = [
-            line.strip() for line in file_content.split("\n") 
-            if line.strip() not in ["", " ", "\n"]
-        ]
-        col_lst = sorted(col_lst)
+        # 2. Read the column list of the group, cached until the group changes
+        self.col_lst = load_group_drop_down(metastore_path, current_dbms, current_selection)
         
-        self.col_lst = col_lst
-        
-        # 4. Show quick panel
+        # 3. Show quick panel
         self.view.window().show_quick_panel(self.col_lst, self.on_done, 0, 0)
 
     def on_done(self, index):
@@ -907,6 +919,8 @@ class MetaRemoveTableInConnGroup(MetaSelectConnection):
             with open(db_list_path, "w") as f:
                 json.dump(db_list, f)
 
+            write_metastore(os.path.join(self.connection_group_folder, METASTORE_FILE), db_schema_tbl_col)
+
             # Update description.txt
             db_list_str = " , ".join(db_list) if db_list else "No databases"
             
@@ -1016,6 +1030,172 @@ def process_components_and_merge_metadata(conn, components, panel, include_dtype
     return combined_db_schema, combined_db_schema_tbl, combined_db_schema_tbl_col
 
 
+def read_group_components(folder_path):
+    """Cleaned up components listed in conn-group-component.txt"""
+    with open(os.path.join(folder_path, "conn-group-component.txt"), "r") as f:
+        components = f.read().strip().split('\n')
+    return [
+        comp.strip().lower()
+        for comp in components
+        if comp.strip() not in ["", " ", "\n", "\t"]
+    ]
+
+
+def refresh_group_metadata(conn, components, folder_path, panel, include_dtype=True, incremental=False,
+                           allow_full=True):
+    """Pull the metadata of a conn group, (db_schema, db_schema_tbl, db_schema_tbl_col)
+
+    Only tables with a moved change marker are re-fetched when ``incremental``
+    is set and the group has markers, otherwise every component is pulled and
+    the markers are recorded for the next incremental run. Without
+    ``allow_full`` an incremental refresh that can't run raises instead of
+    pulling every component. Nothing is written besides the markers, see
+    create_metadata_files.
+    """
+    if incremental:
+        try:
+            patched = refresh_group_incrementally(
+                conn, components, folder_path, panel, include_dtype=include_dtype
+            )
+        except Exception as e:
+            if not allow_full:
+                raise
+            panel.run_command(
+                "append", {"characters": f"Incremental refresh failed ({e}), pulling every component\n"}
+            )
+        else:
+            if patched is not None:
+                return patched
+            if not allow_full:
+                raise RuntimeError("no change markers saved, refresh the conn group by hand once")
+            panel.run_command("append", {"characters": "Running a full refresh\n"})
+
+    # Markers are read before the pull so a change made during it is caught next time
+    try:
+        markers = fetch_table_markers(conn, components)
+    except Exception as e:
+        markers = None
+        print(f"Table change markers not recorded: {e}")
+    # Process each component using the helper function
+    result = process_components_and_merge_metadata(
+        conn, components, panel, include_dtype=include_dtype
+    )
+    # Record change markers so the next refresh can be incremental
+    if markers is not None and result[0]:
+        save_table_markers(folder_path, markers)
+    return result
+
+
+def component_covers(component, table_key):
+    """True if a conn group component (db, db.schema or db.schema.table) includes ``table_key``"""
+    parts = component.split(".")
+    return table_key.split(".")[:len(parts)] == parts
+
+
+def fetch_table_markers(conn, components, names=None):
+    """Change markers of every table the components cover, one marker query per database
+
+    ``names`` is passed on to get_table_markers.
+    """
+    markers = {}
+    for db in sorted({comp.split(".")[0] for comp in components}):
+        for table_key, marker in conn.get_table_markers(db, names).items():
+            if any(component_covers(comp, table_key) for comp in components):
+                markers[table_key] = marker
+    return markers
+
+
+def load_table_markers(folder_path):
+    """Markers saved by the last refresh, None when the group never recorded any"""
+    try:
+        with open(os.path.join(folder_path, TABLE_MARKERS_FILE), "r") as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_table_markers(folder_path, markers):
+    write_file_atomic(os.path.join(folder_path, TABLE_MARKERS_FILE), json.dumps(markers))
+
+
+def split_metadata(db_schema_tbl_col):
+    """db_schema and db_schema_tbl structures derived from db_schema_tbl_col"""
+    db_schema = {}
+    db_schema_tbl = {}
+    for db, schemas in db_schema_tbl_col.items():
+        db_schema[db] = {schema: {} for schema in schemas}
+        db_schema_tbl[db] = {
+            schema: {table: {} for table in tables}
+            for schema, tables in schemas.items()
+        }
+    return db_schema, db_schema_tbl
+
+
+def refresh_group_incrementally(conn, components, folder_path, panel, include_dtype=True):
+    """Re-fetch only the tables whose change marker moved since the last refresh
+
+    Tables that vanished from the marker query are dropped, a changed table
+    whose columns can't be fetched keeps its old columns and is retried on
+    the next refresh. Returns the patched
+    (db_schema, db_schema_tbl, db_schema_tbl_col), or None when the group has
+    no saved markers yet and needs a full refresh first.
+    """
+    stored = load_table_markers(folder_path)
+    if stored is None:
+        panel.run_command("append", {"characters": "No change markers saved for this group yet\n"})
+        return None
+    with open(os.path.join(folder_path, SOURCE_FILE), "r") as f:
+        db_schema_tbl_col = json.loads(f.read())
+
+    names = {}
+    current = fetch_table_markers(conn, components, names)
+    existing = {
+        f"{db}.{schema}.{table}"
+        for db, schemas in db_schema_tbl_col.items()
+        for schema, tables in schemas.items()
+        for table in tables
+    }
+    changed = sorted(key for key, marker in current.items() if key not in existing or stored.get(key) != marker)
+    vanished = sorted(existing - set(current))
+    panel.run_command(
+        "append",
+        {"characters": f"{len(current)} tables checked, {len(changed)} changed, {len(vanished)} vanished\n"},
+    )
+
+    def drop(table_key):
+        db, schema, table = table_key.split(".")
+        schemas = db_schema_tbl_col.get(db, {})
+        schemas.get(schema, {}).pop(table, None)
+        if schema in schemas and not schemas[schema]:
+            del schemas[schema]
+        if db in db_schema_tbl_col and not schemas:
+            del db_schema_tbl_col[db]
+
+    for table_key in vanished:
+        drop(table_key)
+        panel.run_command("append", {"characters": f"Dropped vanished table: {table_key}\n"})
+
+    for table_key in changed:
+        # the names as the DBMS spells them, the keys are lower-cased
+        _, _, _, fetched = conn.get_table_columns(*names[table_key], include_dtype=include_dtype)
+        db, schema, table = table_key.split(".")
+        columns = fetched.get(db, {}).get(schema, {}).get(table)
+        if not columns:
+            # keep what is stored, the old marker makes the next refresh retry it
+            if table_key in stored:
+                current[table_key] = stored[table_key]
+            else:
+                current.pop(table_key, None)
+            panel.run_command("append", {"characters": f"No columns returned for {table_key}, left as it was until the next refresh\n"})
+            continue
+        db_schema_tbl_col.setdefault(db, {}).setdefault(schema, {})[table] = columns
+        panel.run_command("append", {"characters": f"Refreshed table: {table_key}\n"})
+
+    save_table_markers(folder_path, current)
+    db_schema, db_schema_tbl = split_metadata(db_schema_tbl_col)
+    return db_schema, db_schema_tbl, db_schema_tbl_col
+
+
 def create_metadata_folder(folder_path, folder_name, panel=None):
     """Create or recreate a metadata folder"""
     if os.path.exists(folder_path):
@@ -1045,34 +1225,43 @@ def create_drop_down_list(db_schema_tbl_col):
     return list(drop_down_set)
 
 
+def write_file_atomic(path, content):
+    """Write to a temporary file and swap it in, readers see the old or the new file, never half of one"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
 def create_metadata_files(folder_path, db_list, db_schema, db_schema_tbl, db_schema_tbl_col, drop_down_list, group_name=None):
-    """Create all standard metadata JSON files in the specified folder"""
+    """Create all standard metadata JSON files in the specified folder
+
+    Every file is swapped in atomically, so autocomplete can keep reading the
+    group while a refresh writes it.
+    """
     # Create db-list.json
-    with open(os.path.join(folder_path, "db-list.json"), "w") as f:
-        f.write(json.dumps(db_list))
+    write_file_atomic(os.path.join(folder_path, "db-list.json"), json.dumps(db_list))
     
     # Create db-schema.json
-    with open(os.path.join(folder_path, "db-schema.json"), "w") as f:
-        f.write(json.dumps(db_schema))
+    write_file_atomic(os.path.join(folder_path, "db-schema.json"), json.dumps(db_schema))
     
     # Create db-schema-tbl.json
-    with open(os.path.join(folder_path, "db-schema-tbl.json"), "w") as f:
-        f.write(json.dumps(db_schema_tbl))
+    write_file_atomic(os.path.join(folder_path, "db-schema-tbl.json"), json.dumps(db_schema_tbl))
     
     # Create db-schema-tbl-col.json
-    with open(os.path.join(folder_path, "db-schema-tbl-col.json"), "w") as f:
-        f.write(json.dumps(db_schema_tbl_col))
+    write_file_atomic(os.path.join(folder_path, SOURCE_FILE), json.dumps(db_schema_tbl_col))
+    
+    # Create metastore.bin (compact lookup format used by autocomplete)
+    write_metastore(os.path.join(folder_path, METASTORE_FILE), db_schema_tbl_col)
     
     # Create drop-down.txt (flattened column list)
-    with open(os.path.join(folder_path, "drop-down.txt"), "w") as f:
-        f.write("\n".join(drop_down_list))
+    write_file_atomic(os.path.join(folder_path, "drop-down.txt"), "\n".join(drop_down_list))
     
     # Create description.txt
     db_list_str = " , ".join(db_list)
     description_msg = f"Completions for DB `{db_list_str}`, {len(drop_down_list)} columns in total"
     
-    with open(os.path.join(folder_path, "description.txt"), "w") as f:
-        f.write(description_msg)
+    write_file_atomic(os.path.join(folder_path, "description.txt"), description_msg)
 
 
 def create_conn_group_component(folder_path, components):
@@ -1094,6 +1283,7 @@ def print_metadata_summary(panel, folder_path, db_list, drop_down_list, addition
     summary_text += f"- {os.path.join(folder_path, 'db-schema.json')}\n"
     summary_text += f"- {os.path.join(folder_path, 'db-schema-tbl.json')}\n"
     summary_text += f"- {os.path.join(folder_path, 'db-schema-tbl-col.json')}\n"
+    summary_text += f"- {os.path.join(folder_path, METASTORE_FILE)}\n"
     summary_text += f"- {os.path.join(folder_path, 'drop-down.txt')} ({len(drop_down_list)} columns)\n"
     summary_text += f"- {os.path.join(folder_path, 'description.txt')}\n"
     summary_text += f"- {os.path.join(folder_path, 'conn-group-component.txt')}\n"
@@ -1134,3 +1324,159 @@ def create_timeout_monitor_thread(window, main_thread, timeout=180, thread_name=
         args=[window, main_thread, timeout],
         name=thread_name,
     )
+
+
+
+class _ConsolePanel:
+    """Stands in for an output panel when a refresh runs in the background"""
+
+    def run_command(self, command, args):
+        print(f"[metadata refresh] {args.get('characters', '').rstrip()}")
+
+
+class MetadataRefresher:
+    """Background refresh of connection group metadata
+
+    Reads the ``metadata_refresh`` block of the current DBMS setting:
+        enabled: turn the refresher on
+        interval: seconds between two refreshes of a group
+        groups: conn groups to keep fresh, the current selection when empty
+        include_dtype: pull data types as well
+
+    A group is due once its db-schema-tbl-col.json is older than
+    ``interval``, so the schedule survives restarts. Refreshes run one at a
+    time on a single pooled connection and are always incremental, a group
+    without change markers is left to a refresh by hand. A failed attempt
+    is retried after ``interval`` doubled for every failure in a row, up to
+    MAX_BACKOFF. A refresh is postponed while fewer than two pooled
+    connections are free, so it never makes a query wait. Files are only
+    written once everything is fetched and each one is swapped in
+    atomically.
+    """
+
+    CHECK_INTERVAL = 60
+    MAX_BACKOFF = 24 * 3600
+    STATUS_KEY = "sqlodbc_metadata"
+
+    def __init__(self):
+        self.last_refreshed = {}  # (dbms, group) -> timestamp
+        self.attempts = {}  # (dbms, group) -> (timestamp of the last attempt, failures in a row)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="meta_refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.CHECK_INTERVAL):
+            try:
+                self.refresh_due_groups()
+            except Exception as e:
+                print(f"[metadata refresh] failed: {e}")
+
+    def _options(self):
+        db_config = load_settings(get_dbms_setting_only=True) or {}
+        return db_config.get("metadata_refresh", {})
+
+    def refresh_due_groups(self):
+        options = self._options()
+        if not options.get("enabled") or not credential_set(show_msg=False):
+            return
+        interval = options.get("interval", 3600)
+        dbms = load_settings(get_cur_dbms_only=True)
+        groups = options.get("groups") or [load_settings(get_cur_selection_only=True)]
+        for group in groups:
+            if self._stop.is_set():
+                return
+            folder_path = os.path.join(metastore_path, dbms, group)
+            try:
+                age = time.time() - os.path.getmtime(os.path.join(folder_path, SOURCE_FILE))
+            except FileNotFoundError:
+                continue  # never built, meta_init or a new conn group creates it
+            if age < interval:
+                continue
+            # the file keeps its age when an attempt fails, the attempts are tracked apart
+            last_attempt, failures = self.attempts.get((dbms, group), (0, 0))
+            if time.time() - last_attempt < min(interval * 2 ** failures, max(interval, self.MAX_BACKOFF)):
+                continue
+            pool = get_pool()
+            if pool.available() < 2:
+                print(f"[metadata refresh] pool busy, {group} postponed")
+                return
+            try:
+                refreshed = self.refresh_group(pool, dbms, group, folder_path, options.get("include_dtype", True))
+            except Exception as e:
+                print(f"[metadata refresh] {group} failed: {e}")
+                refreshed = False
+            failures = 0 if refreshed else failures + 1
+            self.attempts[(dbms, group)] = (time.time(), failures)
+            if failures:
+                retry = min(interval * 2 ** failures, max(interval, self.MAX_BACKOFF))
+                print(f"[metadata refresh] {group} failed {failures} time(s) in a row, next try in {int(retry)} seconds")
+
+    def refresh_group(self, pool, dbms, group, folder_path, include_dtype=True):
+        """Incremental refresh of one group, False when nothing was refreshed"""
+        components = read_group_components(folder_path)
+        if not components:
+            return False
+        panel = _ConsolePanel()
+        conn = ConnectorODBC(pool)
+        try:
+            db_schema, db_schema_tbl, db_schema_tbl_col = refresh_group_metadata(
+                conn, components, folder_path, panel, include_dtype=include_dtype,
+                incremental=True, allow_full=False,
+            )
+        finally:
+            conn.close()
+        if not db_schema:
+            return False
+        drop_down_list = create_drop_down_list(db_schema_tbl_col)
+        create_metadata_files(
+            folder_path, list(db_schema.keys()), db_schema, db_schema_tbl,
+            db_schema_tbl_col, drop_down_list, group_name=group,
+        )
+        self.last_refreshed[(dbms, group)] = time.time()
+        sublime.set_timeout(self.publish_status, 0)
+        return True
+
+    def status_text(self):
+        dbms = load_settings(get_cur_dbms_only=True)
+        group = load_settings(get_cur_selection_only=True)
+        refreshed = self.last_refreshed.get((dbms, group))
+        if refreshed is None:
+            return None
+        return f"Metadata {group} refreshed {time.strftime('%H:%M', time.localtime(refreshed))}"
+
+    def publish_status(self, views=None):
+        """Show the last refresh time of the current group in the status bar"""
+        text = self.status_text()
+        if text is None:
+            return
+        if views is None:
+            views = [view for window in sublime.windows() for view in window.views()]
+        for view in views:
+            view.set_status(self.STATUS_KEY, text)
+
+
+metadata_refresher = MetadataRefresher()
+
+
+class MetaRefreshStatus(sublime_plugin.EventListener):
+    def on_activated(self, view):
+        """Views opened after the last refresh get the status too"""
+        metadata_refresher.publish_status([view])
+
+
+def plugin_loaded():
+    metadata_refresher.start()
+
+
+def plugin_unloaded():
+    metadata_refresher.stop()
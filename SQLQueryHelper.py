@@ -1,23 +1,141 @@
 import sublime_plugin
 import sublime
-import sqlparse
+import threading
 
+from SQLAPI.sqlformat import FormatCache, FormatPool, apply_edits, split_statements
+from SQLAPI.util import load_settings
+
+
+FORMAT_STYLE = {
+    "keyword_case": "upper",
+    "identifier_case": None,
+    "strip_comments": False,
+    "indent_tabs": False,
+    "indent_width": 4,
+    "reindent": True,
+}
+
+# buffer id -> FormatCache, kept between runs of SaFormat
+format_caches = {}
+
+# Buffers a SaFormat run is formatting in the background
+formatting_buffers = set()
+
+# FormatPool of the "formatting" settings it was made for, started on first use
+format_pool = None
+_format_pool_settings = None
+
+
+def get_format_pool():
+    """FormatPool of the "formatting" settings, None unless "parallel" is on and "python" set"""
+    global format_pool, _format_pool_settings
+    settings = load_settings().get("formatting", {})
+    if not settings.get("parallel", False):
+        return None
+    if not settings.get("python"):
+        # the workers would be started with the plugin host, which is no interpreter
+        print('SaFormat: set "python" under "formatting" to a Python 3.8 interpreter, formatting in-process')
+        return None
+    key = (
+        settings.get("processes", 0), settings.get("min_parallel_chars", 50000),
+        settings["python"], settings.get("timeout", 300),
+    )
+    if format_pool is None or key != _format_pool_settings:
+        if format_pool is not None:
+            format_pool.close()
+        format_pool = FormatPool(processes=key[0], min_chars=key[1], python=key[2], timeout=key[3])
+        _format_pool_settings = key
+    return format_pool
+
+
+def plugin_unloaded():
+    if format_pool is not None:
+        format_pool.close()
+
+
+class FormatCacheListener(sublime_plugin.EventListener):
+    def on_close(self, view):
+        if not view.clones():
+            format_caches.pop(view.buffer_id(), None)
+
+
+def format_regions(cache, regions, pool=None):
+    """Edits formatting (begin, text, whole file) regions, and whether one was the whole file"""
+    edits = []
+    whole_file = False
+    for begin, text, is_whole in regions:
+        if is_whole:
+            whole_file = True
+            spans = cache.spans.update(text)
+        else:
+            spans = list(split_statements(text))
+        edits += cache.edits(text, spans, begin, pool)
+    return edits, whole_file
+
+
+def apply_format_edits(view, edit, cache, edits, whole_file):
+    # last edit first, so the offsets of the earlier ones stay valid
+    for begin, end, replacement in reversed(edits):
+        view.replace(edit, sublime.Region(begin, end), replacement)
+    if whole_file and edits:
+        cache.spans.apply(
+            apply_edits(cache.spans.text, edits),
+            [(begin, end, len(replacement)) for begin, end, replacement in edits],
+        )
 
 
 class SaFormat(sublime_plugin.TextCommand):
+    """Format the selections, or the whole file, statement by statement
+
+    Each statement is formatted on its own and replaced only when that
+    changes it, so unchanged statements keep their undo and highlighting
+    state. Statements seen before in the buffer (including already
+    formatted ones) come from its FormatCache, and the whole file is split
+    again only around what was edited since the last run.
+
+    With "parallel" on under "formatting", a selection of at least
+    "min_parallel_chars" characters is formatted in a background thread,
+    the statements missing from the cache in worker processes, and
+    sa_format_apply applies the result unless the buffer changed meanwhile.
+    """
+
     def run(self, edit):
         selectionRegions = self.getSelectionRegions()
-        format_style = {
-            "keyword_case": "upper",
-            "identifier_case": None,
-            "strip_comments": False,
-            "indent_tabs": False,
-            "indent_width": 4,
-            "reindent": True,
-        }
-        for region in selectionRegions:
-            textToFormat = self.view.substr(region)
-            self.view.replace(edit, region, self.formatSql(textToFormat, format_style))
+        if not selectionRegions:
+            return
+        buffer_id = self.view.buffer_id()
+        if buffer_id in formatting_buffers:
+            sublime.status_message("SaFormat is still formatting this buffer")
+            return
+        cache = format_caches.get(buffer_id)
+        if cache is None:
+            cache = format_caches[buffer_id] = FormatCache(FORMAT_STYLE)
+
+        regions = [
+            (region.begin(), self.view.substr(region), region.size() == self.view.size())
+            for region in selectionRegions
+        ]
+        pool = get_format_pool()
+        if pool is None or sum(len(text) for _, text, _ in regions) < pool.min_chars:
+            edits, whole_file = format_regions(cache, regions)
+            apply_format_edits(self.view, edit, cache, edits, whole_file)
+            return
+
+        view = self.view
+        change_count = view.change_count()
+        formatting_buffers.add(buffer_id)
+        sublime.status_message("Formatting in worker processes...")
+
+        def work():
+            try:
+                edits, whole_file = format_regions(cache, regions, pool)
+            finally:
+                formatting_buffers.discard(buffer_id)
+            sublime.set_timeout(lambda: view.run_command("sa_format_apply", {
+                "edits": edits, "change_count": change_count, "whole_file": whole_file,
+            }), 0)
+
+        threading.Thread(target=work, name="sa_format", daemon=True).start()
 
     def getSelectionRegions(self):
         expandedRegions = []
@@ -46,13 +164,21 @@ class SaFormat(sublime_plugin.TextCommand):
 
         return expandedRegions
 
-    def formatSql(self, raw, settings):
-        try:
-            result = sqlparse.format(raw, **settings)
-            return result
-        except Exception:
-            return None
-        
+
+class SaFormatApply(sublime_plugin.TextCommand):
+    """Apply the edits a background SaFormat run computed"""
+
+    def run(self, edit, edits, change_count, whole_file=False):
+        if self.view.change_count() != change_count:
+            sublime.status_message("Buffer changed while formatting, format again")
+            return
+        cache = format_caches.get(self.view.buffer_id())
+        if cache is None:
+            return
+        apply_format_edits(self.view, edit, cache, edits, whole_file)
+        sublime.status_message("Formatted")
+
+
 class ExpandSelectionToSemicolon(sublime_plugin.TextCommand):
     def run(self, edit, mode, endstart=None):
         def replace_region(start, end, mode, endstart):
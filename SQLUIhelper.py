@@ -162,25 +162,6 @@ class SortTabsInOrder(sublime_plugin.TextCommand):
 
 
 
-class UploadCsvToTable(sublime_plugin.WindowCommand):
-    def run(self):
-        sublime.open_dialog(self.print_path)
-
-    def print_path(self, path):
-        self.path = path
-        input_panel = self.window.show_input_panel(
-            "Enter Table Name: ",
-            "",
-            self.on_done,
-            None,
-            None,
-        )
-
-    def on_done(self, user_input):
-        print(user_input,self.path)
-
-
-
 # class SetAsScratch(sublime_plugin.WindowCommand):
 #     def run(self):
 #         view = self.window.active_view()
@@ -0,0 +1,249 @@
+"""Benchmarks for the vendored sqlparse in lib/
+
+Run from the package folder, no Sublime Text needed:
+
+    python benchmarks/sqlparse_bench.py lexer [--lines 5000]
+    python benchmarks/sqlparse_bench.py format [--sizes 500,1000,2000,4000]
+    python benchmarks/sqlparse_bench.py tokens [--lines 5000]
+    python benchmarks/sqlparse_bench.py parallel [--lines 5000] [--processes 0]
+    python benchmarks/sqlparse_bench.py spans [--edits 20000] [--seed 0]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "lib"), ROOT]
+
+import sqlparse  # noqa: E402
+from sqlparse import lexer, sql  # noqa: E402
+from SQLAPI.sqlformat import (  # noqa: E402
+    FormatCache, FormatPool, StatementSpans, apply_edits, split_statements,
+)
+
+# The style SaFormat formats with
+FORMAT_STYLE = {
+    "keyword_case": "upper",
+    "identifier_case": None,
+    "strip_comments": False,
+    "indent_tabs": False,
+    "indent_width": 4,
+    "reindent": True,
+}
+
+# Generated statements that grow with one list, the shapes reindenting used
+# to be quadratic on: every element of the list is put on its own line
+PATHOLOGICAL = {
+    "in_list": lambda n: "select id, name from db.schema.orders where id in ({});".format(
+        ", ".join(str(i) for i in range(n))
+    ),
+    "values": lambda n: "insert into db.schema.orders (id, name, amount) values {};".format(
+        ", ".join(f"({i}, 'name {i}', {i}.25)" for i in range(n))
+    ),
+    "select_list": lambda n: "select {} from db.schema.wide_table;".format(
+        ", ".join(f"a.col_{i}" for i in range(n))
+    ),
+}
+
+# Pieces random edits insert into a buffer: statements, the characters that
+# open or close a quote, comment, bracket or dollar quote, and bodies split
+# by semicolons
+EDIT_PIECES = [
+    "select 1;", "select 'a;b' from t;\n", "\n", " ", ";", "'", '"', "`", "[", "]", "/*", "*/", "*",
+    "/", "-- x;\n", "$$", "$body$", "$", "body", "x", "create procedure p() as $$\n select 2;\n select 3;\n",
+]
+
+
+def migration_script(lines):
+    """Generated migration script of roughly ``lines`` lines mixing DDL, DML and comments"""
+    block = [
+        "-- step {n}: widen the order table",
+        "CREATE TABLE db.schema.orders_{n} (id BIGINT NOT NULL, amount DECIMAL(18, 2), created DATETIME2, note NVARCHAR(200));",
+        "INSERT INTO db.schema.orders_{n} (id, amount, created, note) VALUES (1, 10.5, '2024-01-01', 'it''s'), (2, -3.25E-2, NULL, \"q\");",
+        "UPDATE db.schema.orders_{n} SET amount = amount * 1.1 WHERE created >= '2024-01-01' AND note NOT LIKE '%x%';",
+        "SELECT a.id, COUNT(*) AS cnt, SUM(b.qty) FROM db.schema.orders_{n} a",
+        "    LEFT OUTER JOIN db.schema.items b ON a.id = b.order_id /* keep nulls */",
+        "    GROUP BY a.id ORDER BY cnt DESC NULLS LAST;",
+        "ALTER TABLE db.schema.orders_{n} ADD CONSTRAINT pk_{n} PRIMARY KEY (id);",
+    ]
+    out = []
+    n = 0
+    while len(out) < lines:
+        out.extend(line.format(n=n) for line in block)
+        n += 1
+    return "\n".join(out[:lines]) + "\n"
+
+
+def _best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_lexer(args):
+    """Master regex lexer against the rule-by-rule lexer on a generated script"""
+    text = migration_script(args.lines)
+    timings = {}
+    outputs = {}
+    for mode in (False, True):
+        lexer.Lexer.master_regex = mode
+        timings[mode], outputs[mode] = _best_of(args.repeat, lambda: list(lexer.tokenize(text)))
+    lexer.Lexer.master_regex = True
+
+    if outputs[True] != outputs[False]:
+        raise SystemExit("Token streams differ between the two lexer modes")
+    print(f"{args.lines} lines, {len(text)} chars, {len(outputs[True])} tokens, identical output")
+    print(f"  rule by rule   {timings[False]:.3f}s")
+    print(f"  master regex   {timings[True]:.3f}s  ({timings[False] / timings[True]:.1f}x)")
+
+
+def bench_format(args):
+    """Format time of pathological generated statements as their lists double"""
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(f"{'shape':<12}{'elements':>10}{'seconds':>10}{'us/element':>12}{'growth':>8}")
+    for shape, generate in PATHOLOGICAL.items():
+        previous = None
+        for size in sizes:
+            text = generate(size)
+            elapsed, _ = _best_of(args.repeat, lambda: sqlparse.format(text, **FORMAT_STYLE))
+            growth = f"{elapsed / previous:.1f}x" if previous else ""
+            print(f"{shape:<12}{size:>10}{elapsed:>10.3f}{elapsed / size * 1e6:>12.1f}{growth:>8}")
+            previous = elapsed
+    print("Linear formatting roughly doubles the time as the element count doubles")
+
+
+def bench_tokens(args):
+    """Memory held by the parsed token tree of a generated script, and parse/format throughput"""
+    text = migration_script(args.lines)
+
+    gc.collect()
+    tracemalloc.start()
+    statements = sqlparse.parse(text)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    counts = {}
+    stack = list(statements)
+    while stack:
+        token = stack.pop()
+        kind = "groups" if token.is_group else "leaves"
+        counts[kind] = counts.get(kind, 0) + 1
+        if token.is_group:
+            stack.extend(token.tokens)
+    del statements
+
+    stream = list(lexer.tokenize(text))
+    build_time, _ = _best_of(args.repeat, lambda: [sql.Token(ttype, value) for ttype, value in stream])
+    parse_time, _ = _best_of(args.repeat, lambda: sqlparse.parse(text))
+    format_time, _ = _best_of(args.repeat, lambda: sqlparse.format(text, **FORMAT_STYLE))
+    print(f"{args.lines} lines, {len(text)} chars, {counts['leaves']} leaf and {counts['groups']} group tokens")
+    print(f"  parse tree    {retained / 2 ** 20:.1f} MiB retained, {peak / 2 ** 20:.1f} MiB peak"
+          f" ({retained / (counts['leaves'] + counts['groups']):.0f} bytes per token)")
+    print(f"  build leaves  {build_time:.3f}s  ({len(stream) / build_time / 1e6:.2f}M tokens/s)")
+    print(f"  parse         {parse_time:.3f}s  ({len(text) / parse_time / 2 ** 20:.2f} MiB/s)")
+    print(f"  format        {format_time:.3f}s  ({len(text) / format_time / 2 ** 20:.2f} MiB/s)")
+
+
+def bench_parallel(args):
+    """SaFormat of a generated script in-process against a worker process pool"""
+    text = migration_script(args.lines)
+    spans = list(split_statements(text))
+
+    def run(pool):
+        # a fresh cache, so every statement is formatted
+        return apply_edits(text, FormatCache(FORMAT_STYLE).edits(text, spans, pool=pool))
+
+    pool = FormatPool(processes=args.processes, min_chars=0)
+    start = time.perf_counter()
+    pool.format(["select 1"], FORMAT_STYLE)
+    startup = time.perf_counter() - start
+    try:
+        serial, expected = _best_of(args.repeat, lambda: run(None))
+        parallel, result = _best_of(args.repeat, lambda: run(pool))
+    finally:
+        pool.close()
+    if pool.broken or result != expected:
+        raise SystemExit("The worker pool failed or formatted differently")
+    print(f"{args.lines} lines, {len(text)} chars, {len(spans)} statements, identical output")
+    print(f"  in-process     {serial:.3f}s")
+    print(f"  {pool.processes} workers      {parallel:.3f}s  ({serial / parallel:.1f}x),"
+          f" {startup:.3f}s to start them")
+
+
+def bench_spans(args):
+    """Incremental StatementSpans against a full split_statements over random edits"""
+    # closing a dollar-quoted procedure body joins the statements it held
+    spans = StatementSpans()
+    text = "create procedure p() as $$\n select 2;\n select 3;\n select 4;\n select 5;"
+    spans.update(text)
+    text += "\n$$;"
+    if spans.update(text) != list(split_statements(text)):
+        raise SystemExit("Spans differ once a $$ body is closed")
+    # and so does editing the tag of its closing $tag$ to match
+    spans = StatementSpans()
+    text = "create function f() as $body$\n select 1;\n select 2;\n$boxy$;"
+    spans.update(text)
+    text = text.replace("$boxy$", "$body$")
+    if spans.update(text) != list(split_statements(text)):
+        raise SystemExit("Spans differ once a $tag$ is edited to close a body")
+
+    rng = random.Random(args.seed)
+    spans = StatementSpans()
+    text = ""
+    start = time.perf_counter()
+    for n in range(args.edits):
+        if len(text) > 2000:
+            text = ""
+        begin = rng.randrange(len(text) + 1)
+        end = min(len(text), begin + rng.choice((0, 0, 1, 2, 8)))
+        text = text[:begin] + rng.choice(EDIT_PIECES) * rng.choice((0, 1, 1, 2)) + text[end:]
+        if spans.update(text) != list(split_statements(text)):
+            raise SystemExit(f"Spans differ after edit {n}: {text!r}")
+    elapsed = time.perf_counter() - start
+    print(f"{args.edits} random edits, spans identical to a full split ({elapsed:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("lexer", help=bench_lexer.__doc__)
+    p.add_argument("--lines", type=int, default=5000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_lexer)
+
+    p = sub.add_parser("format", help=bench_format.__doc__)
+    p.add_argument("--sizes", default="500,1000,2000,4000")
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_format)
+
+    p = sub.add_parser("tokens", help=bench_tokens.__doc__)
+    p.add_argument("--lines", type=int, default=5000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_tokens)
+
+    p = sub.add_parser("parallel", help=bench_parallel.__doc__)
+    p.add_argument("--lines", type=int, default=5000)
+    p.add_argument("--processes", type=int, default=0)
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_parallel)
+
+    p = sub.add_parser("spans", help=bench_spans.__doc__)
+    p.add_argument("--edits", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_spans)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
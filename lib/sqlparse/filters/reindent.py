@@ -5,9 +5,23 @@
 # This module is part of python-sqlparse and is released under
 # the BSD License: https://opensource.org/licenses/BSD-3-Clause
 
+import re
+
 from sqlparse import sql, tokens as T
 from sqlparse.utils import offset, indent
 
+# Characters str.splitlines() breaks on
+_LINE_BREAK = re.compile('[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+
+
+def _reversed_leaves(token):
+    """Yields the leaves of token, last one first."""
+    if token.is_group:
+        for child in reversed(token.tokens):
+            yield from _reversed_leaves(child)
+    else:
+        yield token
+
 
 class ReindentFilter:
     def __init__(self, width=2, char=' ', wrap_after=0, n='\n',
@@ -35,13 +49,59 @@ class ReindentFilter:
                 break
             yield t
 
+    def _leaves_before(self, token, idx=None):
+        """Yields the tokens _flatten_up_to_token yields, last one first.
+
+        Walks up the parents of token instead of flattening the statement
+        from its start, so only the leaves actually consumed are visited.
+        *idx* is the index of token in its parent when the caller knows it.
+        Returns None when token is not linked to the current statement.
+        """
+        path = []
+        node = token
+        while node is not self._curr_stmt:
+            parent = node.parent
+            if parent is None:
+                return None
+            if idx is None:
+                idx = parent.tokens.index(node)
+            path.append((parent, idx))
+            node, idx = parent, None
+
+        def leaves():
+            for parent, idx in path:
+                for i in range(idx - 1, -1, -1):
+                    yield from _reversed_leaves(parent.tokens[i])
+        return leaves()
+
     @property
     def leading_ws(self):
         return self.offset + self.indent * self.width
 
-    def _get_offset(self, token):
-        raw = ''.join(map(str, self._flatten_up_to_token(token)))
-        line = (raw or '\n').splitlines()[-1]
+    def _current_line(self, token, idx=None):
+        """Last line of the statement text before token, as splitlines gives it.
+
+        Leaves are read backwards until the text holds a complete last line,
+        which keeps the cost proportional to the line rather than to
+        everything before it (a VALUES row or IN-list item asks this for
+        every element).
+        """
+        leaves = self._leaves_before(token, idx)
+        if leaves is None:
+            raw = ''.join(map(str, self._flatten_up_to_token(token)))
+            return (raw or '\n').splitlines()[-1]
+        chunks = []
+        for leaf in leaves:
+            value = str(leaf)
+            chunks.append(value)
+            if _LINE_BREAK.search(value):
+                lines = ''.join(reversed(chunks)).splitlines()
+                if len(lines) > 1:
+                    return lines[-1]
+        return (''.join(reversed(chunks)) or '\n').splitlines()[-1]
+
+    def _get_offset(self, token, idx=None):
+        line = self._current_line(token, idx)
         # Now take current offset into account and return relative offset.
         return len(line) - len(self.char * self.leading_ws)
 
@@ -137,35 +197,38 @@ class ReindentFilter:
         if not tlist.within(sql.Function) and not tlist.within(sql.Values):
             with offset(self, num_offset):
                 position = 0
+                # Identifiers come in list order, so each index is searched
+                # from the previous one instead of from the start of tlist
+                tidx = 0
                 for token in identifiers:
                     # Add 1 for the "," separator
                     position += len(token.value) + 1
                     if position > (self.wrap_after - self.offset):
                         adjust = 0
+                        tidx = tlist.token_index(token, tidx)
                         if self.comma_first:
                             adjust = -2
-                            _, comma = tlist.token_prev(
-                                tlist.token_index(token))
+                            cidx, comma = tlist.token_prev(tidx)
                             if comma is None:
                                 continue
-                            token = comma
-                        tlist.insert_before(token, self.nl(offset=adjust))
+                            tidx, token = cidx, comma
+                        tlist.insert_before(tidx, self.nl(offset=adjust))
+                        tidx += 1
                         if self.comma_first:
-                            _, ws = tlist.token_next(
-                                tlist.token_index(token), skip_ws=False)
+                            _, ws = tlist.token_next(tidx, skip_ws=False)
                             if (ws is not None
                                     and ws.ttype is not T.Text.Whitespace):
                                 tlist.insert_after(
-                                    token, sql.Token(T.Whitespace, ' '))
+                                    tidx, sql.Token(T.Whitespace, ' '))
                         position = 0
         else:
-            # ensure whitespace
-            for token in tlist:
-                _, next_ws = tlist.token_next(
-                    tlist.token_index(token), skip_ws=False)
+            # ensure whitespace, insertions land after the current token so
+            # the enumerate index keeps following the list
+            for tidx, token in enumerate(tlist):
+                _, next_ws = tlist.token_next(tidx, skip_ws=False)
                 if token.value == ',' and not next_ws.is_whitespace:
                     tlist.insert_after(
-                        token, sql.Token(T.Whitespace, ' '))
+                        tidx, sql.Token(T.Whitespace, ' '))
 
             end_at = self.offset + sum(len(i.value) + 1 for i in identifiers)
             adjusted_offset = 0
@@ -218,10 +281,10 @@ class ReindentFilter:
                 if self.comma_first:
                     adjust = -2
                     offset = self._get_offset(first_token) + adjust
-                    tlist.insert_before(ptoken, self.nl(offset))
+                    tlist.insert_before(ptidx, self.nl(offset))
                 else:
-                    tlist.insert_after(ptoken,
-                                       self.nl(self._get_offset(token)))
+                    tlist.insert_after(ptidx,
+                                       self.nl(self._get_offset(token, tidx)))
             tidx, token = tlist.token_next_by(i=sql.Parenthesis, idx=tidx)
 
     def _process_default(self, tlist, stmts=True):
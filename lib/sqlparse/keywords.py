@@ -6,6 +6,8 @@
 # the BSD License: https://opensource.org/licenses/BSD-3-Clause
 
 import re
+import sre_constants
+import sre_parse
 
 from sqlparse import tokens
 
@@ -106,6 +108,135 @@ SQL_REGEX = {
     ]}
 
 FLAGS = re.IGNORECASE | re.UNICODE
+
+
+def _shift_backrefs(rx, offset):
+    """Renumber the backreferences of ``rx`` by ``offset`` groups."""
+    out = []
+    i = 0
+    while i < len(rx):
+        char = rx[i]
+        if char == '\\' and i + 1 < len(rx):
+            j = i + 1
+            while j < len(rx) and rx[j].isdigit():
+                j += 1
+            if j > i + 1:
+                out.append('(?:\\{})'.format(int(rx[i + 1:j]) + offset))
+            else:
+                out.append(rx[i:i + 2])
+                j = i + 2
+            i = j
+        else:
+            out.append(char)
+            i += 1
+    return ''.join(out)
+
+
+def _first_chars(items):
+    """Characters a parsed pattern can start with, None if any may.
+
+    Returns (chars, nullable), nullable when the items can match without
+    consuming a character.
+    """
+    chars = set()
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            first, nullable = {chr(av)}, False
+        elif op is sre_constants.IN:
+            first, nullable = set(), False
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL:
+                    first.add(chr(item_av))
+                elif item_op is sre_constants.RANGE:
+                    first.update(chr(c) for c in range(item_av[0], item_av[1] + 1))
+                else:
+                    return None, False
+        elif op in (sre_constants.AT, sre_constants.ASSERT,
+                    sre_constants.ASSERT_NOT):
+            first, nullable = set(), True
+        elif op is sre_constants.SUBPATTERN:
+            first, nullable = _first_chars(av[-1])
+        elif op is sre_constants.BRANCH:
+            first, nullable = set(), False
+            for branch in av[1]:
+                branch_first, branch_nullable = _first_chars(branch)
+                if branch_first is None:
+                    return None, False
+                first |= branch_first
+                nullable = nullable or branch_nullable
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            first, nullable = _first_chars(av[2])
+            nullable = nullable or av[0] == 0
+        else:
+            return None, False
+        if first is None:
+            return None, False
+        chars |= first
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def _start_matcher(rx):
+    """Match function telling if a character can start a match of ``rx``.
+
+    None when any character can. The check is a character class compiled
+    with the same flags, so case folding is the one the rule itself uses.
+    """
+    chars, nullable = _first_chars(sre_parse.parse(rx, FLAGS))
+    if chars is None or nullable:
+        return None
+    return re.compile(
+        '[{}]'.format(''.join(re.escape(c) for c in sorted(chars))), FLAGS
+    ).match
+
+
+def _master_regex(indices):
+    """Compile the root rules at ``indices`` into one alternation.
+
+    Every rule becomes the named group ``r<index>``, so ``lastgroup`` of a
+    match names the rule, see MASTER_ACTIONS. Alternatives are tried in rule
+    order like the rule list itself, the first rule that matches wins.
+    """
+    parts = []
+    groups = 0
+    for idx in indices:
+        rx = _ROOT_RULES[idx][0]
+        parts.append('(?P<r{}>{})'.format(idx, _shift_backrefs(rx, groups + 1)))
+        groups += 1 + re.compile(rx, FLAGS).groups
+    return re.compile('|'.join(parts), FLAGS).match
+
+
+_ROOT_RULES = SQL_REGEX['root']
+MASTER_ACTIONS = {
+    'r{}'.format(idx): (isinstance(tt, tokens._TokenType), tt)
+    for idx, (_, tt) in enumerate(_ROOT_RULES)
+}
+_START_MATCHERS = [_start_matcher(rx) for rx, _ in _ROOT_RULES]
+_MASTER_BY_RULES = {}
+MASTER_BY_CHAR = {}
+
+
+def master_regex_for(char):
+    """Master regex match function for a position starting with ``char``.
+
+    Only the rules that can start with ``char`` are part of it, so each
+    position tries a handful of alternatives instead of every rule. Built
+    on first use, characters with the same candidate rules share one.
+    """
+    match = MASTER_BY_CHAR.get(char)
+    if match is None:
+        indices = tuple(
+            idx for idx, starts in enumerate(_START_MATCHERS)
+            if starts is None or starts(char)
+        )
+        match = _MASTER_BY_RULES.get(indices)
+        if match is None:
+            match = _MASTER_BY_RULES[indices] = _master_regex(indices)
+        MASTER_BY_CHAR[char] = match
+    return match
+
+
 SQL_REGEX = [(re.compile(rx, FLAGS).match, tt) for rx, tt in SQL_REGEX['root']]
 
 KEYWORDS = {
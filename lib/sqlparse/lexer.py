@@ -13,19 +13,28 @@
 # and to allow some customizations.
 
 from io import TextIOBase
+from itertools import islice
 
 from sqlparse import tokens
-from sqlparse.keywords import SQL_REGEX
+from sqlparse.keywords import (
+    MASTER_ACTIONS, MASTER_BY_CHAR, SQL_REGEX, master_regex_for)
 from sqlparse.utils import consume
 
 
 class Lexer:
     """Lexer
     Empty class. Leaving for backwards-compatibility
+
+    ``master_regex`` selects the scanning mode. When set, the rules that can
+    start with the current character run as one compiled alternation and the
+    matching rule is read from the match, otherwise every rule is tried in
+    turn at each position. Both give the same tokens.
     """
 
+    master_regex = True
+
     @staticmethod
-    def get_tokens(text, encoding=None):
+    def get_tokens(text, encoding=None, start=0):
         """
         Return an iterable of (tokentype, value) pairs generated from
         `text`. If `unfiltered` is set to `True`, the filtering mechanism
@@ -37,6 +46,9 @@ class Lexer:
         Split ``text`` into (tokentype, text) pairs.
 
         ``stack`` is the initial stack (default: ``['root']``)
+
+        Scanning begins at offset ``start`` of `text`, the rules that look
+        behind a position still see the text before it.
         """
         if isinstance(text, TextIOBase):
             text = text.read()
@@ -55,28 +67,54 @@ class Lexer:
             raise TypeError("Expected text or file-like object, got {!r}".
                             format(type(text)))
 
-        iterable = enumerate(text)
-        for pos, char in iterable:
-            for rexmatch, action in SQL_REGEX:
-                m = rexmatch(text, pos)
+        if Lexer.master_regex:
+            return _master_tokens(text, start)
+        return _sequential_tokens(text, start)
+
+
+def _master_tokens(text, start=0):
+    error = tokens.Error
+    cached = MASTER_BY_CHAR.get
+    pos = start
+    end = len(text)
+    while pos < end:
+        char = text[pos]
+        m = (cached(char) or master_regex_for(char))(text, pos)
+        if m is None:
+            yield error, char
+            pos += 1
+            continue
+        is_ttype, action = MASTER_ACTIONS[m.lastgroup]
+        if is_ttype:
+            yield action, m.group()
+        else:
+            yield action(m.group())
+        pos = m.end()
+
 
-                if not m:
-                    continue
-                elif isinstance(action, tokens._TokenType):
-                    yield action, m.group()
-                elif callable(action):
-                    yield action(m.group())
+def _sequential_tokens(text, start=0):
+    iterable = enumerate(islice(text, start, None), start)
+    for pos, char in iterable:
+        for rexmatch, action in SQL_REGEX:
+            m = rexmatch(text, pos)
 
-                consume(iterable, m.end() - pos - 1)
-                break
-            else:
-                yield tokens.Error, char
+            if not m:
+                continue
+            elif isinstance(action, tokens._TokenType):
+                yield action, m.group()
+            elif callable(action):
+                yield action(m.group())
+
+            consume(iterable, m.end() - pos - 1)
+            break
+        else:
+            yield tokens.Error, char
 
 
-def tokenize(sql, encoding=None):
+def tokenize(sql, encoding=None, start=0):
     """Tokenize sql.
 
     Tokenize *sql* using the :class:`Lexer` and return a 2-tuple stream
-    of ``(token type, value)`` items.
+    of ``(token type, value)`` items, from offset ``start`` on.
     """
-    return Lexer().get_tokens(sql, encoding)
+    return Lexer().get_tokens(sql, encoding, start)
@@ -13,9 +13,35 @@ from sqlparse import tokens as T
 from sqlparse.utils import imt, remove_quotes
 
 
+# Leaf tokens of these types repeat all over a script, their values (and
+# upper-cased keywords) are interned so equal tokens share one string
+_SHARED_TYPES = (T.Keyword, T.Whitespace, T.Punctuation, T.Operator)
+
+# Indentation runs are the only open-ended shared values, stop interning once
+# this many distinct values are held
+MAX_SHARED_VALUES = 4096
+
+# ttype -> (is_keyword, is_whitespace, shared), filled as types are met
+_type_flags = {}
+
+# value -> (value, value.upper()) for the leaf tokens of _SHARED_TYPES
+_shared_values = {}
+
+
+def _get_type_flags(ttype):
+    flags = _type_flags[ttype] = (
+        ttype in T.Keyword,
+        ttype in T.Whitespace,
+        any(ttype in shared for shared in _SHARED_TYPES),
+    )
+    return flags
+
+
 class NameAliasMixin:
     """Implements get_real_name and get_alias."""
 
+    __slots__ = ()
+
     def get_real_name(self):
         """Returns the real name (object name) of this identifier."""
         # a.b
@@ -42,20 +68,37 @@ class Token:
     It represents a single token and has two instance attributes:
     ``value`` is the unchanged value of the token and ``ttype`` is
     the type of the token.
+
+    Tokens are slotted and keep no per-instance dict. The flags derived
+    from ``ttype`` are computed once per type, and keywords, whitespace,
+    punctuation and operators share their value and normalized strings
+    with every equal token. The token objects themselves are never shared,
+    each one has its own ``parent`` and is looked up by identity.
     """
 
     __slots__ = ('value', 'ttype', 'parent', 'normalized', 'is_keyword',
-                 'is_group', 'is_whitespace')
+                 'is_whitespace')
+
+    is_group = False
 
     def __init__(self, ttype, value):
         value = str(value)
+        flags = _type_flags.get(ttype) or _get_type_flags(ttype)
+        is_keyword, self.is_whitespace, shared = flags
+        if shared:
+            interned = _shared_values.get(value)
+            if interned is None:
+                interned = (value, value.upper())
+                if len(_shared_values) < MAX_SHARED_VALUES:
+                    _shared_values[value] = interned
+            value, upper = interned
+            self.normalized = upper if is_keyword else value
+        else:
+            self.normalized = value.upper() if is_keyword else value
         self.value = value
         self.ttype = ttype
         self.parent = None
-        self.is_group = False
-        self.is_keyword = ttype in T.Keyword
-        self.is_whitespace = self.ttype in T.Whitespace
-        self.normalized = value.upper() if self.is_keyword else value
+        self.is_keyword = is_keyword
 
     def __str__(self):
         return self.value
@@ -155,11 +198,13 @@ class TokenList(Token):
 
     __slots__ = 'tokens'
 
+    is_group = True
+
     def __init__(self, tokens=None):
         self.tokens = tokens or []
-        [setattr(token, 'parent', self) for token in self.tokens]
+        for token in self.tokens:
+            token.parent = self
         super().__init__(None, str(self))
-        self.is_group = True
 
     def __str__(self):
         return ''.join(token.value for token in self.flatten())
@@ -302,7 +347,7 @@ class TokenList(Token):
     def token_index(self, token, start=0):
         """Return list index of token."""
         start = start if isinstance(start, int) else self.token_index(start)
-        return start + self.tokens[start:].index(token)
+        return self.tokens.index(token, start)
 
     def group_tokens(self, grp_cls, start, end, include_end=True,
                      extend=False):
@@ -322,7 +367,9 @@ class TokenList(Token):
             grp = start
             grp.tokens.extend(subtokens)
             del self.tokens[start_idx + 1:end_idx]
-            grp.value = str(start)
+            # Appending to the value keeps extending a long identifier
+            # list linear, str(start) would flatten it again every time
+            grp.value += ''.join(str(token) for token in subtokens)
         else:
             subtokens = self.tokens[start_idx:end_idx]
             grp = grp_cls(subtokens)
@@ -403,6 +450,8 @@ class TokenList(Token):
 class Statement(TokenList):
     """Represents a SQL statement."""
 
+    __slots__ = ()
+
     def get_type(self):
         """Returns the type of a statement.
 
@@ -445,6 +494,8 @@ class Identifier(NameAliasMixin, TokenList):
     Identifiers may have aliases or typecasts.
     """
 
+    __slots__ = ()
+
     def is_wildcard(self):
         """Return ``True`` if this identifier contains a wildcard."""
         _, token = self.token_next_by(t=T.Wildcard)
@@ -473,6 +524,8 @@ class Identifier(NameAliasMixin, TokenList):
 class IdentifierList(TokenList):
     """A list of :class:`~sqlparse.sql.Identifier`\'s."""
 
+    __slots__ = ()
+
     def get_identifiers(self):
         """Returns the identifiers.
 
@@ -485,6 +538,7 @@ class IdentifierList(TokenList):
 
 class TypedLiteral(TokenList):
     """A typed literal, such as "date '2001-09-28'" or "interval '2 hours'"."""
+    __slots__ = ()
     M_OPEN = [(T.Name.Builtin, None), (T.Keyword, "TIMESTAMP")]
     M_CLOSE = T.String.Single, None
     M_EXTEND = T.Keyword, ("DAY", "HOUR", "MINUTE", "MONTH", "SECOND", "YEAR")
@@ -492,6 +546,7 @@ class TypedLiteral(TokenList):
 
 class Parenthesis(TokenList):
     """Tokens between parenthesis."""
+    __slots__ = ()
     M_OPEN = T.Punctuation, '('
     M_CLOSE = T.Punctuation, ')'
 
@@ -502,6 +557,7 @@ class Parenthesis(TokenList):
 
 class SquareBrackets(TokenList):
     """Tokens between square brackets"""
+    __slots__ = ()
     M_OPEN = T.Punctuation, '['
     M_CLOSE = T.Punctuation, ']'
 
@@ -513,15 +569,19 @@ class SquareBrackets(TokenList):
 class Assignment(TokenList):
     """An assignment like 'var := val;'"""
 
+    __slots__ = ()
+
 
 class If(TokenList):
     """An 'if' clause with possible 'else if' or 'else' parts."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'IF'
     M_CLOSE = T.Keyword, 'END IF'
 
 
 class For(TokenList):
     """A 'FOR' loop."""
+    __slots__ = ()
     M_OPEN = T.Keyword, ('FOR', 'FOREACH')
     M_CLOSE = T.Keyword, 'END LOOP'
 
@@ -529,6 +589,8 @@ class For(TokenList):
 class Comparison(TokenList):
     """A comparison used for example in WHERE clauses."""
 
+    __slots__ = ()
+
     @property
     def left(self):
         return self.tokens[0]
@@ -541,12 +603,15 @@ class Comparison(TokenList):
 class Comment(TokenList):
     """A comment."""
 
+    __slots__ = ()
+
     def is_multiline(self):
         return self.tokens and self.tokens[0].ttype == T.Comment.Multiline
 
 
 class Where(TokenList):
     """A WHERE clause."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'WHERE'
     M_CLOSE = T.Keyword, (
         'ORDER BY', 'GROUP BY', 'LIMIT', 'UNION', 'UNION ALL', 'EXCEPT',
@@ -555,12 +620,14 @@ class Where(TokenList):
 
 class Having(TokenList):
     """A HAVING clause."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'HAVING'
     M_CLOSE = T.Keyword, ('ORDER BY', 'LIMIT')
 
 
 class Case(TokenList):
     """A CASE statement with one or more WHEN and possibly an ELSE part."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'CASE'
     M_CLOSE = T.Keyword, 'END'
 
@@ -615,6 +682,8 @@ class Case(TokenList):
 class Function(NameAliasMixin, TokenList):
     """A function or procedure call."""
 
+    __slots__ = ()
+
     def get_parameters(self):
         """Return a list of parameters."""
         parenthesis = self.tokens[-1]
@@ -628,6 +697,7 @@ class Function(NameAliasMixin, TokenList):
 
 class Begin(TokenList):
     """A BEGIN/END block."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'BEGIN'
     M_CLOSE = T.Keyword, 'END'
 
@@ -635,10 +705,16 @@ class Begin(TokenList):
 class Operation(TokenList):
     """Grouping of operations"""
 
+    __slots__ = ()
+
 
 class Values(TokenList):
     """Grouping of values"""
 
+    __slots__ = ()
+
 
 class Command(TokenList):
     """Grouping of CLI commands."""
+
+    __slots__ = ()